@@ -2,10 +2,12 @@
 import json
 from django.forms.models import modelform_factory
 from django.contrib import admin
+from django.core.urlresolvers import reverse
 from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from filer import settings as filer_settings
-from filer.models import Clipboard, ClipboardItem
+from filer.models import Clipboard, ClipboardItem, Job
 from filer.utils.compatibility import DJANGO_1_4
 from filer.utils.files import handle_upload, UploadException
 from filer.utils.loader import load_object
@@ -43,6 +45,9 @@ class ClipboardAdmin(admin.ModelAdmin):
             url(r'^operations/upload/$',
                 self.ajax_upload,
                 name='filer-ajax_upload'),
+            url(r'^operations/job_status/(?P<job_id>\d+)/$',
+                self.admin_site.admin_view(self.job_status),
+                name='filer-job_status'),
         )
         url_patterns.extend(urls)
         return url_patterns
@@ -76,17 +81,35 @@ class ClipboardAdmin(admin.ModelAdmin):
                                   {'file': upload})
             if uploadform.is_valid():
                 file_obj = uploadform.save(commit=False)
+                # The upload has already been hashed and measured while it
+                # was received, don't read it again on save
+                upload.filer_ingest.apply(file_obj)
                 # Enforce the FILER_IS_PUBLIC_DEFAULT
                 file_obj.is_public = filer_settings.FILER_IS_PUBLIC_DEFAULT
                 file_obj.save()
                 clipboard_item = ClipboardItem(
                     clipboard=clipboard, file=file_obj)
                 clipboard_item.save()
-                json_response = {
-                    'thumbnail': file_obj.icons['32'],
-                    'alt_text': '',
-                    'label': str(file_obj),
-                }
+                if filer_settings.FILER_ASYNC_PROCESSING:
+                    # Leave the thumbnails to the worker, show a placeholder
+                    # until it is done.
+                    job = Job.objects.enqueue('filer.tasks.process_upload',
+                                              owner=request.user,
+                                              file_id=file_obj.pk)
+                    json_response = {
+                        'thumbnail': file_obj.static_icons['32'],
+                        'alt_text': '',
+                        'label': str(file_obj),
+                        'job_id': job.pk,
+                        'job_status_url': reverse('admin:filer-job_status',
+                                                  args=(job.pk,)),
+                    }
+                else:
+                    json_response = {
+                        'thumbnail': file_obj.icons['32'],
+                        'alt_text': '',
+                        'label': str(file_obj),
+                    }
                 return HttpResponse(json.dumps(json_response),
                                     **response_params)
             else:
@@ -99,6 +122,23 @@ class ClipboardAdmin(admin.ModelAdmin):
             return HttpResponse(json.dumps({'error': str(e)}),
                                 **response_params)
 
+    def job_status(self, request, job_id):
+        """
+        Returns the status of a background job (and its result once it is
+        done) as json. Only its owner and superusers may see it.
+        """
+        jobs = Job.objects.all()
+        if not request.user.is_superuser:
+            jobs = jobs.filter(owner=request.user)
+        job = get_object_or_404(jobs, pk=job_id)
+        json_response = {
+            'status': job.status,
+            'attempts': job.attempts,
+            'result': job.get_result(),
+        }
+        return HttpResponse(json.dumps(json_response),
+                            content_type='application/json')
+
     def get_model_perms(self, request):
         """
         It seems this is only used for the list view. NICE :-)
@@ -1,6 +1,8 @@
 #-*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import csv
 import itertools
+import json
 import os
 import re
 
@@ -14,7 +16,8 @@ from django.core.exceptions import PermissionDenied
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
 from django.db import router, models
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import (Http404, HttpResponseRedirect, HttpResponse,
+                         HttpResponseBadRequest)
 from django.shortcuts import render_to_response, get_object_or_404
 from django.template import RequestContext
 
@@ -37,14 +40,20 @@ from filer.admin.patched.admin_utils import get_deleted_objects
 from filer.admin.tools import (userperms_for_request,
                                check_folder_edit_permissions,
                                check_files_edit_permissions,
-                               check_files_read_permissions,
-                               check_folder_read_permissions)
+                               get_permission_offenders,
+                               ListingItems)
+from filer.admin.listing import (get_cursor, get_listing_page, order_files,
+                                 serialize_item, LISTING_FIELDS,
+                                 MAX_LISTING_LIMIT)
 from filer.models import (Folder, FolderRoot, UnfiledImages, File, tools,
-                          ImagesWithMissingData, FolderPermission, Image)
+                          ImagesWithMissingData, FolderPermission, Image,
+                          OwnerUsage)
+from filer.search import get_owner_search_fields, get_search_backend
 from filer.settings import FILER_STATICMEDIA_PREFIX, FILER_PAGINATE_BY
 from filer.thumbnail_processors import normalize_subject_location
-from filer.utils.compatibility import get_delete_permission
+from filer.utils.compatibility import csv_row, get_delete_permission
 from filer.utils.filer_easy_thumbnails import FilerActionThumbnailer
+from filer.utils.hashing import sha1_file
 from filer.views import (popup_status, popup_param, selectfolder_status,
                          selectfolder_param)
 
@@ -70,6 +79,7 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
                'copy_files_and_folders', 'resize_images', 'rename_files']
 
     directory_listing_template = 'admin/filer/folder/directory_listing.html'
+    usage_report_template = 'admin/filer/folder/usage_report.html'
     order_by_file_fields = ('_file_size', 'original_filename', 'name', 'owner',
                             'uploaded_at', 'modified_at')
 
@@ -203,6 +213,14 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
                 self.admin_site.admin_view(self.directory_listing),
                 name='filer-directory_listing'),
 
+            url(r'^(?P<folder_id>\d+)/list/json/$',
+                self.admin_site.admin_view(self.directory_listing_json),
+                name='filer-directory_listing-json'),
+
+            url(r'^usage/$',
+                self.admin_site.admin_view(self.usage_report),
+                name='filer-usage_report'),
+
             url(r'^(?P<folder_id>\d+)/make_folder/$',
                 self.admin_site.admin_view(views.make_folder),
                 name='filer-directory_listing-make_folder'),
@@ -271,46 +289,52 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
         if len(search_terms) > 0:
             if folder and limit_search_to_folder and not folder.is_root:
                 folder_qs = folder.get_descendants()
-                file_qs = File.objects.filter(
-                                        folder__in=folder.get_descendants())
+                file_qs = File.objects.in_subtree(folder)
             else:
                 folder_qs = Folder.objects.all()
                 file_qs = File.objects.all()
             folder_qs = self.filter_folder(folder_qs, search_terms)
             file_qs = self.filter_file(file_qs, search_terms)
+            # backends may only return the best matches
+            search_limit = get_search_backend().max_matches
+            if search_limit and folder_qs.count() < search_limit and \
+                    file_qs.count() < search_limit:
+                search_limit = None
 
             show_result_count = True
         else:
             folder_qs = folder.children.all()
             file_qs = folder.files.all()
             show_result_count = False
+            search_limit = None
 
-        folder_qs = folder_qs.order_by('name')
+        folder_qs = folder_qs.order_by('name', 'pk')
         order_by = request.GET.get('order_by', None)
         if order_by is not None:
             order_by = order_by.split(',')
             order_by = [field for field in order_by
                         if re.sub(r'^-', '', field) in self.order_by_file_fields]
-            if len(order_by) > 0:
-                file_qs = file_qs.order_by(*order_by)
+        if order_by and len(order_by) > 1:
+            file_qs = file_qs.order_by(*(order_by + ['pk']))
+        elif not order_by and 'search_rank' in file_qs.query.extra_select:
+            # the best matches first
+            folder_qs = folder_qs.order_by('-search_rank', 'name', 'pk')
+            file_qs = file_qs.order_by('-search_rank', 'pk')
+        else:
+            file_qs = order_files(file_qs, order_by[0] if order_by else 'label')
 
-        folder_children = []
-        folder_files = []
+        virtual_folders = []
         if folder.is_root:
-            folder_children += folder.virtual_folders
+            virtual_folders += folder.virtual_folders
 
-        perms = FolderPermission.objects.get_read_id_list(request.user)
-        root_exclude_kw = {'parent__isnull': False, 'parent__id__in': perms}
-        if perms != 'All':
-            file_qs = file_qs.filter(models.Q(folder__id__in=perms) | models.Q(owner=request.user))
-            folder_qs = folder_qs.filter(models.Q(id__in=perms) | models.Q(owner=request.user))
-        else:
-            root_exclude_kw.pop('parent__id__in')
+        folder_qs, file_qs = self.filter_readable(request, folder_qs, file_qs)
         if folder.is_root:
-            folder_qs = folder_qs.exclude(**root_exclude_kw)
+            perms = FolderPermission.objects.get_read_ranges(request.user)
+            if perms != 'All':
+                folder_qs = folder_qs.exclude(perms.q('parent__'))
+            else:
+                folder_qs = folder_qs.exclude(parent__isnull=False)
 
-        folder_children += folder_qs
-        folder_files += file_qs
 
         try:
             permissions = {
@@ -322,17 +346,17 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
         except:
             permissions = {}
 
-        if order_by is None or len(order_by) == 0:
-            folder_files.sort()
-        
-        items = folder_children + folder_files
-        items_permissions = [(item, {'change': self.has_change_permission(request, item)}) for item in items]
-        paginator = Paginator(items_permissions, FILER_PAGINATE_BY)
+        # the folders and files of the requested page only are fetched
+        items = ListingItems(request.user, virtual_folders, folder_qs, file_qs)
+        paginator = Paginator(items, FILER_PAGINATE_BY)
 
         # Are we moving to clipboard?
         if request.method == 'POST' and '_save' not in request.POST:
-            for f in folder_files:
-                if "move-to-clipboard-%d" % (f.id,) in request.POST:
+            for key in request.POST:
+                match = re.match(r'^move-to-clipboard-(\d+)$', key)
+                if match is None:
+                    continue
+                for f in file_qs.filter(pk=match.group(1)):
                     clipboard = tools.get_user_clipboard(request.user)
                     if f.has_edit_permission(request):
                         tools.move_file_to_clipboard([f], clipboard)
@@ -379,6 +403,19 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
             paginated_items = paginator.page(1)
         except EmptyPage:
             paginated_items = paginator.page(paginator.num_pages)
+
+        # the following items are loaded as the user scrolls, from the cursor
+        # of the last item of the first page
+        listing_json_url = next_cursor = None
+        if (settings.FILER_DIRECTORY_LISTING_INFINITE_SCROLL and
+                isinstance(folder, Folder) and not search_terms and
+                not popup_status(request) and len(order_by or ()) <= 1 and
+                paginated_items.number == 1 and paginated_items.has_next()):
+            listing_json_url = reverse('admin:filer-directory_listing-json',
+                                       kwargs={'folder_id': folder.pk})
+            if order_by:
+                listing_json_url += '?order_by=%s' % urlquote(order_by[0])
+            next_cursor = get_cursor(paginated_items.object_list[-1][0])
         return render_to_response(
             self.directory_listing_template,
             {
@@ -388,6 +425,8 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
                     ).distinct(),
                 'paginator': paginator,
                 'paginated_items': paginated_items,  # [(item, item_perms), ]
+                'listing_json_url': listing_json_url,
+                'next_cursor': next_cursor,
                 'permissions': permissions,
                 'permstest': userperms_for_request(folder, request),
                 'current_url': request.path,
@@ -395,6 +434,7 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
                 'search_string': ' '.join(search_terms),
                 'q': urlquote(q),
                 'show_result_count': show_result_count,
+                'search_limit': search_limit,
                 'limit_search_to_folder': limit_search_to_folder,
                 'is_popup': popup_status(request),
                 'select_folder': selectfolder_status(request),
@@ -413,23 +453,146 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
                         permissions.get("has_add_children_permission"),
         }, context_instance=RequestContext(request))
 
+    def filter_readable(self, request, folder_qs, file_qs):
+        """
+        Returns the folders and the files the user may see.
+        """
+        perms = FolderPermission.objects.get_read_ranges(request.user)
+        if perms != 'All':
+            file_qs = file_qs.filter(perms.q('folder__') | models.Q(owner=request.user))
+            folder_qs = folder_qs.filter(perms.q() | models.Q(owner=request.user))
+        return folder_qs, file_qs
+
+    def directory_listing_json(self, request, folder_id):
+        """
+        Returns a page of the content of a folder as json, for listings that
+        load more items as the user scrolls::
+
+            {"items": [{"id": 1, "type": "folder", ...}, ...],
+             "next": "<cursor of the next page or null>"}
+
+        The query parameters are all optional:
+
+        ``cursor``
+            the ``next`` cursor of the previous page
+        ``order_by``
+            the order of the files, ``label`` (by default) or one of
+            ``order_by_file_fields``, ``-`` prefixed for a descending order
+        ``limit``
+            the number of items per page, ``FILER_PAGINATE_BY`` by default
+        ``fields``
+            a comma separated subset of the ``LISTING_FIELDS``
+        ``thumbnail_size``
+            one of the ``FILER_ADMIN_ICON_SIZES``, ``48`` by default
+        """
+        folder = get_object_or_404(Folder, id=folder_id)
+        if not folder.has_read_permission(request):
+            raise PermissionDenied
+        order_by = request.GET.get('order_by') or 'label'
+        if order_by.lstrip('-') not in set(self.order_by_file_fields) | set(['label']):
+            return HttpResponseBadRequest('Invalid order_by %r' % order_by)
+        try:
+            limit = int(request.GET.get('limit') or FILER_PAGINATE_BY)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid limit')
+        limit = min(max(limit, 1), MAX_LISTING_LIMIT)
+        fields = request.GET.get('fields')
+        fields = fields.split(',') if fields else LISTING_FIELDS
+        if set(fields) - set(LISTING_FIELDS):
+            return HttpResponseBadRequest('Invalid fields %r' % request.GET['fields'])
+        thumbnail_size = request.GET.get('thumbnail_size') or '48'
+        if thumbnail_size not in settings.FILER_ADMIN_ICON_SIZES:
+            return HttpResponseBadRequest('Invalid thumbnail_size %r' % thumbnail_size)
+
+        folder_qs, file_qs = self.filter_readable(
+            request, folder.children.all(), folder.files.all())
+        if 'owner' in fields:
+            folder_qs = folder_qs.select_related('owner')
+            file_qs = file_qs.select_related('owner')
+        try:
+            items, next_cursor = get_listing_page(
+                folder_qs, file_qs, order_by=order_by,
+                cursor=request.GET.get('cursor'), limit=limit)
+        except ValueError:
+            return HttpResponseBadRequest('Invalid cursor')
+        if 'can_change' in fields:
+            perms = FolderPermission.objects.get_item_permissions(
+                request.user, items, ('edit',))
+        else:
+            perms = [{'edit': False}] * len(items)
+        data = {
+            'items': [serialize_item(item, fields, can_change=item_perms['edit'],
+                                     thumbnail_size=thumbnail_size)
+                      for item, item_perms in zip(items, perms)],
+            'next': next_cursor,
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+    def usage_report(self, request):
+        """
+        Shows the storage used by the files of a folder (``?folder=<id>``)
+        and its subfolders, or of all the files, per subfolder and per owner.
+        ``?format=csv&by=owner`` (or ``by=folder``) exports it as CSV,
+        ``?live=1`` computes it from the files rather than reading the stored
+        totals.
+        """
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        folder_id = request.GET.get('folder')
+        if folder_id:
+            if not folder_id.isdigit():
+                raise Http404
+            folder = get_object_or_404(Folder, pk=folder_id)
+        else:
+            folder = None
+        if request.method == 'POST' and 'refresh' in request.POST:
+            OwnerUsage.objects.refresh()
+            return HttpResponseRedirect(request.get_full_path())
+        live = request.GET.get('live') == '1'
+
+        if request.GET.get('format') == 'csv':
+            by = request.GET.get('by', 'owner')
+            if by == 'owner':
+                rows = [(row['owner'], row['owner_name'] or '', row['count'],
+                         row['total_size'])
+                        for row in OwnerUsage.objects.report(folder, live=live)[0]]
+            elif by == 'folder':
+                rows = [(row['folder'].pk, row['folder'].name, row['count'],
+                         row['total_size'])
+                        for row in Folder.objects.subfolder_usage(folder, live=live)]
+            else:
+                return HttpResponseBadRequest('Invalid by %r' % by)
+            response = HttpResponse(content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="usage-%s.csv"' % by
+            writer = csv.writer(response)
+            writer.writerow(csv_row([by, 'name', 'count', 'total_size']))
+            for row in rows:
+                writer.writerow(csv_row(row))
+            return response
+
+        owners, computed_at = OwnerUsage.objects.report(folder, live=live)
+        return render_to_response(
+            self.usage_report_template,
+            {
+                'instance': folder or FolderRoot(),
+                'folder': folder,
+                'breadcrumbs_action': _('Storage usage'),
+                'title': _('Storage usage'),
+                'usage': File.objects.usage(folder),
+                'folders': Folder.objects.subfolder_usage(folder, live=live),
+                'owners': owners,
+                'computed_at': computed_at,
+                'live': live,
+                'root_path': reverse('admin:index'),
+        }, context_instance=RequestContext(request))
+
     def filter_folder(self, qs, terms=[]):
-        for term in terms:
-            filters = models.Q(name__icontains=term)
-            for filter_ in self.get_owner_filter_lookups():
-                filters |= models.Q(**{filter_: term})
-            qs = qs.filter(filters)
-        return qs
+        return get_search_backend().filter(
+            qs, ' '.join(terms), owner_fields=self.owner_search_fields)
 
     def filter_file(self, qs, terms=[]):
-        for term in terms:
-            filters = (models.Q(name__icontains=term) |
-                       models.Q(description__icontains=term) |
-                       models.Q(original_filename__icontains=term))
-            for filter_ in self.get_owner_filter_lookups():
-                filters |= models.Q(**{filter_: term})
-            qs = qs.filter(filters)
-        return qs
+        return get_search_backend().filter(
+            qs, ' '.join(terms), owner_fields=self.owner_search_fields)
 
     @property
     def owner_search_fields(self):
@@ -438,22 +601,7 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
         User model.  For the built-in User model, that means username,
         first_name, last_name, and email.
         """
-        try:
-            from django.contrib.auth import get_user_model
-        except ImportError:  # Django < 1.5
-            from django.contrib.auth.models import User
-        else:
-            User = get_user_model()
-        return [
-            field.name for field in User._meta.fields
-            if isinstance(field, models.CharField) and field.name != 'password'
-        ]
-
-    def get_owner_filter_lookups(self):
-        return [
-            'owner__{field}__icontains'.format(field=field)
-            for field in self.owner_search_fields
-        ]
+        return get_owner_search_fields()
 
     def response_action(self, request, files_queryset, folders_queryset):
         """
@@ -748,22 +896,19 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
                                 force_text(obj))
 
     def _check_copy_perms(self, request, files_queryset, folders_queryset):
-        try:
-            check_files_read_permissions(request, files_queryset)
-            check_folder_read_permissions(request, folders_queryset)
-        except PermissionDenied:
-            return True
-        return False
+        """
+        Returns the selected files and folders (or their content) the user
+        may not copy.
+        """
+        return get_permission_offenders(request, files_queryset, folders_queryset, ('read',))
 
     def _check_move_perms(self, request, files_queryset, folders_queryset):
-        try:
-            check_files_read_permissions(request, files_queryset)
-            check_folder_read_permissions(request, folders_queryset)
-            check_files_edit_permissions(request, files_queryset)
-            check_folder_edit_permissions(request, folders_queryset)
-        except PermissionDenied:
-            return True
-        return False
+        """
+        Returns the selected files and folders (or their content) the user
+        may not move.
+        """
+        return get_permission_offenders(request, files_queryset, folders_queryset,
+                                        ('read', 'edit'))
 
     def _get_current_action_folder(self, request, files_queryset, folders_queryset):
         if files_queryset:
@@ -969,10 +1114,13 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
         # Due to how inheritance works, we have to set both pk and id to None
         file_obj.pk = None
         file_obj.id = None
+        # The copy has the same content, no need to hash and measure it again
+        file_obj._file_data_changed_hint = False
         file_obj.save()
         file_obj.folder = destination
         file_obj.file = file_obj._copy_file(filename)
         file_obj.original_filename = self._generate_new_filename(file_obj.original_filename, suffix)
+        file_obj._file_data_changed_hint = False
         file_obj.save()
 
     def _copy_files(self, files, destination, suffix, overwrite):
@@ -1085,13 +1233,14 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
     copy_files_and_folders.short_description = ugettext_lazy("Copy selected files and/or folders")
 
     def _check_resize_perms(self, request, files_queryset, folders_queryset):
-        try:
-            check_files_read_permissions(request, files_queryset)
-            check_folder_read_permissions(request, folders_queryset)
-            check_files_edit_permissions(request, files_queryset)
-        except PermissionDenied:
-            return True
-        return False
+        """
+        Returns the selected files and folders (or their content) the user
+        may not resize.
+        """
+        offenders = get_permission_offenders(request, files_queryset, folders_queryset, ('read',))
+        offenders.extend(f for f in get_permission_offenders(request, files_queryset, [], ('edit',))
+                         if f not in offenders)
+        return offenders
 
     def _list_folders_to_resize(self, request, folders):
         for fo in folders:
@@ -1114,16 +1263,26 @@ class FolderAdmin(PrimitivePermissionAwareModelAdmin):
         original_width = float(image.width)
         original_height = float(image.height)
         thumbnailer = FilerActionThumbnailer(file=image.file.file, name=image.file.name, source_storage=image.file.source_storage, thumbnail_storage=image.file.source_storage)
-        # This should overwrite the original image
-        new_image = thumbnailer.get_thumbnail({
+        thumbnail_options = {
             'size': (form_data['width'], form_data['height']),
             'crop': form_data['crop'],
             'upscale': form_data['upscale'],
             'subject_location': image.subject_location,
-        })
-        image.file.file = new_image.file
-        image.generate_sha1()
-        image.save()  # Also gets new width and height
+        }
+        if image.file.content_addressed:
+            # The stored file is shared by all the files with the same content,
+            # the resized image is stored under its own sha1 instead
+            new_image = thumbnailer.generate_thumbnail(thumbnail_options)
+            image.sha1 = sha1_file(new_image.file)
+            image.file.save(image.original_filename or image.file.name,
+                            new_image.file, save=False)
+        else:
+            # This should overwrite the original image
+            new_image = thumbnailer.get_thumbnail(thumbnail_options)
+            image.file.file = new_image.file
+            # The content changed but the name stayed the same
+            image._file_data_changed_hint = True
+        image.save()  # Also gets new sha1, width and height
 
         subject_location = normalize_subject_location(image.subject_location)
         if subject_location:
@@ -0,0 +1,186 @@
+#-*- coding: utf-8 -*-
+"""
+Keyset ("cursor") pagination of the content of a folder, used by the json
+directory listing.
+
+The folders come first (by name), then the files, ordered by a sort key and
+their primary key. A page continues right after the last item of the
+previous page (``WHERE key > last_key OR (key = last_key AND pk > last_pk)``)
+instead of skipping the rows of all the previous pages with an ``OFFSET``,
+so that the last page of a huge folder is as fast as the first one.
+"""
+import base64
+import datetime
+import json
+
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from filer import settings as filer_settings
+from filer.models import File
+
+# The sort keys of the files. NULL values are replaced, so that the keys can
+# be compared.
+SORT_EXPRESSIONS = {
+    'label': "LOWER(COALESCE(NULLIF({name}, ''), {original_filename}, ''))",
+    'name': "{name}",
+    'original_filename': "COALESCE({original_filename}, '')",
+    '_file_size': "COALESCE({_file_size}, -1)",
+    'owner': "COALESCE({owner_id}, 0)",
+    'uploaded_at': "{uploaded_at}",
+    'modified_at': "{modified_at}",
+}
+
+
+def get_sort_expression(file_qs, field):
+    qn = connections[file_qs.db].ops.quote_name
+    table = qn(File._meta.db_table)
+    columns = dict((f.attname, '%s.%s' % (table, qn(f.column)))
+                   for f in File._meta.local_fields)
+    return SORT_EXPRESSIONS[field].format(**columns), columns['id']
+
+
+def order_files(file_qs, order_by='label'):
+    """
+    Orders the files by one of the ``SORT_EXPRESSIONS`` (``'-'`` prefixed
+    for a descending order) and their primary key, in the database. Each
+    file gets its key as ``sort_key``. The label is the name or else the
+    original filename, case insensitive, like ``File.__lt__`` compares them.
+    """
+    prefix = '-' if order_by.startswith('-') else ''
+    expression, pk_column = get_sort_expression(file_qs, order_by.lstrip('-'))
+    # extra() rather than expressions, polymorphic querysets do not support
+    # annotating nested expressions
+    return file_qs.extra(select={'sort_key': expression}).order_by(
+        prefix + 'sort_key', prefix + 'pk')
+
+
+def files_after(file_qs, order_by, key, pk):
+    """
+    Returns the files following the file with the sort key ``key`` and the
+    primary key ``pk`` in the order of ``order_files(file_qs, order_by)``.
+    """
+    expression, pk_column = get_sort_expression(file_qs, order_by.lstrip('-'))
+    op = '<' if order_by.startswith('-') else '>'
+    where = '(%s %s %%s OR (%s = %%s AND %s %s %%s))' % (
+        expression, op, expression, pk_column, op)
+    return file_qs.extra(where=[where], params=[key, key, pk])
+
+
+def encode_cursor(section, key, pk):
+    if isinstance(key, datetime.datetime):
+        key = {'datetime': key.isoformat()}
+    data = json.dumps([section, key, pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the ``(section, key, pk)`` of a cursor returned by
+    ``get_listing_page``, raises ``ValueError`` if it is invalid.
+    """
+    try:
+        section, key, pk = json.loads(
+            base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+        if isinstance(key, dict):
+            key = parse_datetime(key['datetime'])
+        pk = int(pk)
+    except (TypeError, ValueError, KeyError, UnicodeError):
+        raise ValueError('Invalid cursor %r' % cursor)
+    if section not in ('folders', 'files'):
+        raise ValueError('Invalid cursor %r' % cursor)
+    return section, key, pk
+
+
+def get_cursor(item):
+    """
+    Returns the cursor of the page following ``item``, a folder or a file of
+    a queryset ordered by ``order_files``.
+    """
+    if item.file_type == 'Folder':
+        return encode_cursor('folders', item.name, item.pk)
+    return encode_cursor('files', item.sort_key, item.pk)
+
+
+def get_listing_page(folder_qs, file_qs, order_by='label', cursor=None, limit=50):
+    """
+    Returns up to ``limit`` folders and files following ``cursor`` (from the
+    beginning if it is empty), and the cursor of the next page (``None`` for
+    the last page). This costs two queries at most, whichever the page.
+    """
+    section, key, pk = decode_cursor(cursor) if cursor else ('folders', None, None)
+    items = []
+    if section == 'folders':
+        folder_qs = folder_qs.order_by('name', 'pk')
+        if key is not None:
+            folder_qs = folder_qs.filter(Q(name__gt=key) | Q(name=key, pk__gt=pk))
+        # one more to know if there is a next page
+        items.extend(folder_qs[:limit + 1])
+    if len(items) <= limit:
+        file_qs = order_files(file_qs, order_by)
+        if section == 'files':
+            file_qs = files_after(file_qs, order_by, key, pk)
+        items.extend(file_qs[:limit + 1 - len(items)])
+    if len(items) > limit:
+        items = items[:limit]
+        return items, get_cursor(items[-1])
+    return items, None
+
+
+# The largest page of the json listing
+MAX_LISTING_LIMIT = 500
+
+# The fields of the items of the json listing, all of them by default
+LISTING_FIELDS = ('id', 'type', 'label', 'url', 'change_url', 'delete_url',
+                  'thumbnail', 'size', 'owner', 'modified_at', 'is_public',
+                  'can_change')
+
+
+def get_thumbnail_url(item, size):
+    """
+    Returns the url of the ``size`` admin icon of ``item``. For images, an
+    existing thumbnail is looked up rather than generated, unless the
+    thumbnails are not generated in the background.
+    """
+    get_options = getattr(item, 'get_icon_thumbnail_options', None)
+    if get_options is None:
+        return item.icons.get(size)
+    options = get_options()[size]
+    try:
+        thumbnail = item.file.get_existing_thumbnail(item.file.get_options(
+            dict(options, subject_location=item.subject_location)))
+    except Exception:
+        thumbnail = None
+    if thumbnail is not None:
+        return thumbnail.url
+    if not filer_settings.FILER_ASYNC_PROCESSING:
+        url = item._generate_thumbnails({size: options}).get(size)
+        if url:
+            return url
+    return item.static_icons.get(size)
+
+
+def serialize_item(item, fields, can_change=False, thumbnail_size='48'):
+    """
+    Returns the ``fields`` of a folder or a file of the listing as a dict.
+    """
+    is_folder = item.file_type == 'Folder'
+    values = {
+        'id': lambda: item.pk,
+        'type': lambda: item.file_type.lower(),
+        'label': lambda: item.name if is_folder else item.label,
+        'url': lambda: (item.get_admin_directory_listing_url_path()
+                        if is_folder else item.url),
+        'change_url': lambda: item.get_admin_url_path(),
+        'delete_url': lambda: (None if is_folder else
+                               reverse('admin:filer_file_delete', args=(item.pk,))),
+        'thumbnail': lambda: get_thumbnail_url(item, thumbnail_size),
+        'size': lambda: item.total_size if is_folder else item.size,
+        'owner': lambda: '%s' % item.owner if item.owner_id else None,
+        'modified_at': lambda: item.modified_at.isoformat() if item.modified_at else None,
+        'is_public': lambda: None if is_folder else item.is_public,
+        'can_change': lambda: can_change,
+    }
+    return dict((field, values[field]()) for field in fields)
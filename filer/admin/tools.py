@@ -1,33 +1,115 @@
 #-*- coding: utf-8 -*-
 from django.core.exceptions import PermissionDenied
+from django.db.models import Q
 
+from filer.models import File, Folder, FolderPermission
+from filer.models.foldermodels import FolderRanges
 
-def check_files_edit_permissions(request, files):
-    for f in files:
-        if not f.has_edit_permission(request):
+
+def check_permissions(request, items, permission_type):
+    """
+    Raises ``PermissionDenied`` unless the user has the permission on all
+    the ``items``, checked in one pass.
+    """
+    for permissions in FolderPermission.objects.get_item_permissions(
+            request.user, items, (permission_type,)):
+        if not permissions[permission_type]:
             raise PermissionDenied
 
 
+def get_permission_offenders(request, files, folders, permission_types):
+    """
+    Returns the folders and files the user lacks one of the
+    ``permission_types`` on, among the ``files``, the ``folders`` and
+    everything inside the ``folders``. The whole subtrees are checked with one
+    query for the folders and one for the files.
+    """
+    user = request.user
+    folders = list(folders)
+    if hasattr(files, 'values_list'):
+        file_ids = files.values_list('pk', flat=True)
+    else:
+        file_ids = [f.pk for f in files]
+    # the selected folders and their descendants, as ranges of the tree
+    subtree = FolderRanges([(f.tree_id, f.lft, f.rght) for f in folders])
+    folder_qs = Folder.objects.filter(subtree.q())
+    file_qs = File.objects.non_polymorphic().filter(
+        Q(pk__in=file_ids) | subtree.q('folder__'))
+    if not user.is_authenticated():
+        return list(folder_qs) + list(file_qs)
+    allowed_folders = Q()
+    allowed_files = Q()
+    for permission_type in permission_types:
+        ranges = getattr(FolderPermission.objects,
+                         'get_%s_ranges' % permission_type)(user)
+        if ranges == 'All':
+            continue
+        allowed_folders &= Q(owner=user) | ranges.q()
+        allowed_files &= Q(owner=user) | Q(folder__owner=user) | ranges.q('folder__')
+    if not allowed_folders and not allowed_files:
+        return []
+    offenders = list(folder_qs.exclude(allowed_folders)) if folders else []
+    return offenders + list(file_qs.exclude(allowed_files))
+
+
+def check_files_edit_permissions(request, files):
+    check_permissions(request, files, 'edit')
+
+
 def check_folder_edit_permissions(request, folders):
-    for f in folders:
-        if not f.has_edit_permission(request):
-            raise PermissionDenied
-        check_files_edit_permissions(request, f.files)
-        check_folder_edit_permissions(request, f.children.all())
+    if get_permission_offenders(request, [], folders, ('edit',)):
+        raise PermissionDenied
 
 
 def check_files_read_permissions(request, files):
-    for f in files:
-        if not f.has_read_permission(request):
-            raise PermissionDenied
+    check_permissions(request, files, 'read')
 
 
 def check_folder_read_permissions(request, folders):
-    for f in folders:
-        if not f.has_read_permission(request):
-            raise PermissionDenied
-        check_files_read_permissions(request, f.files)
-        check_folder_read_permissions(request, f.children.all())
+    if get_permission_offenders(request, [], folders, ('read',)):
+        raise PermissionDenied
+
+
+class ListingItems(object):
+    """
+    The items of a directory listing as a sequence for ``Paginator``: the
+    virtual folders, then the folders and then the files, in the order of
+    their querysets. Only the items of the requested slice are fetched from
+    the database (with one query for the folders and one for the files at
+    most), as ``(item, {'change': <edit permission>})`` tuples.
+    """
+    def __init__(self, user, virtual_folders, folder_qs, file_qs):
+        self.user = user
+        self.virtual_folders = list(virtual_folders)
+        self.folder_qs = folder_qs
+        self.file_qs = file_qs
+        self._counts = None
+
+    @property
+    def counts(self):
+        if self._counts is None:
+            self._counts = (len(self.virtual_folders), self.folder_qs.count(),
+                            self.file_qs.count())
+        return self._counts
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, step = index.indices(len(self))
+        items = []
+        offset = 0
+        for count, source in zip(self.counts, (
+                self.virtual_folders, self.folder_qs, self.file_qs)):
+            if start < offset + count and stop > offset:
+                items.extend(source[max(start - offset, 0):stop - offset])
+            offset += count
+        items = items[::step]
+        permissions = FolderPermission.objects.get_item_permissions(
+            self.user, items, ('edit',))
+        return [(item, {'change': p['edit']}) for item, p in zip(items, permissions)]
 
 
 def userperms_for_request(item, request):
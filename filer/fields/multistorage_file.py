@@ -1,8 +1,6 @@
 #-*- coding: utf-8 -*-
 import base64
-import hashlib
 import warnings
-from io import BytesIO
 
 from django.core.files.base import ContentFile
 from django.utils import six
@@ -11,7 +9,9 @@ from easy_thumbnails import (fields as easy_thumbnails_fields,
                              files as easy_thumbnails_files)
 
 from filer import settings as filer_settings
-from filer.utils.filer_easy_thumbnails import ThumbnailerNameMixin
+from filer.utils.filer_easy_thumbnails import (MultipleThumbnailsMixin,
+                                               ThumbnailerNameMixin)
+from filer.utils.hashing import sha1_file
 
 
 STORAGES = {
@@ -28,19 +28,22 @@ THUMBNAIL_OPTIONS = {
 }
 
 
-def generate_filename_multistorage(instance, filename):
+def get_upload_to_multistorage(instance):
     if instance.is_public:
-        upload_to = filer_settings.FILER_PUBLICMEDIA_UPLOAD_TO
+        return filer_settings.FILER_PUBLICMEDIA_UPLOAD_TO
     else:
-        upload_to = filer_settings.FILER_PRIVATEMEDIA_UPLOAD_TO
+        return filer_settings.FILER_PRIVATEMEDIA_UPLOAD_TO
+
 
+def generate_filename_multistorage(instance, filename):
+    upload_to = get_upload_to_multistorage(instance)
     if callable(upload_to):
         return upload_to(instance, filename)
     else:
         return upload_to
 
 
-class MultiStorageFieldFile(ThumbnailerNameMixin,
+class MultiStorageFieldFile(MultipleThumbnailsMixin, ThumbnailerNameMixin,
                             easy_thumbnails_files.ThumbnailerFieldFile):
     def __init__(self, instance, field, name):
         """
@@ -90,8 +93,29 @@ class MultiStorageFieldFile(ThumbnailerNameMixin,
         else:
             return self.thumbnail_options['private'].get('base_dir', '')
 
+    @property
+    def content_addressed(self):
+        """
+        True if files are stored under a path derived from their content
+        (see ``filer.utils.generate_filename.content_addressed``), meaning that
+        several ``File`` objects may share the same stored file.
+        """
+        upload_to = get_upload_to_multistorage(self.instance)
+        return getattr(upload_to, 'content_addressed', False)
+
     def save(self, name, content, save=True):
         content.seek(0) # Ensure we upload the whole file
+        if self.content_addressed:
+            stored_name = self.field.generate_filename(self.instance, name)
+            if self.storage.exists(stored_name):
+                # The same content has already been stored, share it instead
+                # of uploading it again.
+                self.name = stored_name
+                setattr(self.instance, self.field.name, self.name)
+                self._committed = True
+                if save:
+                    self.instance.save()
+                return
         super(MultiStorageFieldFile, self).save(name, content, save)
 
 
@@ -118,13 +142,13 @@ class MultiStorageFileField(easy_thumbnails_fields.ThumbnailerField):
         if not filer_settings.FILER_DUMP_PAYLOAD:
             return value
         try:
-            payload_file = BytesIO(self.storage.open(value).read())
-            sha = hashlib.sha1()
-            sha.update(payload_file.read())
-            if sha.hexdigest() != obj.sha1:
-                warnings.warn('The checksum for "%s" diverges. Check for file consistency!' % obj.original_filename)
-            payload_file.seek(0)
-            encoded_string = base64.b64encode(payload_file.read()).decode('utf-8')
+            payload_file = self.storage.open(value)
+            try:
+                if sha1_file(payload_file) != obj.sha1:
+                    warnings.warn('The checksum for "%s" diverges. Check for file consistency!' % obj.original_filename)
+                encoded_string = base64.b64encode(payload_file.read()).decode('utf-8')
+            finally:
+                payload_file.close()
             return value, encoded_string
         except IOError:
             warnings.warn('The payload for "%s" is missing. No such file on disk: %s!' % (obj.original_filename, self.storage.location))
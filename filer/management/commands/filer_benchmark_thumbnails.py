@@ -0,0 +1,144 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import math
+import time
+from io import BytesIO
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from filer.models.imagemodels import Image
+from filer.thumbnail_processors import scale_and_crop_with_subject_location
+
+try:
+    from PIL import Image as PILImage
+    from PIL import ImageChops, ImageStat
+except ImportError:
+    import Image as PILImage
+    import ImageChops
+    import ImageStat
+
+
+def psnr(image_a, image_b):
+    """
+    Returns the peak signal-to-noise ratio (in dB) between two images of the
+    same size, ``None`` if they are identical.
+    """
+    image_a, image_b = image_a.convert('RGB'), image_b.convert('RGB')
+    if image_a.size != image_b.size:
+        raise ValueError('The images have different sizes')
+    stat = ImageStat.Stat(ImageChops.difference(image_a, image_b))
+    # ImageStat.sum2 is the sum of the squared differences of each band
+    mse = sum(stat.sum2) / float(len(stat.sum2) * image_a.size[0] * image_a.size[1])
+    if not mse:
+        return None
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+class Command(BaseCommand):
+    """
+    Compare the speed and the output quality of the standard and the fast
+    (``FILER_THUMBNAIL_FAST_SCALING``) thumbnail scaling ::
+
+        manage.py filer_benchmark_thumbnails photo1.jpg photo2.jpg
+        manage.py filer_benchmark_thumbnails --limit=20 --size=48x48 --crop
+    """
+    args = '[image file ...]'
+    help = ('Benchmarks the standard against the fast thumbnail scaling for '
+            'the given files or the images in filer.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--size',
+            action='store',
+            dest='size',
+            default='48x48',
+            help='Thumbnail size, e.g. 48x48'),
+        make_option('--crop',
+            action='store_true',
+            dest='crop',
+            default=False,
+            help='Crop the thumbnails'),
+        make_option('--limit',
+            action='store',
+            type='int',
+            dest='limit',
+            default=10,
+            help='Number of filer images to use if no files are given'),
+        make_option('--repeat',
+            action='store',
+            type='int',
+            dest='repeat',
+            default=3,
+            help='Number of runs per image, the fastest one counts'),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            size = tuple(int(v) for v in options.get('size').split('x'))
+            if len(size) != 2:
+                raise ValueError
+        except ValueError:
+            raise CommandError('Invalid size %r, use e.g. 48x48' % options.get('size'))
+        sources = [(path, self.read_path(path)) for path in args]
+        if not sources:
+            images = Image.objects.non_polymorphic().order_by('pk')[:options.get('limit')]
+            sources = [(image.original_filename or image.file.name, self.read_image(image))
+                       for image in images]
+        if not sources:
+            raise CommandError('No images to benchmark')
+
+        total_standard, total_fast, values = 0.0, 0.0, []
+        for name, data in sources:
+            standard, standard_time = self.scale(data, size, options, fast=False)
+            fast, fast_time = self.scale(data, size, options, fast=True)
+            value = psnr(standard, fast)
+            total_standard += standard_time
+            total_fast += fast_time
+            if value is not None:
+                values.append(value)
+            self.stdout.write('%s: standard %.1f ms, fast %.1f ms (%.1fx), PSNR %s' % (
+                name, standard_time * 1000, fast_time * 1000,
+                standard_time / max(fast_time, 0.000001),
+                'identical' if value is None else '%.1f dB' % value))
+        self.stdout.write('Total: standard %.1f ms, fast %.1f ms (%.1fx), lowest PSNR %s' % (
+            total_standard * 1000, total_fast * 1000,
+            total_standard / max(total_fast, 0.000001),
+            '%.1f dB' % min(values) if values else 'identical'))
+
+    def read_path(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except IOError as e:
+            raise CommandError('Can not read %s: %s' % (path, e))
+
+    def read_image(self, image):
+        image.file.open()
+        try:
+            return image.file.read()
+        finally:
+            image.file.close()
+
+    def scale(self, data, size, options, fast):
+        """
+        Scales the image ``options['repeat']`` times and returns the
+        thumbnail and the shortest time it took.
+
+        The image is decoded before, like the ``pil_image`` source generator
+        of easy_thumbnails does, so that the fast scaling can not decode JPEGs
+        at a reduced scale (which it never can in the thumbnail pipeline).
+        """
+        best = None
+        for i in range(max(options.get('repeat'), 1)):
+            image = PILImage.open(BytesIO(data))
+            image.load()
+            started = time.time()
+            thumbnail = scale_and_crop_with_subject_location(
+                image, size, crop=options.get('crop'), fast=fast)
+            # make sure the pixels are actually computed
+            thumbnail.load()
+            elapsed = time.time() - started
+            if best is None or elapsed < best:
+                best = elapsed
+        return thumbnail, best
@@ -0,0 +1,80 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import csv
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError, NoArgsCommand
+from django.template.defaultfilters import filesizeformat
+
+from filer.models.filemodels import File
+from filer.utils.compatibility import csv_row
+
+
+class Command(NoArgsCommand):
+    """
+    Report files with identical content (same sha1) ::
+
+        manage.py filer_duplicates
+        manage.py filer_duplicates --format=csv > duplicates.csv
+    """
+    help = 'Reports groups of files with identical content.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format',
+            action='store',
+            dest='format',
+            default='text',
+            help='Output format: text (default), json or csv'),
+        make_option('--batch-size',
+            action='store',
+            type='int',
+            dest='batch_size',
+            default=500,
+            help='Number of duplicate groups whose files are fetched at once'),
+        )
+
+    def handle_noargs(self, **options):
+        output_format = options.get('format')
+        writer = getattr(self, 'write_%s' % output_format, None)
+        if writer is None:
+            raise CommandError('Unknown format "%s"' % output_format)
+        groups = File.objects.iter_duplicate_groups(
+            batch_size=options.get('batch_size'))
+        writer(groups)
+
+    def write_text(self, groups):
+        group_count, wasted_size = 0, 0
+        for group in groups:
+            group_count += 1
+            wasted_size += group['wasted_size']
+            self.stdout.write('%s: %d files, %s wasted, owners: %s' % (
+                group['sha1'], group['count'],
+                filesizeformat(group['wasted_size']),
+                ', '.join(group['owners']) or '-'))
+            for f in group['files']:
+                self.stdout.write('    #%d %s' % (f['pk'], f['file']))
+        self.stdout.write('%d groups of duplicates, %s wasted' % (
+            group_count, filesizeformat(wasted_size)))
+
+    def write_json(self, groups):
+        # written group by group to keep memory usage flat, a line each (the
+        # stdout of django 1.4 commands does not add the line endings, and the
+        # later ones always do)
+        self.stdout.write('[')
+        for i, group in enumerate(groups):
+            self.stdout.write('%s%s' % (',' if i else '', json.dumps(group)))
+        self.stdout.write(']')
+
+    def write_csv(self, groups):
+        writer = csv.writer(self.stdout, lineterminator='\n')
+        writer.writerow(csv_row(['sha1', 'count', 'size', 'total_size',
+                                 'wasted_size', 'owners', 'file_ids']))
+        for group in groups:
+            writer.writerow(csv_row([
+                group['sha1'], group['count'], group['size'],
+                group['total_size'], group['wasted_size'],
+                ' '.join(group['owners']),
+                ' '.join('%d' % f['pk'] for f in group['files']),
+            ]))
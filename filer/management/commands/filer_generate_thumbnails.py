@@ -0,0 +1,193 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import multiprocessing
+import os
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError, NoArgsCommand
+
+from filer.management.commands.filer_worker import close_connections
+from filer.models.abstract import BaseImage
+from filer.models.foldermodels import Folder
+from filer.models.imagemodels import Image
+
+
+def get_thumbnail_options():
+    """
+    Returns the options of all the thumbnails used by filer, keyed by alias:
+    the ``BaseImage.DEFAULT_THUMBNAILS`` names and ``icon_<size>`` for every
+    size in ``FILER_ADMIN_ICON_SIZES``.
+    """
+    options = dict(BaseImage.DEFAULT_THUMBNAILS)
+    for size, icon_options in BaseImage.get_icon_thumbnail_options().items():
+        options['icon_%s' % size] = icon_options
+    return options
+
+
+def generate_thumbnails(image_pk, aliases):
+    """
+    Generates the missing thumbnails ``aliases`` of an image and returns the
+    number of generated, skipped (already existing) and failed thumbnails.
+    """
+    generated, skipped, failed = 0, 0, 0
+    try:
+        image = Image.objects.get(pk=image_pk)
+    except Image.DoesNotExist:
+        return generated, skipped, failed
+    thumbnail_options = get_thumbnail_options()
+    missing = []
+    for alias in aliases:
+        options = image.file.get_options(dict(
+            thumbnail_options[alias], subject_location=image.subject_location))
+        try:
+            exists = image.file.get_existing_thumbnail(options)
+        except Exception:
+            failed += 1
+            continue
+        if exists:
+            skipped += 1
+        else:
+            missing.append((alias, options))
+    if missing:
+        errors = {}
+        try:
+            # decodes the image only once for all its missing thumbnails
+            for alias, thumbnail in image.file.generate_many_thumbnails(
+                    missing, errors):
+                image.file.save_thumbnail(thumbnail)
+                generated += 1
+            failed += len(errors)
+        except Exception:
+            failed += len(missing) - generated
+    return generated, skipped, failed
+
+
+def _generate_thumbnails(args):
+    return generate_thumbnails(*args)
+
+
+class Command(NoArgsCommand):
+    """
+    Generate the thumbnails of all images ahead of time ::
+
+        manage.py filer_generate_thumbnails --processes=4
+        manage.py filer_generate_thumbnails --folder=12 --alias=icon_32 --alias=icon_48
+        manage.py filer_generate_thumbnails --checkpoint=/tmp/thumbnails.checkpoint
+    """
+    help = 'Generates the missing thumbnails of images.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes',
+            action='store',
+            type='int',
+            dest='processes',
+            default=multiprocessing.cpu_count(),
+            help='Number of processes generating thumbnails in parallel'),
+        make_option('--chunk-size',
+            action='store',
+            type='int',
+            dest='chunk_size',
+            default=100,
+            help='Number of images loaded at once'),
+        make_option('--folder',
+            action='store',
+            type='int',
+            dest='folder',
+            default=None,
+            help='Only process the images in the folder with this id and its subfolders'),
+        make_option('--alias',
+            action='append',
+            dest='aliases',
+            default=[],
+            help='Only generate this thumbnail (can be given several times)'),
+        make_option('--checkpoint',
+            action='store',
+            dest='checkpoint',
+            default=None,
+            help='File recording the progress, to resume an interrupted run'),
+        )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        thumbnail_options = get_thumbnail_options()
+        aliases = options.get('aliases') or sorted(thumbnail_options)
+        unknown = set(aliases) - set(thumbnail_options)
+        if unknown:
+            raise CommandError('Unknown thumbnail alias(es) %s, choose from %s' % (
+                ', '.join(sorted(unknown)), ', '.join(sorted(thumbnail_options))))
+
+        images = Image.objects.non_polymorphic().order_by('pk')
+        if options.get('folder'):
+            try:
+                folder = Folder.objects.get(pk=options['folder'])
+            except Folder.DoesNotExist:
+                raise CommandError('Folder %s does not exist' % options['folder'])
+            images = images.filter(folder__tree_id=folder.tree_id,
+                                   folder__lft__gte=folder.lft,
+                                   folder__rght__lte=folder.rght)
+
+        checkpoint = options.get('checkpoint')
+        last_pk = self.read_checkpoint(checkpoint)
+
+        processes = options.get('processes')
+        pool = None
+        if processes > 1:
+            close_connections()
+            pool = multiprocessing.Pool(processes, initializer=close_connections)
+
+        image_count, generated, skipped, failed = 0, 0, 0, 0
+        started = time.time()
+        try:
+            while True:
+                chunk = images
+                if last_pk is not None:
+                    chunk = chunk.filter(pk__gt=last_pk)
+                pks = list(chunk.values_list('pk', flat=True)[:options.get('chunk_size')])
+                if not pks:
+                    break
+                args = [(pk, aliases) for pk in pks]
+                if pool is None:
+                    results = map(_generate_thumbnails, args)
+                else:
+                    results = pool.imap_unordered(_generate_thumbnails, args)
+                for result in results:
+                    generated += result[0]
+                    skipped += result[1]
+                    failed += result[2]
+                # the whole chunk is done
+                last_pk = pks[-1]
+                image_count += len(pks)
+                self.write_checkpoint(checkpoint, last_pk)
+                if verbosity > 0:
+                    self.stdout.write(self.progress(
+                        image_count, generated, skipped, failed, started))
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        if verbosity > 0:
+            self.stdout.write('Done: %s' % self.progress(
+                image_count, generated, skipped, failed, started))
+
+    def progress(self, image_count, generated, skipped, failed, started):
+        elapsed = max(time.time() - started, 0.001)
+        return ('%d images (%.1f images/s), %d thumbnails generated, '
+                '%d already existed, %d failed' % (
+                    image_count, image_count / elapsed, generated, skipped, failed))
+
+    def read_checkpoint(self, checkpoint):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return None
+        with open(checkpoint) as f:
+            content = f.read().strip()
+        return int(content) if content else None
+
+    def write_checkpoint(self, checkpoint, last_pk):
+        if not checkpoint:
+            return
+        # write and rename, so that the checkpoint is never half written
+        with open(checkpoint + '.tmp', 'w') as f:
+            f.write('%d' % last_pk)
+        os.rename(checkpoint + '.tmp', checkpoint)
@@ -0,0 +1,50 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError, NoArgsCommand
+
+from filer.models import File
+from filer.models.foldermodels import (Folder, check_folder_counters,
+                                       rebuild_folder_counters)
+from filer.utils.compatibility import atomic
+
+
+class Command(NoArgsCommand):
+    """
+    Check or repair the file and subfolder counters of the folders (they are
+    kept up to date automatically, unless files or folders are changed with
+    ``QuerySet.update()`` or raw SQL) ::
+
+        manage.py filer_rebuild_counters --check
+        manage.py filer_rebuild_counters
+    """
+    help = 'Checks or repairs the file and subfolder counters of the folders.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--check',
+            action='store_true',
+            dest='check',
+            default=False,
+            help='Only report the wrong counters, exit with an error if there are any'),
+        )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        if options.get('check'):
+            wrong = check_folder_counters(Folder, File)
+        else:
+            with atomic():
+                wrong = rebuild_folder_counters(Folder, File)
+        if verbosity > 1:
+            for folder_id in wrong:
+                self.stdout.write('folder %s' % folder_id)
+        if options.get('check'):
+            if wrong:
+                raise CommandError('The counters of %d folders are wrong, run '
+                                   'filer_rebuild_counters' % len(wrong))
+            if verbosity > 0:
+                self.stdout.write('The folder counters are up to date.')
+        elif verbosity > 0:
+            self.stdout.write('Repaired the counters of %d folders.' % len(wrong))
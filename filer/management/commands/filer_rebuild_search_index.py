@@ -0,0 +1,44 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, NoArgsCommand
+
+from filer.models import File, Folder
+from filer.search import get_search_backend
+from filer.utils.compatibility import atomic
+
+
+class Command(NoArgsCommand):
+    """
+    Rebuild the full-text search index of the files and folders (it is kept
+    up to date automatically, unless files, folders or users are changed with
+    ``QuerySet.update()`` or raw SQL), e.g. after changing
+    ``FILER_SEARCH_BACKEND`` ::
+
+        manage.py filer_rebuild_search_index
+        manage.py filer_rebuild_search_index --reinstall
+    """
+    help = 'Rebuilds the full-text search index of the files and folders.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--reinstall',
+            action='store_true',
+            dest='reinstall',
+            default=False,
+            help='Drop and create the index tables again'),
+        )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        backend = get_search_backend()
+        with atomic():
+            if options.get('reinstall'):
+                backend.uninstall(File, Folder)
+            backend.install(File, Folder)
+            backend.rebuild(File, Folder)
+        if verbosity > 0:
+            self.stdout.write('Indexed %d files and %d folders with %s.' % (
+                File.objects.count(), Folder.objects.count(),
+                backend.__class__.__name__))
@@ -0,0 +1,94 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import csv
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError, NoArgsCommand
+from django.template.defaultfilters import filesizeformat
+
+from filer.models import File, Folder, OwnerUsage
+from filer.utils.compatibility import csv_row
+
+
+class Command(NoArgsCommand):
+    """
+    Report the storage used by the files of each owner or in each folder,
+    for all the files or those of a folder and its subfolders ::
+
+        manage.py filer_usage
+        manage.py filer_usage --folder=12 --by=folder --format=csv > usage.csv
+        manage.py filer_usage --refresh
+    """
+    help = 'Reports the storage used per owner or per folder.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--by',
+            action='store',
+            dest='by',
+            default='owner',
+            help='Group by owner (default) or folder'),
+        make_option('--folder',
+            action='store',
+            type='int',
+            dest='folder',
+            default=None,
+            help='Only count the files of this folder (id) and its subfolders'),
+        make_option('--format',
+            action='store',
+            dest='format',
+            default='text',
+            help='Output format: text (default) or csv'),
+        make_option('--live',
+            action='store_true',
+            dest='live',
+            default=False,
+            help='Compute the usage from the files instead of reading the stored totals'),
+        make_option('--refresh',
+            action='store_true',
+            dest='refresh',
+            default=False,
+            help='Compute and store the usage of each owner again'),
+        )
+
+    def handle_noargs(self, **options):
+        if options.get('refresh'):
+            count = OwnerUsage.objects.refresh()
+            if int(options.get('verbosity', 1)) > 0:
+                self.stdout.write('Stored the usage of %d owners.' % count)
+            return
+        if options.get('by') not in ('owner', 'folder'):
+            raise CommandError('Unknown grouping "%s"' % options.get('by'))
+        writer = getattr(self, 'write_%s' % options.get('format'), None)
+        if writer is None:
+            raise CommandError('Unknown format "%s"' % options.get('format'))
+        folder = None
+        if options.get('folder') is not None:
+            try:
+                folder = Folder.objects.get(pk=options['folder'])
+            except Folder.DoesNotExist:
+                raise CommandError('Folder %s does not exist' % options['folder'])
+        live = options.get('live')
+        if options.get('by') == 'owner':
+            rows, computed_at = OwnerUsage.objects.report(folder, live=live)
+            rows = [(row['owner'], row['owner_name'] or '-', row['count'],
+                     row['total_size']) for row in rows]
+        else:
+            prefix = folder.pretty_logical_path if folder else ''
+            rows = [(row['folder'].pk, '%s/%s' % (prefix, row['folder'].name),
+                     row['count'], row['total_size'])
+                    for row in Folder.objects.subfolder_usage(folder, live=live)]
+        writer(options.get('by'), rows, File.objects.usage(folder))
+
+    def write_text(self, by, rows, usage):
+        for pk, name, count, total_size in rows:
+            self.stdout.write('%s: %d files, %s' % (
+                name, count, filesizeformat(total_size)))
+        self.stdout.write('Total: %d files, %s' % (
+            usage['count'], filesizeformat(usage['total_size'])))
+
+    def write_csv(self, by, rows, usage):
+        writer = csv.writer(self.stdout, lineterminator='\n')
+        writer.writerow(csv_row([by, 'name', 'count', 'total_size']))
+        for row in rows:
+            writer.writerow(csv_row(row))
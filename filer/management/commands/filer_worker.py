@@ -0,0 +1,86 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import multiprocessing
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, NoArgsCommand
+from django.db import connections
+
+from filer.models.jobmodels import Job
+
+
+def close_connections():
+    # Database connections must not be shared between processes
+    for connection in connections.all():
+        connection.close()
+
+
+def run_job(job_id):
+    Job.objects.get(pk=job_id).run()
+
+
+class Command(NoArgsCommand):
+    """
+    Run the queued background jobs (e.g. thumbnail generation after uploads
+    when FILER_ASYNC_PROCESSING is enabled) ::
+
+        manage.py filer_worker
+        manage.py filer_worker --processes=4
+        manage.py filer_worker --burst
+    """
+    help = 'Runs the queued filer background jobs.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes',
+            action='store',
+            type='int',
+            dest='processes',
+            default=1,
+            help='Number of processes running jobs in parallel'),
+        make_option('--interval',
+            action='store',
+            type='float',
+            dest='interval',
+            default=1.0,
+            help='Seconds to wait before polling an empty queue again'),
+        make_option('--burst',
+            action='store_true',
+            dest='burst',
+            default=False,
+            help='Exit as soon as the queue is empty'),
+        )
+
+    def handle_noargs(self, **options):
+        processes = options.get('processes')
+        verbosity = int(options.get('verbosity', 1))
+        pool = None
+        if processes > 1:
+            close_connections()
+            pool = multiprocessing.Pool(processes, initializer=close_connections)
+        running = []
+        try:
+            while True:
+                Job.objects.requeue_stale()
+                running = [result for result in running if not result.ready()]
+                free = processes - len(running)
+                jobs = Job.objects.claim(limit=free) if free else []
+                if not jobs:
+                    if options.get('burst') and not running:
+                        break
+                    time.sleep(options.get('interval'))
+                    continue
+                for job in jobs:
+                    if verbosity > 1:
+                        self.stdout.write('Running job %s: %s' % (job.pk, job.task))
+                    if pool is None:
+                        job.run()
+                    else:
+                        running.append(pool.apply_async(run_job, (job.pk,)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
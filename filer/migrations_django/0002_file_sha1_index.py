@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='sha1',
+            field=models.CharField(default='', max_length=40, verbose_name='sha1', db_index=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
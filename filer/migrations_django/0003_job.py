@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filer', '0002_file_sha1_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('task', models.CharField(max_length=255, verbose_name='task')),
+                ('payload', models.TextField(default='{}', verbose_name='payload', blank=True)),
+                ('result', models.TextField(default='', verbose_name='result', blank=True)),
+                ('status', models.CharField(default='queued', max_length=10, verbose_name='status', db_index=True, choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')])),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='run after', db_index=True)),
+                ('last_error', models.TextField(default='', verbose_name='last error', blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='modified at')),
+            ],
+            options={
+                'verbose_name': 'job',
+                'verbose_name_plural': 'jobs',
+            },
+            bases=(models.Model,),
+        ),
+    ]
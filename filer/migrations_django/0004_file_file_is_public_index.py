@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filer', '0003_job'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='file',
+            index_together=set([('file', 'is_public')]),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def build_folder_counters(apps, schema_editor):
+    from filer.models.foldermodels import rebuild_folder_counters
+    rebuild_folder_counters(apps.get_model('filer', 'Folder'),
+                            apps.get_model('filer', 'File'))
+
+
+def remove_folder_counters(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filer', '0004_file_file_is_public_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='_children_count',
+            field=models.IntegerField(default=0, verbose_name='subfolder count', editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='_file_count',
+            field=models.IntegerField(default=0, verbose_name='file count', editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='_total_file_count',
+            field=models.IntegerField(default=0, verbose_name='total file count', editable=False),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='_total_size',
+            field=models.BigIntegerField(default=0, verbose_name='total size', editable=False),
+        ),
+        migrations.RunPython(build_folder_counters, remove_folder_counters),
+    ]
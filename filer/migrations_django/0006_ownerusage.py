@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('filer', '0005_folder_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerUsage',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('file_count', models.IntegerField(default=0, verbose_name='file count')),
+                ('total_size', models.BigIntegerField(default=0, verbose_name='total size')),
+                ('computed_at', models.DateTimeField(verbose_name='computed at')),
+                ('owner', models.ForeignKey(related_name='+', verbose_name='owner', blank=True, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+            options={
+                'verbose_name': 'owner usage',
+                'verbose_name_plural': 'owner usage',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+def install_search_index(apps, schema_editor):
+    from filer.search import get_search_backend
+    backend = get_search_backend()
+    backend.install(apps.get_model('filer', 'File'), apps.get_model('filer', 'Folder'))
+    backend.rebuild(apps.get_model('filer', 'File'), apps.get_model('filer', 'Folder'))
+
+
+def uninstall_search_index(apps, schema_editor):
+    from filer.search import get_search_backend
+    get_search_backend().uninstall(apps.get_model('filer', 'File'),
+                                   apps.get_model('filer', 'Folder'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('filer', '0006_ownerusage'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
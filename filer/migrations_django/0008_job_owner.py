@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('filer', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='owner',
+            field=models.ForeignKey(related_name='+', verbose_name='owner', blank=True, to=settings.AUTH_USER_MODEL, null=True),
+        ),
+    ]
@@ -3,4 +3,6 @@ from filer.models.clipboardmodels import *
 from filer.models.filemodels import *
 from filer.models.foldermodels import *
 from filer.models.imagemodels import *
+from filer.models.jobmodels import *
+from filer.models.usagemodels import *
 from filer.models.virtualitems import *
@@ -55,13 +55,14 @@ class BaseImage(File):
 
     def save(self, *args, **kwargs):
         self.has_all_mandatory_data = self._check_validity()
-        try:
-            # do this more efficient somehow?
-            self.file.seek(0)
-            self._width, self._height = PILImage.open(self.file).size
-        except Exception:
-            # probably the image is missing. nevermind.
-            pass
+        if not self._ingested and self.file_data_changed():
+            try:
+                # do this more efficient somehow?
+                self.file.seek(0)
+                self._width, self._height = PILImage.open(self.file).size
+            except Exception:
+                # probably the image is missing. nevermind.
+                pass
         super(BaseImage, self).save(*args, **kwargs)
 
     def _check_validity(self):
@@ -129,30 +130,46 @@ class BaseImage(File):
 
     def _generate_thumbnails(self, required_thumbnails):
         _thumbnails = {}
-        for name, opts in six.iteritems(required_thumbnails):
-            try:
-                opts.update({'subject_location': self.subject_location})
-                thumb = self.file.get_thumbnail(opts)
-                _thumbnails[name] = thumb.url
-            except Exception as e:
-                # catch exception and manage it. We can re-raise it for debugging
-                # purposes and/or just logging it, provided user configured
-                # proper logging configuration
-                if filer_settings.FILER_ENABLE_LOGGING:
-                    logger.error('Error while generating thumbnail: %s',e)
-                if filer_settings.FILER_DEBUG:
-                    raise
+        thumbnail_options = dict(
+            (name, dict(opts, subject_location=self.subject_location))
+            for name, opts in six.iteritems(required_thumbnails))
+        errors = {}
+        try:
+            # decodes the image only once for all the missing thumbnails, and
+            # leaves out those that can not be generated (unless debugging)
+            thumbs = self.file.get_many_thumbnails(
+                thumbnail_options,
+                errors=None if filer_settings.FILER_DEBUG else errors)
+        except Exception as e:
+            # catch exception and manage it. We can re-raise it for debugging
+            # purposes and/or just logging it, provided user configured
+            # proper logging configuration
+            if filer_settings.FILER_ENABLE_LOGGING:
+                logger.error('Error while generating thumbnail: %s',e)
+            if filer_settings.FILER_DEBUG:
+                raise
+            thumbs = {}
+        if filer_settings.FILER_ENABLE_LOGGING:
+            for name, e in six.iteritems(errors):
+                logger.error('Error while generating thumbnail %s: %s', name, e)
+        for name, thumb in six.iteritems(thumbs):
+            _thumbnails[name] = thumb.url
         return _thumbnails
 
-    @property
-    def icons(self):
-        required_thumbnails = dict(
+    @classmethod
+    def get_icon_thumbnail_options(cls):
+        """
+        Returns the thumbnail options of the admin icons, keyed by size.
+        """
+        return dict(
             (size, {'size': (int(size), int(size)),
                     'crop': True,
-                    'upscale': True,
-                    'subject_location': self.subject_location})
+                    'upscale': True})
             for size in filer_settings.FILER_ADMIN_ICON_SIZES)
-        return self._generate_thumbnails(required_thumbnails)
+
+    @property
+    def icons(self):
+        return self._generate_thumbnails(self.get_icon_thumbnail_options())
 
     @property
     def thumbnails(self):
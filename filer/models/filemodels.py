@@ -6,30 +6,192 @@ import os
 
 from django.core import urlresolvers
 from django.conf import settings
-from django.core.files.base import ContentFile
-from django.db import models
+from django.core.cache import cache
+from django.core.files.base import File as DjangoFile
+from django.db import connections, models, router
+from django.utils.encoding import force_bytes
 from django.utils.translation import ugettext_lazy as _
 
 from polymorphic import PolymorphicModel, PolymorphicManager
 
 from filer import settings as filer_settings
 from filer.fields.multistorage_file import MultiStorageFileField
-from filer.models import mixins
-from filer.models.foldermodels import Folder
-from filer.utils.compatibility import python_2_unicode_compatible, DJANGO_1_7
+from filer.models import foldermodels, mixins
+from filer.models.foldermodels import Folder, FolderPermission
+from filer.search import get_owner_search_fields, get_search_backend
+from filer.utils.compatibility import (python_2_unicode_compatible, atomic,
+                                       DJANGO_1_4, DJANGO_1_7)
+from filer.utils.hashing import sha1_file
+from filer.utils.signing import sign_url
+from filer.utils.transfer import transfer_file
+
+
+def get_path_cache_key(path, is_public):
+    return 'filer:path:2:%d:%s' % (
+        int(bool(is_public)), hashlib.sha1(force_bytes(path)).hexdigest())
+
+
+def get_owner_username_field():
+    try:
+        from django.contrib.auth import get_user_model
+    except ImportError:  # Django < 1.5
+        return 'owner__username'
+    return 'owner__%s' % get_user_model().USERNAME_FIELD
 
 
 class FileManager(PolymorphicManager):
+    def get_path_info(self, path, is_public=False):
+        """
+        Returns a list of ``(file_id, folder_id, owner_id, sha1, size,
+        modified_at)`` tuples for the files stored at ``path`` (several files
+        can share a stored file), without loading the (polymorphic) files. The result is cached for
+        ``FILER_PATH_CACHE_TIMEOUT`` seconds or until one of the files is
+        saved or deleted.
+        """
+        timeout = filer_settings.FILER_PATH_CACHE_TIMEOUT
+        key = get_path_cache_key(path, is_public)
+        info = cache.get(key) if timeout else None
+        if info is None:
+            info = [tuple(row) for row in self.non_polymorphic().filter(
+                file=path, is_public=is_public).order_by('pk').values_list(
+                'pk', 'folder_id', 'owner_id', 'sha1', '_file_size',
+                'modified_at')]
+            if info and timeout:
+                cache.set(key, info, timeout)
+        return info
+
+    def invalidate_path(self, path, is_public):
+        if path:
+            cache.delete(get_path_cache_key(path, is_public))
+
+    def readable_by(self, user):
+        """
+        Returns the files ``user`` may read, filtered by the position of
+        their folder in the folder tree rather than by a list of ids.
+        """
+        if not user.is_authenticated():
+            return self.none()
+        ranges = FolderPermission.objects.get_read_ranges(user)
+        if ranges == 'All':
+            return self.all()
+        return self.filter(models.Q(owner=user) | models.Q(folder__owner=user) |
+                           ranges.q('folder__'))
+
+    def duplicate_sha1s(self):
+        """
+        Returns a values queryset with one row (``sha1``, ``count``,
+        ``size`` and ``total_size``) for every checksum that is shared by more
+        than one file. Everything is computed by the database in one
+        GROUP BY query.
+        """
+        return self.non_polymorphic().exclude(sha1='').values('sha1').annotate(
+            count=models.Count('pk'),
+            size=models.Max('_file_size'),
+            total_size=models.Sum('_file_size'),
+        ).filter(count__gt=1).order_by()
+
     def find_all_duplicates(self):
+        """
+        Returns a dictionary mapping each duplicated sha1 to a queryset of the
+        files sharing it.
+        """
         r = {}
-        for file_obj in self.all():
-            if file_obj.sha1:
-                q = self.filter(sha1=file_obj.sha1)
-                if len(q) > 1:
-                    r[file_obj.sha1] = q
+        for row in self.duplicate_sha1s().iterator():
+            r[row['sha1']] = self.filter(sha1=row['sha1'])
         return r
 
+    def iter_duplicate_groups(self, batch_size=500):
+        """
+        Yields a dictionary for every group of duplicates, with the values of
+        ``duplicate_sha1s``, the number of bytes that could be saved by
+        keeping only one copy (``wasted_size``), the list of ``files`` (as
+        dictionaries with ``pk``, ``name``, ``original_filename``, ``file``,
+        ``size`` and ``owner``) and the sorted list of their ``owners``.
+
+        The groups are streamed from the database and their files are fetched
+        with one query per ``batch_size`` groups, so that memory usage does
+        not depend on the number of duplicates.
+        """
+        batch = []
+        for row in self.duplicate_sha1s().iterator():
+            batch.append(row)
+            if len(batch) >= batch_size:
+                for group in self._duplicate_groups(batch):
+                    yield group
+                batch = []
+        for group in self._duplicate_groups(batch):
+            yield group
+
+    def _duplicate_groups(self, rows):
+        if not rows:
+            return []
+        username_field = get_owner_username_field()
+        groups = {}
+        for row in rows:
+            groups[row['sha1']] = dict(
+                row, files=[], owners=set(),
+                wasted_size=(row['total_size'] or 0) - (row['size'] or 0))
+        files = self.non_polymorphic().filter(sha1__in=list(groups)).values(
+            'pk', 'sha1', 'name', 'original_filename', 'file', '_file_size',
+            username_field).order_by('pk')
+        for f in files:
+            group = groups[f['sha1']]
+            owner = f[username_field]
+            group['files'].append({
+                'pk': f['pk'],
+                'name': f['name'],
+                'original_filename': f['original_filename'],
+                'file': f['file'],
+                'size': f['_file_size'],
+                'owner': owner,
+            })
+            if owner is not None:
+                group['owners'].add(owner)
+        result = []
+        for row in rows:
+            group = groups[row['sha1']]
+            group['owners'] = sorted(group['owners'])
+            result.append(group)
+        return result
+
+    def in_subtree(self, folder):
+        """
+        Returns the files of ``folder`` and of all its subfolders.
+        """
+        return self.filter(folder__tree_id=folder.tree_id,
+                           folder__lft__gte=folder.lft,
+                           folder__rght__lte=folder.rght)
+
+    def usage(self, folder=None):
+        """
+        Returns the number of files (``count``) and their size in bytes
+        (``total_size``) in ``folder`` and its subfolders, or of all the
+        files, with one aggregate query.
+        """
+        qs = self.all() if folder is None else self.in_subtree(folder)
+        usage = qs.non_polymorphic().aggregate(
+            count=models.Count('pk'), total_size=models.Sum('_file_size'))
+        usage['total_size'] = usage['total_size'] or 0
+        return usage
+
+    def owner_usage(self, folder=None):
+        """
+        Returns a values queryset with one row (``owner``, the name of the
+        owner as ``owner_name``, ``count`` and ``total_size``) per owner of
+        files in ``folder`` and its subfolders (or of any file), the largest
+        total size first. Everything is computed by the database in one
+        GROUP BY query.
+        """
+        qs = self.all() if folder is None else self.in_subtree(folder)
+        return qs.non_polymorphic().values('owner').annotate(
+            owner_name=models.Max(get_owner_username_field()),
+            count=models.Count('pk'),
+            total_size=models.Sum('_file_size'),
+        ).order_by('-total_size', 'owner')
+
     def find_duplicates(self, file_obj):
+        if not file_obj.sha1:
+            return []
         return [i for i in self.exclude(pk=file_obj.pk).filter(sha1=file_obj.sha1)]
 
 
@@ -42,7 +204,8 @@ class File(PolymorphicModel, mixins.IconsMixin):
     file = MultiStorageFileField(_('file'), null=True, blank=True, max_length=255)
     _file_size = models.IntegerField(_('file size'), null=True, blank=True)
 
-    sha1 = models.CharField(_('sha1'), max_length=40, blank=True, default='')
+    sha1 = models.CharField(_('sha1'), max_length=40, blank=True, default='',
+        db_index=True)
 
     has_all_mandatory_data = models.BooleanField(_('has all mandatory data'), default=False, editable=False)
 
@@ -68,6 +231,13 @@ class File(PolymorphicModel, mixins.IconsMixin):
 
     objects = FileManager()
 
+    # set by ``filer.utils.ingest.FileIngest.apply()``
+    _ingested = False
+    # Set to True if the content of the file has been replaced without
+    # changing its name, or to False if the file is known to be unchanged
+    # (see ``file_data_changed``). Reset on save.
+    _file_data_changed_hint = None
+
     @classmethod
     def matches_file_type(cls, iname, ifile, request):
         return True  # I match all files...
@@ -75,6 +245,64 @@ class File(PolymorphicModel, mixins.IconsMixin):
     def __init__(self, *args, **kwargs):
         super(File, self).__init__(*args, **kwargs)
         self._old_is_public = self.is_public
+        self._old_file_name = self._get_file_name()
+        self._old_counted = self._get_counted()
+
+    def _get_counted(self):
+        """
+        Returns the folder id and the size the file is counted with in the
+        folder counters, or None if they are deferred and not loaded.
+        """
+        if 'folder_id' in self.__dict__ and '_file_size' in self.__dict__:
+            return self.folder_id, self._file_size or 0
+        return None
+
+    def _get_stored_counted(self):
+        for folder_id, size in File.objects.filter(pk=self.pk).values_list(
+                'folder_id', '_file_size'):
+            return folder_id, size or 0
+        # not saved yet
+        return None
+
+    def _update_folder_counters(self, adding):
+        folder_id, size = self._get_counted() or self._get_stored_counted()
+        if adding:
+            Folder.objects.add_to_counters(folder_id, files=1, total_files=1,
+                                           total_size=size)
+            return
+        old_folder_id, old_size = self._old_counted or (None, 0)
+        if folder_id != old_folder_id:
+            Folder.objects.add_to_counters(old_folder_id, files=-1, total_files=-1,
+                                           total_size=-old_size)
+            Folder.objects.add_to_counters(folder_id, files=1, total_files=1,
+                                           total_size=size)
+        elif size != old_size:
+            Folder.objects.add_to_counters(folder_id, total_size=size - old_size)
+
+    def _get_file_name(self):
+        # Look at the raw attribute to not trigger the loading of a deferred
+        # field or the wrapping into a FieldFile.
+        value = self.__dict__.get('file')
+        return getattr(value, 'name', value)
+
+    def file_data_changed(self):
+        """
+        Returns True if the content of the file may have changed since the
+        instance was loaded (or last saved), meaning that the cached size, sha1
+        and, for images, dimensions have to be computed again.
+        """
+        if self._file_data_changed_hint is not None:
+            return self._file_data_changed_hint
+        if not self.pk:
+            return True
+        if 'file' not in self.__dict__:
+            # deferred and never loaded
+            return False
+        value = self.__dict__['file']
+        if isinstance(value, DjangoFile) and not getattr(value, '_committed', False):
+            # a new file has been assigned but is not saved to the storage yet
+            return True
+        return self._get_file_name() != self._old_file_name
 
     def _move_file(self):
         """
@@ -91,19 +319,27 @@ class File(PolymorphicModel, mixins.IconsMixin):
             src_storage = self.file.storages['public']
             dst_storage = self.file.storages['private']
 
-        # delete the thumbnail
-        # We are toggling the is_public to make sure that easy_thumbnails can
-        # delete the thumbnails
-        self.is_public = not self.is_public
-        self.file.delete_thumbnails()
-        self.is_public = not self.is_public
-        # This is needed because most of the remote File Storage backend do not
-        # open the file.
-        src_file = src_storage.open(src_file_name)
-        src_file.open()
-        self.file = dst_storage.save(dst_file_name,
-            ContentFile(src_file.read()))
-        src_storage.delete(src_file_name)
+        # Other files may share the source file (e.g. copies or content
+        # addressed storage), it must be kept for them.
+        src_shared = File.objects.filter(
+            file=src_file_name, is_public=not self.is_public).exclude(
+            pk=self.pk).exists()
+
+        if not src_shared:
+            # delete the thumbnail
+            # We are toggling the is_public to make sure that easy_thumbnails can
+            # delete the thumbnails
+            self.is_public = not self.is_public
+            self.file.delete_thumbnails()
+            self.is_public = not self.is_public
+        if self.file.content_addressed and dst_storage.exists(dst_file_name):
+            # the same content is already stored in the destination storage
+            self.file = dst_file_name
+            if not src_shared:
+                src_storage.delete(src_file_name)
+        else:
+            self.file = transfer_file(src_storage, src_file_name,
+                dst_storage, dst_file_name, move=not src_shared)
 
     def _copy_file(self, destination, overwrite=False):
         """
@@ -117,25 +353,14 @@ class File(PolymorphicModel, mixins.IconsMixin):
             raise NotImplementedError
 
         src_file_name = self.file.name
+        if self.file.content_addressed:
+            # a copy has the same content, so it is stored at the same place
+            return src_file_name
         storage = self.file.storages['public' if self.is_public else 'private']
-
-        # This is needed because most of the remote File Storage backend do not
-        # open the file.
-        src_file = storage.open(src_file_name)
-        src_file.open()
-        return storage.save(destination, ContentFile(src_file.read()))
+        return transfer_file(storage, src_file_name, storage, destination)
 
     def generate_sha1(self):
-        sha = hashlib.sha1()
-        self.file.seek(0)
-        while True:
-            buf = self.file.read(104857600)
-            if not buf:
-                break
-            sha.update(buf)
-        self.sha1 = sha.hexdigest()
-        # to make sure later operations can read the whole file
-        self.file.seek(0)
+        self.sha1 = sha1_file(self.file)
 
     def save(self, *args, **kwargs):
         # check if this is a subclass of "File" or not and set
@@ -147,22 +372,40 @@ class File(PolymorphicModel, mixins.IconsMixin):
             pass
         elif issubclass(self.__class__, File):
             self._file_type_plugin_name = self.__class__.__name__
+        # Only measure and hash the file if its content changed, because
+        # depending on the storage backend the whole file will be downloaded.
+        # The size and the sha1 have already been set if the file was ingested
+        # while being uploaded (see ``filer.utils.ingest``).
+        update_file_data = not self._ingested and self.file_data_changed()
         # cache the file size
-        # TODO: only do this if needed (depending on the storage backend the whole file will be downloaded)
-        try:
-            self._file_size = self.file.size
-        except:
-            pass
+        if update_file_data:
+            try:
+                self._file_size = self.file.size
+            except:
+                pass
+        old_path = (self._old_file_name, self._old_is_public)
         if self._old_is_public != self.is_public and self.pk:
             self._move_file()
             self._old_is_public = self.is_public
         # generate SHA1 hash
-        # TODO: only do this if needed (depending on the storage backend the whole file will be downloaded)
-        try:
-            self.generate_sha1()
-        except Exception:
-            pass
-        super(File, self).save(*args, **kwargs)
+        if update_file_data:
+            try:
+                self.generate_sha1()
+            except Exception:
+                pass
+        # the counters of the folders are updated along with the file
+        with atomic():
+            adding = self.pk is None or self._state.adding
+            if not adding and self._old_counted is None:
+                self._old_counted = self._get_stored_counted()
+            super(File, self).save(*args, **kwargs)
+            self._update_folder_counters(adding)
+        self._old_counted = self._get_counted()
+        self._ingested = False
+        self._file_data_changed_hint = None
+        self._old_file_name = self._get_file_name()
+        File.objects.invalidate_path(*old_path)
+        File.objects.invalidate_path(self._old_file_name, self.is_public)
     save.alters_data = True
 
     def delete(self, *args, **kwargs):
@@ -240,6 +483,16 @@ class File(PolymorphicModel, mixins.IconsMixin):
             r = ''
         return r
 
+    def get_signed_url(self, expires_in=None, user=None):
+        """
+        Returns a URL of a private file that can be used without any
+        permission check until it expires (see ``filer.utils.signing``).
+        Only give it to users who are allowed to read the file.
+        """
+        if self.is_public or not self.file:
+            return self.url
+        return sign_url(self.url, self.file.name, expires_in=expires_in, user=user)
+
     @property
     def path(self):
         try:
@@ -290,3 +543,99 @@ class File(PolymorphicModel, mixins.IconsMixin):
         app_label = 'filer'
         verbose_name = _('file')
         verbose_name_plural = _('files')
+        if not DJANGO_1_4:
+            # used to look up the file of a path by the protected serve views
+            index_together = (('file', 'is_public'),)
+
+
+def file_post_delete(sender, instance, **kwargs):
+    folder_id, size = instance._old_counted or instance._get_counted() or (None, 0)
+    if folder_id in getattr(foldermodels._deleted_folders, 'ids', ()):
+        # subtracted with the whole folder
+        return
+    Folder.objects.add_to_counters(folder_id, files=-1, total_files=-1,
+                                   total_size=-size)
+models.signals.post_delete.connect(file_post_delete, sender=File,
+                                   dispatch_uid='filer_file_post_delete')
+
+
+def invalidate_path_cache(sender, instance, **kwargs):
+    if isinstance(instance, File):
+        File.objects.invalidate_path(instance._get_file_name(), instance.is_public)
+# also called for files deleted along with their folder
+models.signals.post_delete.connect(invalidate_path_cache,
+                                   dispatch_uid='filer_file_invalidate_path_cache')
+
+
+def update_search_index(sender, instance, **kwargs):
+    # sent once, for the class of a file
+    for model in (File, Folder):
+        if isinstance(instance, model):
+            get_search_backend().update(model, [instance.pk])
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    for model in (File, Folder):
+        if isinstance(instance, model):
+            get_search_backend().remove(model, [instance.pk])
+
+
+def get_owner_search_values(user):
+    return tuple('%s' % (getattr(user, field) or '')
+                 for field in get_owner_search_fields())
+
+
+def owner_pre_save(sender, instance, **kwargs):
+    # the indexed values of the owner before the change
+    instance._old_owner_search_values = None
+    update_fields = kwargs.get('update_fields')
+    if instance.pk is None or sender is not foldermodels._user_model() or (
+            update_fields is not None and
+            not set(update_fields) & set(get_owner_search_fields())):
+        return
+    for old in sender._default_manager.filter(pk=instance.pk)[:1]:
+        instance._old_owner_search_values = get_owner_search_values(old)
+
+
+def update_owner_search_index(sender, instance, created, **kwargs):
+    old_values = getattr(instance, '_old_owner_search_values', None)
+    if created or old_values is None or old_values == get_owner_search_values(instance):
+        # e.g. only the last login changed
+        return
+    backend = get_search_backend()
+    for model in (File, Folder):
+        backend.update(model, model.objects.filter(owner=instance).values_list(
+            'pk', flat=True))
+
+
+def install_search_index(sender, **kwargs):
+    """
+    Creates and fills the search index if it does not exist yet, e.g. after
+    a syncdb without migrations or a change of ``FILER_SEARCH_BACKEND``.
+    """
+    if getattr(sender, 'name', getattr(sender, '__name__', None)) not in (
+            'filer', 'filer.models'):
+        return
+    connection = connections[router.db_for_write(File)]
+    using = kwargs.get('using', kwargs.get('db', connection.alias))
+    if using != connection.alias or \
+            File._meta.db_table not in connection.introspection.table_names():
+        # the files and folders are not created yet (e.g. by South)
+        return
+    backend = get_search_backend()
+    if not backend.is_installed(File, Folder):
+        backend.install(File, Folder)
+        backend.rebuild(File, Folder)
+
+models.signals.post_save.connect(update_search_index,
+                                 dispatch_uid='filer_update_search_index')
+# also called for files and folders deleted along with their folder or owner
+models.signals.post_delete.connect(remove_from_search_index,
+                                   dispatch_uid='filer_remove_from_search_index')
+models.signals.pre_save.connect(owner_pre_save,
+                                dispatch_uid='filer_owner_search_pre_save')
+models.signals.post_save.connect(update_owner_search_index,
+                                 dispatch_uid='filer_update_owner_search_index')
+# sent after migrate (Django >= 1.7), or after syncdb and South migrations
+(getattr(models.signals, 'post_migrate', None) or models.signals.post_syncdb).connect(
+    install_search_index, dispatch_uid='filer_install_search_index')
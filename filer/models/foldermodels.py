@@ -4,22 +4,190 @@ from __future__ import unicode_literals
 from django.contrib.auth import models as auth_models
 from django.core import urlresolvers
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q
+from django.db import connections, models
+from django.db.models import Count, F, Q, Sum
 from django.utils.http import urlquote
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
 from filer.models import mixins
 from filer import settings as filer_settings
-from filer.utils.compatibility import python_2_unicode_compatible
+from filer.utils import permission_cache
+from filer.utils.compatibility import python_2_unicode_compatible, atomic, DJANGO_1_4
 
 import mptt
+import threading
+
+
+def merge_ranges(ranges):
+    """
+    Sorts ``(tree_id, lft, rght)`` ranges and merges the overlapping and
+    adjacent ones.
+    """
+    merged = []
+    for tree_id, lft, rght in sorted(ranges):
+        if merged and merged[-1][0] == tree_id and lft <= merged[-1][2] + 1:
+            if rght > merged[-1][2]:
+                merged[-1] = (tree_id, merged[-1][1], rght)
+        else:
+            merged.append((tree_id, lft, rght))
+    return merged
+
+
+def subtract_ranges(ranges, excluded):
+    """
+    Returns the merged ``ranges`` without the parts covered by ``excluded``.
+    """
+    result = []
+    excluded = merge_ranges(excluded)
+    for tree_id, lft, rght in merge_ranges(ranges):
+        for ex_tree_id, ex_lft, ex_rght in excluded:
+            if ex_tree_id != tree_id or ex_rght < lft or ex_lft > rght:
+                continue
+            if ex_lft > lft:
+                result.append((tree_id, lft, ex_lft - 1))
+            lft = ex_rght + 1
+            if lft > rght:
+                break
+        else:
+            result.append((tree_id, lft, rght))
+    return result
+
+
+class FolderRanges(object):
+    """
+    A set of folders given as ``(tree_id, lft, rght)`` ranges of the folder
+    tree: a folder belongs to it if its ``lft`` lies within one of the ranges
+    of its tree. A rule for a folder and its children is a single range, no
+    matter how many subfolders there are. If ``inverted``, the set contains
+    all the folders except those in the ranges.
+    """
+    def __init__(self, ranges=(), inverted=False):
+        self.ranges = merge_ranges(ranges)
+        self.inverted = inverted
+
+    def __contains__(self, folder):
+        return self.contains(folder.tree_id, folder.lft)
+
+    def contains(self, tree_id, lft):
+        """
+        Returns True if the folder at ``(tree_id, lft)`` belongs to the set.
+        """
+        if tree_id is None:
+            return False
+        for range_tree_id, range_lft, range_rght in self.ranges:
+            if range_tree_id == tree_id and range_lft <= lft <= range_rght:
+                return not self.inverted
+        return self.inverted
+
+    def q(self, prefix=''):
+        """
+        Returns a ``Q`` object matching the folders of the set, with the
+        lookups prefixed by ``prefix`` (e.g. ``'folder__'`` to filter files).
+        """
+        q = Q()
+        for tree_id, lft, rght in self.ranges:
+            if lft == rght:
+                kwargs = {prefix + 'tree_id': tree_id, prefix + 'lft': lft}
+            else:
+                kwargs = {prefix + 'tree_id': tree_id, prefix + 'lft__gte': lft,
+                          prefix + 'lft__lte': rght}
+            q |= Q(**kwargs)
+        if self.inverted:
+            # the folder must exist (e.g. files on the top level are in none)
+            return Q(**{prefix + 'tree_id__isnull': False}) & ~q
+        if not self.ranges:
+            return Q(**{prefix + 'pk__in': []})
+        return q
 
 
 class FolderManager(models.Manager):
     def with_bad_metadata(self):
         return self.get_query_set().filter(has_all_mandatory_data=False)
 
+    def readable_by(self, user):
+        """
+        Returns the folders ``user`` may read, filtered by their position in
+        the folder tree rather than by a list of ids.
+        """
+        if not user.is_authenticated():
+            return self.none()
+        ranges = FolderPermission.objects.get_read_ranges(user)
+        if ranges == 'All':
+            return self.all()
+        return self.filter(Q(owner=user) | ranges.q())
+
+    def subfolder_usage(self, parent=None, live=False):
+        """
+        Returns the number of files (``count``) and their size in bytes
+        (``total_size``) in each subfolder of ``parent`` (or root folder),
+        including the files of their own subfolders, as a list of dicts with
+        the ``folder``, the largest total size first.
+
+        The totals are read from the stored counters of the folders, or
+        computed from the files with one query if ``live`` is True.
+        """
+        folders = self.filter(parent=parent) if parent else self.filter(parent__isnull=True)
+        folders = list(folders)
+        if live:
+            totals = self._subtree_totals(parent)
+        else:
+            totals = dict((folder.pk, (folder.total_file_count, folder.total_size))
+                          for folder in folders)
+        rows = [{'folder': folder,
+                 'count': totals.get(folder.pk, (0, 0))[0],
+                 'total_size': totals.get(folder.pk, (0, 0))[1]}
+                for folder in folders]
+        rows.sort(key=lambda row: (-row['total_size'], row['folder'].name))
+        return rows
+
+    def _subtree_totals(self, parent=None):
+        from filer.models.filemodels import File
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        sql = ('SELECT c.{id}, COUNT(f.{id}), SUM(f.{size}) '
+               'FROM {folder} c '
+               'INNER JOIN {folder} d ON d.{tree_id} = c.{tree_id} '
+               'AND d.{lft} >= c.{lft} AND d.{lft} <= c.{rght} '
+               'INNER JOIN {file} f ON f.{folder_id} = d.{id} '
+               'WHERE c.{parent_id} {parent} GROUP BY c.{id}').format(
+            id=qn('id'), size=qn('_file_size'), folder=qn(self.model._meta.db_table),
+            file=qn(File._meta.db_table), tree_id=qn('tree_id'), lft=qn('lft'),
+            rght=qn('rght'), folder_id=qn('folder_id'), parent_id=qn('parent_id'),
+            parent='= %s' if parent else 'IS NULL')
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, [parent.pk] if parent else [])
+            return dict((pk, (count, size or 0))
+                        for pk, count, size in cursor.fetchall())
+        finally:
+            cursor.close()
+
+    def add_to_counters(self, folder_id, files=0, children=0, total_files=0,
+                        total_size=0):
+        """
+        Adds to the file and subfolder counters of the folder ``folder_id``
+        and to the subtree counters of the folder and of its ancestors, in
+        the database.
+        """
+        if folder_id is None:
+            return
+        if files or children:
+            self.filter(pk=folder_id).update(
+                _file_count=F('_file_count') + files,
+                _children_count=F('_children_count') + children)
+        if total_files or total_size:
+            try:
+                tree_id, lft, rght = self.filter(pk=folder_id).values_list(
+                    'tree_id', 'lft', 'rght')[0]
+            except IndexError:
+                return
+            self.filter(tree_id=tree_id, lft__lte=lft, rght__gte=rght).update(
+                _total_file_count=F('_total_file_count') + total_files,
+                _total_size=F('_total_size') + total_size)
+
+
+PERMISSION_TYPES = ('read', 'edit', 'add_children')
+
 
 class FolderPermissionManager(models.Manager):
     """
@@ -39,47 +207,107 @@ class FolderPermissionManager(models.Manager):
     def get_add_children_id_list(self, user):
         return self.__get_id_list(user, "can_add_children")
 
-    def __get_id_list(self, user, attr):
-        if user.is_superuser or not filer_settings.FILER_ENABLE_PERMISSIONS:
-            return 'All'
-        allow_list = set()
-        deny_list = set()
-        group_ids = user.groups.all().values_list('id', flat=True)
-        q = Q(user=user) | Q(group__in=group_ids) | Q(everybody=True)
-        perms = self.filter(q).order_by('folder__tree_id', 'folder__level',
-                                        'folder__lft')
-        for perm in perms:
-            p = getattr(perm, attr)
-
-            if p is None:
-                # Not allow nor deny, we continue with the next permission
+    def get_item_permissions(self, user, items, permission_types=PERMISSION_TYPES):
+        """
+        Returns the permissions of ``user`` on many folders and files at once:
+        a list with a dictionary of flags (e.g. ``{'read': True, 'edit':
+        False, 'add_children': False}``) for every item, like their
+        ``has_*_permission`` methods would return. The permissions of the
+        user are compiled once and the folders of the files are fetched in a
+        single query. Items without permissions of their own (e.g. the
+        virtual folders) have all the permissions.
+        """
+        items = list(items)
+        if not user.is_authenticated():
+            return [dict((t, False) for t in permission_types) for item in items]
+        all_permissions = dict((t, True) for t in permission_types)
+        if user.is_superuser:
+            return [dict(all_permissions) for item in items]
+        ranges = dict((t, getattr(self, 'get_%s_ranges' % t)(user))
+                      for t in permission_types)
+        # the tree positions and owners of the folders of the files
+        folder_ids = set(getattr(item, 'folder_id', None) for item in items
+                         if not isinstance(item, Folder))
+        folder_ids.discard(None)
+        folders = {}
+        if folder_ids:
+            for pk, tree_id, lft, owner_id in Folder.objects.filter(
+                    pk__in=folder_ids).values_list('pk', 'tree_id', 'lft', 'owner_id'):
+                folders[pk] = (tree_id, lft, owner_id)
+        result = []
+        for item in items:
+            if isinstance(item, Folder):
+                folder = (item.tree_id, item.lft, item.owner_id)
+            elif hasattr(item, 'folder_id'):
+                if item.owner_id == user.pk:
+                    result.append(dict(all_permissions))
+                    continue
+                folder = folders.get(item.folder_id)
+            else:
+                result.append(dict(all_permissions))
                 continue
+            if folder is None:
+                result.append(dict((t, False) for t in permission_types))
+                continue
+            tree_id, lft, owner_id = folder
+            result.append(dict(
+                (t, owner_id == user.pk or ranges[t] == 'All' or
+                 ranges[t].contains(tree_id, lft))
+                for t in permission_types))
+        return result
+
+    def get_read_ranges(self, user):
+        """
+        Give the Folders where the user has read rights as ``FolderRanges``
+        or the string "All" if the user has all rights.
+        """
+        return self.__get_ranges(user, "can_read")
 
-            if not perm.folder:
-                assert perm.type == FolderPermission.ALL
-
-                if p == FolderPermission.ALLOW:
-                    allow_list.update(Folder.objects.all().values_list('id', flat=True))
-                else:
-                    deny_list.update(Folder.objects.all().values_list('id', flat=True))
+    def get_edit_ranges(self, user):
+        return self.__get_ranges(user, "can_edit")
 
-                continue
+    def get_add_children_ranges(self, user):
+        return self.__get_ranges(user, "can_add_children")
 
-            folder_id = perm.folder.id
+    def __get_ranges(self, user, attr):
+        if user.is_superuser or not filer_settings.FILER_ENABLE_PERMISSIONS:
+            return 'All'
+        return permission_cache.get_permissions(
+            user.pk, attr, lambda: self.__compile_ranges(user, attr))
 
+    def __compile_ranges(self, user, attr):
+        # Compiled from the rules, a rule for a folder and its children is a
+        # single range of the tree.
+        group_ids = user.groups.all().values_list('id', flat=True)
+        q = Q(user=user) | Q(group__in=group_ids) | Q(everybody=True)
+        rows = self.filter(q).exclude(**{attr: None}).values_list(
+            'type', 'folder__tree_id', 'folder__lft', 'folder__rght', attr)
+        allow_ranges = []
+        deny_ranges = []
+        allow_all = False
+        for rule_type, tree_id, lft, rght, p in rows:
+            if tree_id is None:
+                # a rule for all folders
+                if p == FolderPermission.DENY:
+                    return FolderRanges()
+                allow_all = True
+                continue
+            if rule_type != FolderPermission.CHILDREN:
+                rght = lft
             if p == FolderPermission.ALLOW:
-                allow_list.add(folder_id)
+                allow_ranges.append((tree_id, lft, rght))
             else:
-                deny_list.add(folder_id)
-
-            if perm.type == FolderPermission.CHILDREN:
-                if p == FolderPermission.ALLOW:
-                    allow_list.update(perm.folder.get_descendants().values_list('id', flat=True))
-                else:
-                    deny_list.update(perm.folder.get_descendants().values_list('id', flat=True))
-
+                deny_ranges.append((tree_id, lft, rght))
+        if allow_all:
+            return FolderRanges(deny_ranges, inverted=True)
         # Deny has precedence over allow
-        return allow_list - deny_list
+        return FolderRanges(subtract_ranges(allow_ranges, deny_ranges))
+
+    def __get_id_list(self, user, attr):
+        ranges = self.__get_ranges(user, attr)
+        if ranges == 'All':
+            return 'All'
+        return set(Folder.objects.filter(ranges.q()).values_list('id', flat=True))
 
 
 @python_2_unicode_compatible
@@ -111,24 +339,48 @@ class Folder(models.Model, mixins.IconsMixin):
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     modified_at = models.DateTimeField(_('modified at'),auto_now=True)
 
+    # Kept up to date when files and folders are saved, moved and deleted,
+    # see ``FolderManager.add_to_counters`` and ``filer_rebuild_counters``
+    _file_count = models.IntegerField(_('file count'), default=0, editable=False)
+    _children_count = models.IntegerField(_('subfolder count'), default=0,
+                                          editable=False)
+    _total_file_count = models.IntegerField(_('total file count'), default=0,
+                                            editable=False)
+    _total_size = models.BigIntegerField(_('total size'), default=0, editable=False)
+
     objects = FolderManager()
 
+    def __init__(self, *args, **kwargs):
+        super(Folder, self).__init__(*args, **kwargs)
+        self._old_parent_id = self.parent_id
+
     @property
     def file_count(self):
-        if not hasattr(self, '_file_count_cache'):
-            self._file_count_cache = self.files.count()
-        return self._file_count_cache
+        return self._file_count
 
     @property
     def children_count(self):
-        if not hasattr(self, '_children_count_cache'):
-            self._children_count_cache = self.children.count()
-        return self._children_count_cache
+        return self._children_count
 
     @property
     def item_count(self):
         return self.file_count + self.children_count
 
+    @property
+    def total_file_count(self):
+        """
+        The number of files in the folder and in all its subfolders.
+        """
+        return self._total_file_count
+
+    @property
+    def total_size(self):
+        """
+        The size in bytes of the files in the folder and in all its
+        subfolders.
+        """
+        return self._total_size
+
     @property
     def files(self):
         return self.all_files.all()
@@ -183,9 +435,9 @@ class Folder(models.Model, mixins.IconsMixin):
                         'user': request.user,
                     }
 
-                # This calls methods on the manager i.e. get_read_id_list()
+                # This calls methods on the manager i.e. get_read_ranges()
                 func = getattr(FolderPermission.objects,
-                               "get_%s_id_list" % permission_type)
+                               "get_%s_ranges" % permission_type)
                 permission = func(user)
                 if permission == "All":
                     self.permission_cache[permission_type] = True
@@ -193,7 +445,7 @@ class Folder(models.Model, mixins.IconsMixin):
                     self.permission_cache['edit'] = True
                     self.permission_cache['add_children'] = True
                 else:
-                    self.permission_cache[permission_type] = self.id in permission
+                    self.permission_cache[permission_type] = self in permission
             return self.permission_cache[permission_type]
 
     def get_admin_url_path(self):
@@ -207,6 +459,30 @@ class Folder(models.Model, mixins.IconsMixin):
     def __str__(self):
         return "%s" % (self.name,)
 
+    def save(self, *args, **kwargs):
+        # the counters are only changed in the database, the values of the
+        # instance may be outdated
+        stored_counters = (self.pk is not None and not self._state.adding and
+                           not kwargs.get('force_insert') and
+                           kwargs.get('update_fields') is None)
+        if stored_counters and not DJANGO_1_4:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.local_fields
+                if not field.primary_key and field.name not in COUNTER_FIELDS]
+        # the counters of the (old and new) ancestors are updated along with
+        # the folder
+        with atomic():
+            if stored_counters and DJANGO_1_4:
+                # without update_fields, the stored counters are written back
+                # (the row is locked until the folder is saved)
+                counters = Folder.objects.select_for_update().filter(
+                    pk=self.pk).values_list(*COUNTER_FIELDS)
+                for values in counters:
+                    for name, value in zip(COUNTER_FIELDS, values):
+                        setattr(self, name, value)
+            super(Folder, self).save(*args, **kwargs)
+    save.alters_data = True
+
     def contains_folder(self, folder_name):
         try:
             self.children.get(name=folder_name)
@@ -230,6 +506,58 @@ except mptt.AlreadyRegistered:
     pass
 
 
+COUNTER_FIELDS = ('_file_count', '_children_count', '_total_file_count',
+                  '_total_size')
+
+
+def compute_folder_counters(folder_model, file_model):
+    """
+    Returns the counters of all the folders computed from scratch, as a dict
+    of ``folder id: (file count, subfolder count, total file count, total
+    size)``.
+    """
+    parents = dict(folder_model.objects.values_list('id', 'parent_id'))
+    counters = dict((pk, [0, 0, 0, 0]) for pk in parents)
+    for parent_id in parents.values():
+        if parent_id in counters:
+            counters[parent_id][1] += 1
+    rows = file_model.objects.filter(folder__isnull=False).values('folder').annotate(
+        count=Count('id'), size=Sum('_file_size')).order_by()
+    for row in rows:
+        folder_id, count, size = row['folder'], row['count'], row['size'] or 0
+        counters[folder_id][0] = count
+        while folder_id is not None:
+            counters[folder_id][2] += count
+            counters[folder_id][3] += size
+            folder_id = parents[folder_id]
+    return dict((pk, tuple(values)) for pk, values in counters.items())
+
+
+def check_folder_counters(folder_model, file_model):
+    """
+    Returns the ids of the folders whose stored counters are wrong.
+    """
+    expected = compute_folder_counters(folder_model, file_model)
+    stored = folder_model.objects.values_list('id', *COUNTER_FIELDS)
+    return sorted(row[0] for row in stored
+                  if expected.get(row[0]) != tuple(row[1:]))
+
+
+def rebuild_folder_counters(folder_model, file_model):
+    """
+    Stores the counters of the folders whose counters are wrong, returns
+    their ids.
+    """
+    expected = compute_folder_counters(folder_model, file_model)
+    stored = folder_model.objects.values_list('id', *COUNTER_FIELDS)
+    wrong = sorted(row[0] for row in stored
+                   if expected.get(row[0]) != tuple(row[1:]))
+    for pk in wrong:
+        folder_model.objects.filter(pk=pk).update(
+            **dict(zip(COUNTER_FIELDS, expected[pk])))
+    return wrong
+
+
 @python_2_unicode_compatible
 class FolderPermission(models.Model):
     ALL = 0
@@ -308,3 +636,100 @@ class FolderPermission(models.Model):
         verbose_name = _('folder permission')
         verbose_name_plural = _('folder permissions')
         app_label = 'filer'
+
+
+# the folders being deleted in this thread
+_deleted_folders = threading.local()
+
+
+def folder_permission_changed(sender, instance, **kwargs):
+    permission_cache.bump_version()
+
+
+def folder_pre_delete(sender, instance, **kwargs):
+    if not hasattr(_deleted_folders, 'ids'):
+        _deleted_folders.ids = set()
+    _deleted_folders.ids.add(instance.pk)
+    # the subtree counters to subtract from the ancestors, the files deleted
+    # along with the folder are not subtracted one by one
+    instance._deleted_totals = list(Folder.objects.filter(pk=instance.pk).values_list(
+        '_total_file_count', '_total_size')[:1])
+
+
+def folder_post_delete(sender, instance, **kwargs):
+    deleted_ids = getattr(_deleted_folders, 'ids', set())
+    deleted_ids.discard(instance.pk)
+    if instance.parent_id not in deleted_ids:
+        total_files, total_size = (getattr(instance, '_deleted_totals', None) or
+                                   [(0, 0)])[0]
+        Folder.objects.add_to_counters(
+            instance.parent_id, children=-1, total_files=-total_files,
+            total_size=-total_size)
+    # the tree positions of the remaining folders changed
+    permission_cache.bump_version()
+
+
+def update_parent_counters(folder, created, old_parent_id=None):
+    """
+    Counts a folder that was just created (or moved from the folder
+    ``old_parent_id``) in the counters of its parent and ancestors.
+    """
+    total_files = total_size = 0
+    if not created:
+        total_files, total_size = Folder.objects.filter(pk=folder.pk).values_list(
+            '_total_file_count', '_total_size')[0]
+        Folder.objects.add_to_counters(old_parent_id, children=-1,
+                                       total_files=-total_files,
+                                       total_size=-total_size)
+    Folder.objects.add_to_counters(folder.parent_id, children=1,
+                                   total_files=total_files, total_size=total_size)
+
+
+def folder_saved(sender, instance, created, **kwargs):
+    if not created and instance.parent_id == instance._old_parent_id:
+        return
+    old_parent_id = instance._old_parent_id
+    instance._old_parent_id = instance.parent_id
+    if not kwargs.get('raw'):
+        # loaded fixtures come with their counters
+        update_parent_counters(instance, created, old_parent_id)
+    # the tree positions of other folders changed as well
+    permission_cache.bump_version()
+
+
+def _user_model():
+    try:
+        from django.contrib.auth import get_user_model
+    except ImportError:  # Django < 1.5
+        return auth_models.User
+    return get_user_model()
+
+
+def group_membership_changed(sender, action, **kwargs):
+    groups = getattr(_user_model(), 'groups', None)
+    if action in ('post_add', 'post_remove', 'post_clear') and \
+            groups is not None and sender is groups.through:
+        permission_cache.bump_version()
+
+
+def user_created_or_deleted(sender, **kwargs):
+    # the primary key of a deleted user may be used again
+    if kwargs.get('created', True) and sender is _user_model():
+        permission_cache.bump_version()
+
+models.signals.post_save.connect(folder_permission_changed, sender=FolderPermission,
+                                 dispatch_uid='filer_folder_permission_saved')
+models.signals.post_delete.connect(folder_permission_changed, sender=FolderPermission,
+                                   dispatch_uid='filer_folder_permission_deleted')
+models.signals.post_save.connect(folder_saved, sender=Folder,
+                                 dispatch_uid='filer_folder_saved')
+models.signals.pre_delete.connect(folder_pre_delete, sender=Folder,
+                                  dispatch_uid='filer_folder_pre_delete')
+models.signals.post_delete.connect(folder_post_delete, sender=Folder,
+                                   dispatch_uid='filer_folder_post_delete')
+models.signals.m2m_changed.connect(group_membership_changed,
+                                   dispatch_uid='filer_group_membership_changed')
+models.signals.post_save.connect(user_created_or_deleted,
+                                 dispatch_uid='filer_user_created')
+models.signals.post_delete.connect(user_created_or_deleted,
+                                   dispatch_uid='filer_user_deleted')
@@ -0,0 +1,145 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, models, transaction
+from django.utils.timezone import now
+from django.utils.translation import ugettext_lazy as _
+
+from filer import settings as filer_settings
+from filer.utils.compatibility import python_2_unicode_compatible
+from filer.utils.loader import load_object
+
+
+logger = logging.getLogger("filer")
+
+
+class JobManager(models.Manager):
+    def enqueue(self, task, owner=None, **kwargs):
+        """
+        Queues a call of the function ``task`` (a dotted path) with the
+        (json serializable) keyword arguments ``kwargs``. Only ``owner`` (and
+        superusers) may follow its status in the admin.
+        """
+        return self.create(task=task, owner=owner, payload=json.dumps(kwargs))
+
+    def claim(self, limit=1):
+        """
+        Marks up to ``limit`` due jobs as running and returns them. A job is
+        only ever claimed by one worker.
+        """
+        queued = self.filter(status=Job.QUEUED, run_after__lte=now()).order_by(
+            'run_after', 'pk')
+        connection = connections[self.db]
+        if getattr(connection.features, 'has_select_for_update_skip_locked', False):
+            with transaction.atomic(using=self.db):
+                jobs = list(queued.select_for_update(skip_locked=True)[:limit])
+                self.filter(pk__in=[job.pk for job in jobs]).update(
+                    status=Job.RUNNING, attempts=models.F('attempts') + 1,
+                    modified_at=now())
+        else:
+            jobs = []
+            for job in queued[:limit]:
+                # Only one worker can switch the job from queued to running
+                if self.filter(pk=job.pk, status=Job.QUEUED).update(
+                        status=Job.RUNNING, attempts=models.F('attempts') + 1,
+                        modified_at=now()):
+                    jobs.append(job)
+        for job in jobs:
+            job.status = Job.RUNNING
+            job.attempts += 1
+        return jobs
+
+    def requeue_stale(self):
+        """
+        Queues jobs again whose worker died while running them (or fails them
+        if they ran out of attempts).
+        """
+        stale = self.filter(
+            status=Job.RUNNING,
+            modified_at__lt=now() - timedelta(seconds=filer_settings.FILER_JOB_TIMEOUT))
+        failed = stale.filter(attempts__gte=filer_settings.FILER_JOB_MAX_ATTEMPTS).update(
+            status=Job.FAILED, last_error='Timed out', modified_at=now())
+        return failed + stale.update(status=Job.QUEUED, modified_at=now())
+
+
+@python_2_unicode_compatible
+class Job(models.Model):
+    """
+    A function call that is run in the background by ``manage.py filer_worker``.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, _('queued')),
+        (RUNNING, _('running')),
+        (DONE, _('done')),
+        (FAILED, _('failed')),
+    )
+
+    task = models.CharField(_('task'), max_length=255)
+    owner = models.ForeignKey(getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
+                              verbose_name=_('owner'), related_name='+',
+                              null=True, blank=True)
+    payload = models.TextField(_('payload'), blank=True, default='{}')
+    result = models.TextField(_('result'), blank=True, default='')
+    status = models.CharField(_('status'), max_length=10, choices=STATUS_CHOICES,
+        default=QUEUED, db_index=True)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    run_after = models.DateTimeField(_('run after'), default=now, db_index=True)
+    last_error = models.TextField(_('last error'), blank=True, default='')
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    modified_at = models.DateTimeField(_('modified at'), auto_now=True)
+
+    objects = JobManager()
+
+    def __str__(self):
+        return "%s (%s)" % (self.task, self.status)
+
+    @property
+    def is_finished(self):
+        return self.status in (Job.DONE, Job.FAILED)
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else None
+
+    def get_retry_delay(self):
+        """
+        Seconds to wait before the next attempt, doubled after each failure.
+        """
+        delay = filer_settings.FILER_JOB_RETRY_DELAY * 2 ** max(self.attempts - 1, 0)
+        return min(delay, filer_settings.FILER_JOB_MAX_RETRY_DELAY)
+
+    def run(self):
+        """
+        Runs a claimed job and records its outcome.
+        """
+        try:
+            task = load_object(self.task)
+            result = task(**json.loads(self.payload or '{}'))
+        except Exception:
+            self.last_error = traceback.format_exc()
+            if self.attempts < filer_settings.FILER_JOB_MAX_ATTEMPTS:
+                self.status = Job.QUEUED
+                self.run_after = now() + timedelta(seconds=self.get_retry_delay())
+            else:
+                self.status = Job.FAILED
+            if filer_settings.FILER_ENABLE_LOGGING:
+                logger.error('Job %s failed: %s', self.pk, self.last_error)
+        else:
+            self.status = Job.DONE
+            self.result = json.dumps(result) if result is not None else ''
+        self.save()
+    run.alters_data = True
+
+    class Meta:
+        app_label = 'filer'
+        verbose_name = _('job')
+        verbose_name_plural = _('jobs')
@@ -9,6 +9,14 @@ class IconsMixin(object):
     """
     @property
     def icons(self):
+        return self.static_icons
+
+    @property
+    def static_icons(self):
+        """
+        The icons that do not depend on the content of the file, e.g. to be
+        shown while the thumbnails of an image are generated.
+        """
         r = {}
         if getattr(self, '_icon', False):
             for size in FILER_ADMIN_ICON_SIZES:
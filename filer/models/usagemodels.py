@@ -0,0 +1,79 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import models
+from django.utils.timezone import now
+from django.utils.translation import ugettext_lazy as _
+
+from filer.models.filemodels import File, get_owner_username_field
+from filer.utils.compatibility import atomic, python_2_unicode_compatible
+
+
+class OwnerUsageManager(models.Manager):
+    def refresh(self):
+        """
+        Computes the storage used by each owner again (with one GROUP BY
+        query) and replaces the stored rows. Returns the number of owners.
+        """
+        computed_at = now()
+        rows = [OwnerUsage(owner_id=row['owner'], file_count=row['count'],
+                           total_size=row['total_size'] or 0,
+                           computed_at=computed_at)
+                for row in File.objects.owner_usage()]
+        with atomic(using=self.db):
+            self.all().delete()
+            self.bulk_create(rows)
+        return len(rows)
+
+    def report(self, folder=None, live=False):
+        """
+        Returns the storage used by each owner of files in ``folder`` and
+        its subfolders (or of any file) as a list of dicts (``owner``,
+        ``owner_name``, ``count`` and ``total_size``), the largest total size
+        first, and the time the usage was computed at.
+
+        The usage of all the files is read from the stored rows if there are
+        any, unless ``live`` is True. The usage of a folder is always
+        computed from the files (the computation time is then None).
+        """
+        if folder is None and not live:
+            rows = list(self.values(
+                'owner', 'file_count', 'total_size', 'computed_at',
+                get_owner_username_field()).order_by('-total_size', 'owner'))
+            if rows:
+                return [{'owner': row['owner'],
+                         'owner_name': row[get_owner_username_field()],
+                         'count': row['file_count'],
+                         'total_size': row['total_size']}
+                        for row in rows], rows[0]['computed_at']
+        rows = []
+        for row in File.objects.owner_usage(folder):
+            row['total_size'] = row['total_size'] or 0
+            rows.append(row)
+        return rows, None
+
+
+@python_2_unicode_compatible
+class OwnerUsage(models.Model):
+    """
+    The storage used by the files of an owner (``owner`` is empty for the
+    files without owner), as computed by ``OwnerUsage.objects.refresh()``,
+    e.g. periodically with ``manage.py filer_usage --refresh``.
+    """
+    owner = models.ForeignKey(getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
+                              verbose_name=_('owner'), related_name='+',
+                              null=True, blank=True)
+    file_count = models.IntegerField(_('file count'), default=0)
+    total_size = models.BigIntegerField(_('total size'), default=0)
+    computed_at = models.DateTimeField(_('computed at'))
+
+    objects = OwnerUsageManager()
+
+    def __str__(self):
+        return "%s: %s bytes" % (self.owner_id, self.total_size)
+
+    class Meta:
+        app_label = 'filer'
+        verbose_name = _('owner usage')
+        verbose_name_plural = _('owner usage')
@@ -0,0 +1,45 @@
+#-*- coding: utf-8 -*-
+"""
+The full-text search of the files and folders used by the admin.
+
+``get_search_backend()`` returns the backend of ``FILER_SEARCH_BACKEND``, or
+else the best one for the database: SQLite FTS5 tables, PostgreSQL
+``tsvector`` documents with a GIN index, or an inverted index kept in the
+memory of each process for the other databases::
+
+    backend = get_search_backend()
+    files = backend.filter(File.objects.all(), 'holiday beach')
+    ranked = backend.search(File, 'holiday', folder=folder, limit=10)
+"""
+import threading
+
+from django.db import connection
+
+from filer import settings as filer_settings
+from filer.search.backends.base import get_owner_search_fields, tokenize
+from filer.utils.loader import load_object
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def get_default_backend_path():
+    if connection.vendor == 'postgresql':
+        return 'filer.search.backends.postgresql.PostgresSearchBackend'
+    if connection.vendor == 'sqlite':
+        from filer.search.backends.sqlite import SqliteSearchBackend
+        if SqliteSearchBackend.is_available(connection):
+            return 'filer.search.backends.sqlite.SqliteSearchBackend'
+    return 'filer.search.backends.memory.MemorySearchBackend'
+
+
+def get_search_backend():
+    """
+    Returns the search backend (an instance shared by all the threads).
+    """
+    path = filer_settings.FILER_SEARCH_BACKEND
+    with _lock:
+        if path not in _backends:
+            backend_path = path or get_default_backend_path()
+            _backends[path] = load_object(backend_path)()
+        return _backends[path]
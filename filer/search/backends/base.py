@@ -0,0 +1,215 @@
+#-*- coding: utf-8 -*-
+import operator
+import re
+import unicodedata
+from functools import reduce
+
+from django.db import connections, models, router
+from django.utils.encoding import force_text
+
+# words, split on punctuation and underscores like the unicode61 tokenizer of
+# SQLite does
+TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+# The columns of the indexed documents and their weights in the ranking
+COLUMNS = ('title', 'body', 'owner')
+COLUMN_WEIGHTS = {'title': 10.0, 'body': 5.0, 'owner': 1.0}
+
+# The fields of the indexed files and folders, by column
+DOCUMENT_FIELDS = {
+    'file': {'title': ('name', 'original_filename'), 'body': ('description',)},
+    'folder': {'title': ('name',), 'body': ()},
+}
+
+# The number of documents written to the index at once
+BATCH_SIZE = 500
+
+
+def tokenize(text):
+    """
+    Returns the lowercase words of ``text``, without diacritics.
+    """
+    text = unicodedata.normalize('NFKD', force_text(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+
+def get_indexed_model(model):
+    """
+    Returns the indexed model of ``model``, ``File`` for its subclasses.
+    """
+    for candidate in [model] + list(model._meta.get_parent_list()):
+        if candidate._meta.object_name.lower() in DOCUMENT_FIELDS:
+            return candidate
+    raise ValueError('%s is not indexed' % model._meta.object_name)
+
+
+def get_owner_model(model):
+    return model._meta.get_field('owner').rel.to
+
+
+def get_owner_search_fields(user_model=None):
+    """
+    Returns all the fields that are CharFields except for password from the
+    User model.  For the built-in User model, that means username,
+    first_name, last_name, and email.
+    """
+    if user_model is None:
+        try:
+            from django.contrib.auth import get_user_model
+        except ImportError:  # Django < 1.5
+            from django.contrib.auth.models import User as user_model
+        else:
+            user_model = get_user_model()
+    return [
+        field.name for field in user_model._meta.fields
+        if isinstance(field, models.CharField) and field.name != 'password'
+    ]
+
+
+def get_documents(model, pks=None):
+    """
+    Yields the ``(pk, title, body, owner)`` documents of the files or folders
+    ``pks`` (all of them by default) of the indexed ``model``, as space
+    separated tokens, with one query for each batch of them.
+    """
+    fields = DOCUMENT_FIELDS[model._meta.object_name.lower()]
+    owner_fields = ['owner__%s' % field
+                    for field in get_owner_search_fields(get_owner_model(model))]
+    columns = [fields['title'], fields['body'], owner_fields]
+    values = ['pk'] + [field for column in columns for field in column]
+    queryset = model._default_manager.all()
+    if pks is None:
+        batches = [queryset.order_by('pk').values_list(*values).iterator()]
+    else:
+        pks = list(pks)
+        batches = (queryset.filter(pk__in=pks[i:i + BATCH_SIZE]).values_list(*values)
+                   for i in range(0, len(pks), BATCH_SIZE))
+    for batch in batches:
+        for row in batch:
+            document, offset = [row[0]], 1
+            for column in columns:
+                document.append(' '.join(
+                    token for value in row[offset:offset + len(column)]
+                    for token in tokenize(value)))
+                offset += len(column)
+            yield tuple(document)
+
+
+class SearchBackend(object):
+    """
+    A full-text index of the files and folders, searched by the admin. The
+    index is kept up to date when files, folders and their owners are saved
+    or deleted (not by ``QuerySet.update()`` or raw SQL, run the
+    ``filer_rebuild_search_index`` management command after those).
+
+    Each file and folder is indexed as a document with a ``title`` (the name
+    and the original filename), a ``body`` (the description) and an
+    ``owner`` (the CharFields of the owner). A query matches the documents
+    that contain every word of the query, or a word starting with it.
+    """
+    # whether the filtered querysets are ranked in the database, as their
+    # ``search_rank``
+    ranks_in_database = False
+
+    # the largest number of matches of a query, None if all of them are
+    # returned
+    max_matches = None
+
+    def get_connection(self, model):
+        return connections[router.db_for_write(model)]
+
+    def is_installed(self, file_model, folder_model):
+        """
+        Returns True if the index of the files and folders exists.
+        """
+        return True
+
+    def install(self, file_model, folder_model):
+        """
+        Creates the index of the files and folders.
+        """
+
+    def uninstall(self, file_model, folder_model):
+        """
+        Drops the index of the files and folders.
+        """
+
+    def update(self, model, pks):
+        """
+        Indexes (again) the files or folders ``pks`` of ``model``.
+        """
+        raise NotImplementedError
+
+    def remove(self, model, pks):
+        """
+        Removes the files or folders ``pks`` of ``model`` from the index.
+        """
+        raise NotImplementedError
+
+    def rebuild(self, file_model, folder_model):
+        """
+        Indexes all the files and folders again.
+        """
+        raise NotImplementedError
+
+    def match(self, queryset, tokens, columns=COLUMNS, rank=True):
+        """
+        Returns the objects of ``queryset`` with a word of the ``columns`` of
+        their document starting with each of the ``tokens``, with their
+        ``search_rank`` if ``rank`` is set and the backend ranks in the
+        database.
+        """
+        raise NotImplementedError
+
+    def filter(self, queryset, query, owner_fields=None):
+        """
+        Returns the files or folders of ``queryset`` matching ``query``. If
+        ``owner_fields`` is given, the owners are only matched by the start
+        of those fields, without the index if they are not the indexed ones.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset
+        if owner_fields is None or list(owner_fields) == get_owner_search_fields():
+            return self.match(queryset, tokens)
+        owner_model = get_owner_model(queryset.model)
+        unranked = queryset.model._default_manager.all()
+        for token in tokens:
+            q = models.Q(pk__in=self.match(
+                unranked, [token], ('title', 'body'), rank=False).values('pk'))
+            if owner_fields:
+                q |= models.Q(owner__in=owner_model._default_manager.filter(reduce(
+                    operator.or_, [models.Q(**{'%s__istartswith' % field: token})
+                                   for field in owner_fields])))
+            queryset = queryset.filter(q)
+        return queryset
+
+    def scope(self, queryset, folder):
+        """
+        Limits ``queryset`` to the files in the subtree of ``folder``, or to
+        the subfolders of ``folder``.
+        """
+        if get_indexed_model(queryset.model)._meta.object_name.lower() == 'folder':
+            return queryset.filter(tree_id=folder.tree_id, lft__gt=folder.lft,
+                                   rght__lt=folder.rght)
+        return queryset.filter(folder__tree_id=folder.tree_id,
+                               folder__lft__gte=folder.lft,
+                               folder__rght__lte=folder.rght)
+
+    def search(self, model, query, folder=None, limit=None):
+        """
+        Returns the ``(pk, rank)`` of the files or folders of ``model``
+        matching ``query`` (in the subtree of ``folder`` if it is given), the
+        best matches first.
+        """
+        queryset = model._default_manager.all()
+        if folder is not None:
+            queryset = self.scope(queryset, folder)
+        queryset = self.filter(queryset, query)
+        if 'search_rank' not in queryset.query.extra_select:
+            # nothing to rank
+            return [(pk, 0.0) for pk in
+                    queryset.order_by('pk').values_list('pk', flat=True)[:limit]]
+        return list(queryset.order_by('-search_rank', 'pk').values_list(
+            'pk', 'search_rank')[:limit])
@@ -0,0 +1,232 @@
+#-*- coding: utf-8 -*-
+import bisect
+import threading
+import uuid
+
+from django.core.cache import cache
+
+from filer.search.backends.base import (COLUMNS, COLUMN_WEIGHTS, SearchBackend,
+                                        get_documents, get_indexed_model,
+                                        tokenize)
+
+# The number of the last change, the changes and the generation of the
+# journal (changed when the index is rebuilt)
+SEQUENCE_KEY = 'filer:search:sequence'
+CHANGE_KEY = 'filer:search:change:%d'
+GENERATION_KEY = 'filer:search:generation'
+
+# The bit of each column in the postings
+COLUMN_BITS = dict((column, 1 << i) for i, column in enumerate(COLUMNS))
+
+
+class InvertedIndex(object):
+    """
+    The documents containing each word, and the columns it appears in (as a
+    bit mask). The words are also kept sorted, to find those starting with a
+    prefix.
+    """
+    def __init__(self):
+        self.postings = {}
+        self.documents = {}
+        self.tokens = []
+
+    def add(self, pk, *columns):
+        self.remove(pk)
+        masks = {}
+        for column, text in zip(COLUMNS, columns):
+            for token in text.split():
+                masks[token] = masks.get(token, 0) | COLUMN_BITS[column]
+        for token, mask in masks.items():
+            if token not in self.postings:
+                self.postings[token] = {}
+                bisect.insort(self.tokens, token)
+            self.postings[token][pk] = mask
+        self.documents[pk] = list(masks)
+
+    def remove(self, pk):
+        for token in self.documents.pop(pk, ()):
+            postings = self.postings[token]
+            del postings[pk]
+            if not postings:
+                del self.postings[token]
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def lookup(self, prefix, columns=COLUMNS):
+        """
+        Returns the score of the documents with a word of ``columns``
+        starting with ``prefix``.
+        """
+        weights = [(COLUMN_BITS[column], COLUMN_WEIGHTS[column]) for column in columns]
+        scores = {}
+        i = bisect.bisect_left(self.tokens, prefix)
+        while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+            for pk, mask in self.postings[self.tokens[i]].items():
+                score = sum(weight for bit, weight in weights if mask & bit)
+                if score > scores.get(pk, 0):
+                    scores[pk] = score
+            i += 1
+        return scores
+
+    def search(self, tokens, columns=COLUMNS):
+        """
+        Returns the score of the documents matching all the ``tokens``.
+        """
+        scores = None
+        for token in tokens:
+            matches = self.lookup(token, columns)
+            if scores is None:
+                scores = matches
+            else:
+                scores = dict((pk, score + matches[pk])
+                              for pk, score in scores.items() if pk in matches)
+            if not scores:
+                break
+        return scores or {}
+
+
+class MemorySearchBackend(SearchBackend):
+    """
+    Keeps an inverted index of the files and folders in each process, built
+    from the database the first time it is searched. This is a fallback for
+    databases without full-text search, the matches are not ranked in the
+    database and only the ``max_matches`` best ones are returned.
+
+    The files and folders that changed are written to a journal in the
+    django cache, every process indexes them again (and only them) before
+    its next search. The cache must be shared by all the processes (e.g.
+    memcached or redis, not the default local memory cache), otherwise they
+    do not see the changes made by the others. If the journal is lost or a
+    process fell too far behind, the process builds its index again.
+    """
+    # the largest number of matches returned for a query, the best first
+    max_matches = 500
+    # the number of primary keys looked up in the database at once
+    batch_size = 500
+    # the changes kept in the journal, a process that missed more builds its
+    # index again
+    max_journal = 1000
+    # seconds the changes are kept in the journal
+    journal_timeout = 24 * 3600
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.indexes = {}
+        # the indexed models, by index name
+        self.models = {}
+        self.generation = None
+        self.sequence = 0
+
+    def sync(self):
+        """
+        Applies the changes of the journal to the loaded indexes, or drops
+        them if they can not be brought up to date.
+        """
+        sequence = cache.get(SEQUENCE_KEY)
+        generation = cache.get(GENERATION_KEY)
+        if sequence is None or generation is None:
+            # the cache was cleared
+            cache.add(SEQUENCE_KEY, 0, None)
+            cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+            sequence = cache.get(SEQUENCE_KEY)
+            generation = cache.get(GENERATION_KEY)
+        if generation != self.generation or sequence < self.sequence or \
+                sequence - self.sequence > self.max_journal:
+            self.indexes = {}
+        elif sequence > self.sequence and self.indexes:
+            keys = [CHANGE_KEY % n for n in range(self.sequence + 1, sequence + 1)]
+            changes = cache.get_many(keys)
+            if len(changes) < len(keys):
+                self.indexes = {}
+            else:
+                changed = {}
+                for key in keys:
+                    name, pks = changes[key]
+                    changed.setdefault(name, set()).update(pks)
+                for name, pks in changed.items():
+                    if name in self.indexes:
+                        self.reindex(self.indexes[name], name, pks)
+        self.generation, self.sequence = generation, sequence
+
+    def reindex(self, index, name, pks):
+        for pk in pks:
+            index.remove(pk)
+        for document in get_documents(self.models[name], pks):
+            index.add(*document)
+
+    def get_index(self, model):
+        model = get_indexed_model(model)
+        name = model._meta.object_name.lower()
+        with self.lock:
+            self.sync()
+            if name not in self.indexes:
+                index = InvertedIndex()
+                for document in get_documents(model):
+                    index.add(*document)
+                self.indexes[name] = index
+            self.models[name] = model
+            return self.indexes[name]
+
+    def log_change(self, model, pks):
+        """
+        Writes the files or folders ``pks`` of ``model`` that changed to the
+        journal.
+        """
+        model = get_indexed_model(model)
+        name = model._meta.object_name.lower()
+        self.models[name] = model
+        cache.add(SEQUENCE_KEY, 0, None)
+        try:
+            sequence = cache.incr(SEQUENCE_KEY)
+        except ValueError:
+            # evicted in the meantime, the indexes are built again
+            cache.add(SEQUENCE_KEY, 0, None)
+            return
+        cache.set(CHANGE_KEY % sequence, (name, list(pks)), self.journal_timeout)
+
+    def update(self, model, pks):
+        self.log_change(model, pks)
+
+    def remove(self, model, pks):
+        self.log_change(model, pks)
+
+    def rebuild(self, file_model, folder_model):
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+    def select(self, queryset, scores, limit):
+        """
+        Returns the primary keys of up to ``limit`` objects of ``queryset``
+        among the matches ``scores``, the best first. They are looked up in
+        batches instead of with one unbounded ``IN`` list.
+        """
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], pk))
+        selected = []
+        for i in range(0, len(ranked), self.batch_size):
+            batch = ranked[i:i + self.batch_size]
+            found = set(queryset.filter(pk__in=batch).values_list('pk', flat=True))
+            selected.extend(pk for pk in batch if pk in found)
+            if limit is not None and len(selected) >= limit:
+                return selected[:limit]
+        return selected
+
+    def match(self, queryset, tokens, columns=COLUMNS, rank=True):
+        scores = self.get_index(queryset.model).search(tokens, columns)
+        pks = self.select(queryset, scores, self.max_matches)
+        if not pks:
+            return queryset.none()
+        qn = self.get_connection(queryset.model).ops.quote_name
+        pk_column = '%s.%s' % (qn(queryset.model._meta.db_table),
+                               qn(queryset.model._meta.pk.column))
+        # integers written in the query, rather than a parameter per match
+        return queryset.extra(where=['%s IN (%s)' % (
+            pk_column, ', '.join('%d' % pk for pk in pks))])
+
+    def search(self, model, query, folder=None, limit=None):
+        tokens = tokenize(query)
+        queryset = model._default_manager.all()
+        if folder is not None:
+            queryset = self.scope(queryset, folder)
+        if not tokens:
+            return [(pk, 0.0) for pk in
+                    queryset.order_by('pk').values_list('pk', flat=True)[:limit]]
+        scores = self.get_index(model).search(tokens)
+        return [(pk, scores[pk]) for pk in self.select(queryset, scores, limit)]
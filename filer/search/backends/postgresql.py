@@ -0,0 +1,111 @@
+#-*- coding: utf-8 -*-
+from filer.search.backends.base import (BATCH_SIZE, COLUMNS, SearchBackend,
+                                        get_documents, get_indexed_model)
+
+# The tsvector weights of the columns
+COLUMN_LABELS = {'title': 'A', 'body': 'B', 'owner': 'C'}
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Indexes the files and folders in tables of weighted ``tsvector``
+    documents with a GIN index (``filer_file_search`` and
+    ``filer_folder_search``), matched with prefix queries and ranked with
+    ``ts_rank``. The words are not stemmed (the ``simple`` configuration),
+    file names are seldom written in a single language.
+    """
+    ranks_in_database = True
+
+    def get_table(self, model):
+        return '%s_search' % get_indexed_model(model)._meta.db_table
+
+    def is_installed(self, file_model, folder_model):
+        for model in (file_model, folder_model):
+            connection = self.get_connection(model)
+            if self.get_table(model) not in connection.introspection.table_names():
+                return False
+        return True
+
+    def install(self, file_model, folder_model):
+        for model in (file_model, folder_model):
+            connection = self.get_connection(model)
+            qn = connection.ops.quote_name
+            table = self.get_table(model)
+            cursor = connection.cursor()
+            # without IF NOT EXISTS, which older servers do not support
+            if table not in connection.introspection.table_names(cursor):
+                cursor.execute('CREATE TABLE %s (id integer PRIMARY KEY, '
+                               'document tsvector NOT NULL)' % qn(table))
+            cursor.execute('SELECT 1 FROM pg_indexes WHERE tablename = %s AND indexname = %s',
+                           [table, '%s_document' % table])
+            if cursor.fetchone() is None:
+                cursor.execute('CREATE INDEX %s ON %s USING gin (document)' % (
+                    qn('%s_document' % table), qn(table)))
+
+    def uninstall(self, file_model, folder_model):
+        for model in (file_model, folder_model):
+            connection = self.get_connection(model)
+            connection.cursor().execute('DROP TABLE IF EXISTS %s' % (
+                connection.ops.quote_name(self.get_table(model))))
+
+    def update(self, model, pks):
+        pks = list(pks)
+        self.remove(model, pks)
+        self.insert(model, pks)
+
+    def insert(self, model, pks=None):
+        connection = self.get_connection(model)
+        document = ' || '.join("setweight(to_tsvector('simple', %%s), '%s')" % (
+            COLUMN_LABELS[column]) for column in COLUMNS)
+        sql = 'INSERT INTO %s (id, document) VALUES (%%s, %s)' % (
+            connection.ops.quote_name(self.get_table(model)), document)
+        cursor = connection.cursor()
+        batch = []
+        for row in get_documents(get_indexed_model(model), pks):
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+    def remove(self, model, pks):
+        pks = list(pks)
+        if not pks:
+            return
+        connection = self.get_connection(model)
+        connection.cursor().execute('DELETE FROM %s WHERE id = ANY(%%s)' % (
+            connection.ops.quote_name(self.get_table(model))), [pks])
+
+    def rebuild(self, file_model, folder_model):
+        for model in (file_model, folder_model):
+            connection = self.get_connection(model)
+            connection.cursor().execute('TRUNCATE %s' % (
+                connection.ops.quote_name(self.get_table(model))))
+            self.insert(model)
+
+    def get_tsquery(self, tokens, columns=COLUMNS):
+        """
+        Returns the ``tsquery`` of the documents with a word of ``columns``
+        starting with each of the ``tokens``.
+        """
+        labels = ''.join(COLUMN_LABELS[column] for column in columns)
+        return ' & '.join("'%s':*%s" % (token.replace("'", "''"), labels)
+                          for token in tokens)
+
+    def match(self, queryset, tokens, columns=COLUMNS, rank=True):
+        qn = self.get_connection(queryset.model).ops.quote_name
+        table = qn(self.get_table(queryset.model))
+        pk_column = '%s.%s' % (qn(queryset.model._meta.db_table),
+                               qn(queryset.model._meta.pk.column))
+        tsquery = self.get_tsquery(tokens, columns)
+        queryset = queryset.extra(
+            where=["%s IN (SELECT id FROM %s WHERE document @@ to_tsquery('simple', %%s))" % (
+                pk_column, table)],
+            params=[tsquery])
+        if not rank:
+            return queryset
+        rank_sql = "(SELECT ts_rank(document, to_tsquery('simple', %%s)) FROM %s WHERE id = %s)" % (
+            table, pk_column)
+        return queryset.extra(select={'search_rank': rank_sql},
+                              select_params=[tsquery])
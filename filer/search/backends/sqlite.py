@@ -0,0 +1,118 @@
+#-*- coding: utf-8 -*-
+from django.db import DatabaseError
+
+from filer.search.backends.base import (BATCH_SIZE, COLUMNS, COLUMN_WEIGHTS,
+                                        SearchBackend, get_documents,
+                                        get_indexed_model)
+
+
+class SqliteSearchBackend(SearchBackend):
+    """
+    Indexes the files and folders in SQLite FTS5 tables (``filer_file_search``
+    and ``filer_folder_search``), whose rowid is the primary key of the file
+    or folder. Prefixes of 2 and 3 characters are indexed as well, and the
+    matches are ranked with ``bm25``.
+    """
+    ranks_in_database = True
+
+    @classmethod
+    def is_available(cls, connection):
+        """
+        Returns True if the SQLite library of ``connection`` has FTS5.
+        """
+        cursor = connection.cursor()
+        try:
+            cursor.execute('CREATE VIRTUAL TABLE temp.filer_fts5_check USING fts5(x)')
+            cursor.execute('DROP TABLE temp.filer_fts5_check')
+        except DatabaseError:
+            return False
+        return True
+
+    def get_table(self, model):
+        return '%s_search' % get_indexed_model(model)._meta.db_table
+
+    def is_installed(self, file_model, folder_model):
+        for model in (file_model, folder_model):
+            connection = self.get_connection(model)
+            if self.get_table(model) not in connection.introspection.table_names():
+                return False
+        return True
+
+    def install(self, file_model, folder_model):
+        for model in (file_model, folder_model):
+            connection = self.get_connection(model)
+            connection.cursor().execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, "
+                "tokenize='unicode61 remove_diacritics 1', prefix='2 3')" % (
+                    connection.ops.quote_name(self.get_table(model)),
+                    ', '.join(COLUMNS)))
+
+    def uninstall(self, file_model, folder_model):
+        for model in (file_model, folder_model):
+            connection = self.get_connection(model)
+            connection.cursor().execute('DROP TABLE IF EXISTS %s' % (
+                connection.ops.quote_name(self.get_table(model))))
+
+    def update(self, model, pks):
+        pks = list(pks)
+        self.remove(model, pks)
+        self.insert(model, pks)
+
+    def insert(self, model, pks=None):
+        connection = self.get_connection(model)
+        sql = 'INSERT INTO %s (rowid, %s) VALUES (%%s, %s)' % (
+            connection.ops.quote_name(self.get_table(model)), ', '.join(COLUMNS),
+            ', '.join(['%s'] * len(COLUMNS)))
+        cursor = connection.cursor()
+        batch = []
+        for document in get_documents(get_indexed_model(model), pks):
+            batch.append(document)
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+    def remove(self, model, pks):
+        pks = list(pks)
+        connection = self.get_connection(model)
+        table = connection.ops.quote_name(self.get_table(model))
+        cursor = connection.cursor()
+        for i in range(0, len(pks), BATCH_SIZE):
+            batch = pks[i:i + BATCH_SIZE]
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (
+                table, ', '.join(['%s'] * len(batch))), batch)
+
+    def rebuild(self, file_model, folder_model):
+        for model in (file_model, folder_model):
+            connection = self.get_connection(model)
+            connection.cursor().execute('DELETE FROM %s' % (
+                connection.ops.quote_name(self.get_table(model))))
+            self.insert(model)
+
+    def get_match_expression(self, tokens, columns=COLUMNS):
+        """
+        Returns the FTS5 query of the documents with a word of ``columns``
+        starting with each of the ``tokens``.
+        """
+        return '{%s} : (%s)' % (' '.join(columns), ' AND '.join(
+            '"%s"*' % token.replace('"', '""') for token in tokens))
+
+    def match(self, queryset, tokens, columns=COLUMNS, rank=True):
+        qn = self.get_connection(queryset.model).ops.quote_name
+        table = qn(self.get_table(queryset.model))
+        pk_column = '%s.%s' % (qn(queryset.model._meta.db_table),
+                               qn(queryset.model._meta.pk.column))
+        expression = self.get_match_expression(tokens, columns)
+        queryset = queryset.extra(
+            where=['%s IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (
+                pk_column, table, table)],
+            params=[expression])
+        if not rank:
+            return queryset
+        # bm25 is lower for better matches
+        rank_sql = '(SELECT -bm25(%s, %s) FROM %s WHERE %s MATCH %%s AND rowid = %s)' % (
+            table, ', '.join('%.1f' % COLUMN_WEIGHTS[column] for column in COLUMNS),
+            table, table, pk_column)
+        return queryset.extra(select={'search_rank': rank_sql},
+                              select_params=[expression])
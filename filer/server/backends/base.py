@@ -1,9 +1,97 @@
 #-*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from django.http import HttpResponse
 from django.utils.encoding import smart_str
+from django.utils.http import parse_http_date_safe
+from django.views.static import was_modified_since
 import mimetypes
 import os
+import re
+import uuid
+
+try:
+    from django.http import FileResponse
+except ImportError:
+    # django < 1.8
+    FileResponse = None
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # django < 1.5 streams iterators with a normal HttpResponse
+    StreamingHttpResponse = HttpResponse
+
+
+RE_ETAG = re.compile(r'(?:W/)?"[^"]*"')
+
+
+def etag_matches(header, etag):
+    """
+    Returns True if the ``If-None-Match`` header ``header`` matches the
+    entity tag ``etag`` (using the weak comparison).
+    """
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in RE_ETAG.findall(header):
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+
+def parse_range_header(header, size):
+    """
+    Parses a ``Range: bytes=...`` header for a file of ``size`` bytes and
+    returns the list of the requested ``(start, end)`` byte positions (both
+    included). Returns ``None`` if the header is invalid (the whole file
+    should be served) and an empty list if none of the ranges is satisfiable.
+    """
+    units, _, ranges = header.partition('=')
+    if units.strip().lower() != 'bytes':
+        return None
+    result = []
+    for spec in ranges.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        start, sep, end = spec.partition('-')
+        if not sep:
+            return None
+        try:
+            if not start.strip():
+                # suffix range: the last ``end`` bytes
+                length = int(end)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(start)
+                end = int(end) if end.strip() else max(start, size - 1)
+        except ValueError:
+            return None
+        if start < 0 or end < start:
+            return None
+        if start >= size:
+            continue
+        result.append((start, min(end, size - 1)))
+    return result
+
+
+def read_range(file_obj, start, end, chunk_size):
+    """
+    Yields the bytes ``start`` to ``end`` (included) of ``file_obj`` in
+    chunks of at most ``chunk_size`` bytes.
+    """
+    file_obj.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = file_obj.read(min(chunk_size, remaining))
+        if not data:
+            return
+        remaining -= len(data)
+        yield data
 
 
 class ServerBase(object):
@@ -12,12 +100,133 @@ class ServerBase(object):
 
     Warning: this API is EXPERIMENTAL and may change at any time.
     """
+    # bytes read at once when streaming a range of a file
+    chunk_size = 64 * 1024
+    # requests with more ranges get the whole file
+    max_ranges = 20
+
     def get_mimetype(self, path):
         return mimetypes.guess_type(path)[0] or 'application/octet-stream'
 
+    def is_not_modified(self, request, last_modified, size=0):
+        """
+        Handles ``If-Modified-Since``, which is ignored if the request has an
+        ``If-None-Match`` header (those are handled by the views).
+        """
+        if request.META.get('HTTP_IF_NONE_MATCH'):
+            return False
+        return not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                      last_modified, size)
+
+    def get_ranges(self, request, size, last_modified=None, etag=None):
+        """
+        Returns the byte ranges requested by ``request`` (see
+        ``parse_range_header``), or ``None`` if the whole file should be
+        served, e.g. because the ``If-Range`` validator does not match.
+        """
+        header = request.META.get('HTTP_RANGE')
+        if not header or size is None:
+            return None
+        if_range = request.META.get('HTTP_IF_RANGE', '').strip()
+        if if_range:
+            if if_range.startswith('"') or if_range.startswith('W/'):
+                # weak entity tags never match
+                if etag is None or if_range != etag:
+                    return None
+            elif (last_modified is None or
+                    parse_http_date_safe(if_range) != int(last_modified)):
+                return None
+        ranges = parse_range_header(header, size)
+        if ranges is not None and len(ranges) > self.max_ranges:
+            return None
+        return ranges
+
+    def file_response(self, request, stream, size, content_type,
+                      last_modified=None, etag=None, **kwargs):
+        """
+        Returns a response streaming the open (and seekable) file ``stream``
+        of ``size`` bytes, or the byte ranges of it the request asked for.
+        Whole local files are handed to ``wsgi.file_wrapper`` (and therefore
+        to ``sendfile`` on most servers), anything else is read in chunks of
+        ``chunk_size`` bytes. The file is closed with the response.
+        ``kwargs`` are passed on to ``default_headers``.
+        """
+        ranges = self.get_ranges(request, size, last_modified=last_modified, etag=etag)
+        if ranges is None:
+            if FileResponse is not None and self._has_fileno(stream):
+                response = FileResponse(stream)
+            else:
+                response = StreamingHttpResponse(
+                    read_range(stream, 0, size - 1, self.chunk_size))
+            length = size
+        elif not ranges:
+            stream.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%d' % size
+            return response
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response = StreamingHttpResponse(
+                read_range(stream, start, end, self.chunk_size), status=206)
+            response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+            length = end - start + 1
+        else:
+            boundary = uuid.uuid4().hex
+            parts = []
+            length = 0
+            for start, end in ranges:
+                header = ('\r\n--%s\r\nContent-Type: %s\r\n'
+                          'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
+                              boundary, content_type, start, end, size)).encode('ascii')
+                parts.append((header, start, end))
+                length += len(header) + end - start + 1
+            footer = ('\r\n--%s--\r\n' % boundary).encode('ascii')
+            length += len(footer)
+            response = StreamingHttpResponse(
+                self._multipart_content(stream, parts, footer), status=206)
+            content_type = 'multipart/byteranges; boundary=%s' % boundary
+        if not getattr(response, 'file_to_stream', None):
+            # FileResponse closes the file itself
+            closable_objects = getattr(response, '_closable_objects', None)
+            if closable_objects is not None:
+                closable_objects.append(stream)
+        response['Content-Type'] = content_type
+        response['Accept-Ranges'] = 'bytes'
+        kwargs['size'] = length
+        self.default_headers(request=request, response=response, etag=etag, **kwargs)
+        return response
+
+    def _has_fileno(self, stream):
+        # only real files benefit from wsgi.file_wrapper
+        try:
+            stream.fileno()
+        except (AttributeError, EnvironmentError, ValueError):
+            return False
+        return True
+
+    def _multipart_content(self, stream, parts, footer):
+        for header, start, end in parts:
+            yield header
+            for data in read_range(stream, start, end, self.chunk_size):
+                yield data
+        yield footer
+
     def default_headers(self, **kwargs):
         self.save_as_header(**kwargs)
         self.size_header(**kwargs)
+        self.cache_headers(**kwargs)
+
+    def cache_headers(self, response, **kwargs):
+        """
+        Adds the ``ETag`` and ``Cache-Control`` headers if the ``etag`` and
+        ``cache_control`` values are given.
+        """
+        etag = kwargs.get('etag', None)
+        if etag:
+            response['ETag'] = etag
+        cache_control = kwargs.get('cache_control', None)
+        if cache_control:
+            response['Cache-Control'] = cache_control
 
     def save_as_header(self, response, **kwargs):
         """
@@ -32,7 +241,7 @@ class ServerBase(object):
         file_obj = kwargs.get('file_obj', None)
         filename = None
         if save_as is True or save_as is None:
-            filename = os.path.basename(file_obj.path)
+            filename = os.path.basename(file_obj.name)
         else:
             filename = save_as
         response['Content-Disposition'] = smart_str('attachment; filename=%s' % filename)
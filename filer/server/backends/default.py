@@ -1,9 +1,8 @@
 #-*- coding: utf-8 -*-
 import os
 import stat
-from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.http import Http404, HttpResponseNotModified
 from django.utils.http import http_date
-from django.views.static import was_modified_since
 from filer.utils.compatibility import DJANGO_1_4
 from filer.server.backends.base import ServerBase
 
@@ -13,6 +12,9 @@ class DefaultServer(ServerBase):
     Serve static files from the local filesystem through django.
     This is a bad idea for most situations other than testing.
 
+    Files are streamed (through ``wsgi.file_wrapper`` if the server provides
+    it) and byte ranges are supported, so that e.g. videos can be seeked.
+
     This will only work for files that can be accessed in the local filesystem.
     """
     def serve(self, request, file_obj, **kwargs):
@@ -24,12 +26,17 @@ class DefaultServer(ServerBase):
         # Respect the If-Modified-Since header.
         statobj = os.stat(fullpath)
 
-        content_type_key = 'mimetype' if DJANGO_1_4 else 'content_type'
-        response_params = {content_type_key: self.get_mimetype(fullpath)}
-        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
-                                  statobj[stat.ST_MTIME], statobj[stat.ST_SIZE]):
-            return HttpResponseNotModified(**response_params)
-        response = HttpResponse(open(fullpath, 'rb').read(), **response_params)
+        content_type = self.get_mimetype(fullpath)
+        if self.is_not_modified(request, statobj[stat.ST_MTIME], statobj[stat.ST_SIZE]):
+            content_type_key = 'mimetype' if DJANGO_1_4 else 'content_type'
+            response = HttpResponseNotModified(**{content_type_key: content_type})
+            self.cache_headers(response=response, **kwargs)
+            return response
+        # the size of the file on disk, which is what is actually sent
+        kwargs.pop('size', None)
+        # stream the file instead of loading it into memory
+        response = self.file_response(
+            request, open(fullpath, 'rb'), statobj[stat.ST_SIZE], content_type,
+            last_modified=statobj[stat.ST_MTIME], file_obj=file_obj, **kwargs)
         response["Last-Modified"] = http_date(statobj[stat.ST_MTIME])
-        self.default_headers(request=request, response=response, file_obj=file_obj, **kwargs)
         return response
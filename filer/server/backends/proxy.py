@@ -0,0 +1,144 @@
+#-*- coding: utf-8 -*-
+import calendar
+import errno
+import hashlib
+import os
+import tempfile
+import time
+from django.http import Http404, HttpResponseNotModified
+from django.utils.encoding import force_bytes
+from django.utils.http import http_date
+from filer.server.backends.base import ServerBase
+
+
+class StorageProxyServer(ServerBase):
+    """
+    Streams files from their storage through django, in chunks of
+    ``chunk_size`` bytes. Unlike the other backends this works with any
+    storage (e.g. S3), not only with files in the local filesystem.
+
+    If ``cache_location`` is set, files are copied to that local directory
+    the first time they are requested and served from there afterwards.
+    Files whose checksum is known are cached until ``cache_max_size`` bytes
+    are used, others are fetched again after ``cache_timeout`` seconds.
+    """
+    def __init__(self, cache_location=None, cache_max_size=None,
+                 cache_timeout=600, chunk_size=None):
+        self.cache_location = cache_location
+        self.cache_max_size = cache_max_size
+        self.cache_timeout = cache_timeout
+        if chunk_size:
+            self.chunk_size = chunk_size
+
+    def serve(self, request, file_obj, **kwargs):
+        storage, name = file_obj.storage, file_obj.name
+        # the filer File the file belongs to, or else the ``StorageFile`` of
+        # the serve views with the same attributes
+        instance = getattr(file_obj, 'instance', None) or file_obj
+        sha1 = getattr(instance, 'sha1', None)
+        size = kwargs.pop('size', None) or getattr(instance, '_file_size', None)
+        last_modified = getattr(instance, 'modified_at', None)
+        if last_modified is not None:
+            last_modified = calendar.timegm(last_modified.utctimetuple())
+            if self.is_not_modified(request, last_modified):
+                response = HttpResponseNotModified()
+                self.cache_headers(response=response, **kwargs)
+                return response
+
+        stream = None
+        if self.cache_location:
+            cache_path = self.get_cache_path(name, sha1)
+            stream = self.open_cached(cache_path, storage, name,
+                                      checked=bool(sha1))
+            if stream is not None:
+                # the cached copy is what is actually sent
+                size = os.fstat(stream.fileno()).st_size
+        if stream is None:
+            try:
+                stream = storage.open(name)
+                if size is None:
+                    size = storage.size(name)
+            except (IOError, OSError):
+                raise Http404('"%s" does not exist' % name)
+        response = self.file_response(
+            request, stream, size, self.get_mimetype(name),
+            last_modified=last_modified, file_obj=file_obj, **kwargs)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_cache_path(self, name, checksum=None):
+        key = hashlib.sha1(force_bytes('%s\0%s' % (name, checksum or ''))).hexdigest()
+        return os.path.join(self.cache_location, key[:2], key)
+
+    def open_cached(self, cache_path, storage, name, checked=False):
+        """
+        Returns the cached copy of the file ``name`` of ``storage``, fetching
+        it first if it is not cached (or too old, unless ``checked`` says that
+        the cache path depends on the content of the file). Returns ``None``
+        if the file can not be cached.
+        """
+        try:
+            if checked or time.time() - os.path.getmtime(cache_path) < self.cache_timeout:
+                cached = open(cache_path, 'rb')
+                # mark it as recently used
+                os.utime(cache_path, None)
+                return cached
+        except (IOError, OSError):
+            pass
+        try:
+            self.fetch(cache_path, storage, name)
+            return open(cache_path, 'rb')
+        except (IOError, OSError):
+            # e.g. the file does not exist or the disk is full
+            return None
+
+    def fetch(self, cache_path, storage, name):
+        directory = os.path.dirname(cache_path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # download to a temporary file and rename it, so that concurrent
+        # requests never see a partial copy
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as cached:
+                source = storage.open(name)
+                try:
+                    for chunk in source.chunks(self.chunk_size):
+                        cached.write(chunk)
+                finally:
+                    source.close()
+            os.rename(tmp_path, cache_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        if self.cache_max_size:
+            self.prune()
+
+    def prune(self):
+        """
+        Removes the least recently used files until the cache is no larger
+        than ``cache_max_size`` bytes.
+        """
+        entries, total = [], 0
+        for directory, dirnames, filenames in os.walk(self.cache_location):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.cache_max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
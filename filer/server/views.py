@@ -1,30 +1,129 @@
 #-*- coding: utf-8 -*-
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.http import Http404
-from easy_thumbnails.files import ThumbnailFile
+from django.core.files.base import File as DjangoFile
+from django.db.models import Q
+from django.http import Http404, HttpResponseNotModified
+from django.utils.encoding import force_bytes
 from filer import settings as filer_settings
-from filer.models import File
+from filer.models import File, Folder, FolderPermission
+from filer.server.backends.base import etag_matches
 from filer.utils.filer_easy_thumbnails import thumbnail_to_original_filename
+from filer.utils.signing import check_signature
+import hashlib
 
 server = filer_settings.FILER_PRIVATEMEDIA_SERVER
 thumbnail_server = filer_settings.FILER_PRIVATEMEDIA_THUMBNAIL_SERVER
 
 
-def serve_protected_file(request, path):
+class StorageFile(DjangoFile):
     """
-    Serve protected files to authenticated users with read permissions.
+    A file of a storage, for the server backends to serve files without
+    loading the filer ``File`` they belong to. The ``sha1``, ``_file_size``
+    and ``modified_at`` attributes of that ``File`` are set if they are known.
     """
-    try:
-        file_obj = File.objects.get(file=path, is_public=False)
-    except File.DoesNotExist:
+    def __init__(self, name, storage, sha1=None, file_size=None,
+                 modified_at=None):
+        super(StorageFile, self).__init__(None, name=name)
+        self.storage = storage
+        self.sha1 = sha1
+        self._file_size = file_size
+        self.modified_at = modified_at
+
+    @property
+    def path(self):
+        return self.storage.path(self.name)
+
+
+def get_etag(sha1, thumbnail_name=None):
+    """
+    Returns a strong ETag derived from the checksum of the file (and the name
+    of the thumbnail, which depends on its options), or None if the checksum
+    is not known.
+    """
+    if not sha1:
+        return None
+    if thumbnail_name is None:
+        return '"%s"' % sha1
+    return '"%s"' % hashlib.sha1(force_bytes(
+        '%s\0%s' % (sha1, thumbnail_name))).hexdigest()
+
+
+def not_modified(request, etag, cache_control):
+    """
+    Returns a 304 response if the client already has the file, without
+    accessing the storage.
+    """
+    if not etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        return None
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    return response
+
+
+def has_read_permission(request, path_info):
+    """
+    Like ``File.has_read_permission``, but for the rows returned by
+    ``File.objects.get_path_info``: the user may read the stored file if
+    they may read one of the files using it.
+    """
+    user = request.user
+    if not user.is_authenticated():
+        return False
+    if user.is_superuser:
+        return True
+    folder_ids = set()
+    for file_id, folder_id, owner_id, sha1, size, modified_at in path_info:
+        if owner_id == user.pk:
+            return True
+        if folder_id:
+            folder_ids.add(folder_id)
+    if not folder_ids:
+        return False
+    permission = FolderPermission.objects.get_read_ranges(user)
+    if permission == 'All':
+        return True
+    # the owner of a folder may read its files
+    return Folder.objects.filter(pk__in=folder_ids).filter(
+        permission.q() | Q(owner=user)).exists()
+
+
+def get_readable_path_info(request, path):
+    path_info = File.objects.get_path_info(path, is_public=False)
+    if not path_info:
         raise Http404('File not found')
-    if not file_obj.has_read_permission(request):
+    if not has_read_permission(request, path_info):
         if settings.DEBUG:
             raise PermissionDenied
         else:
             raise Http404('File not found')
-    return server.serve(request, file_obj=file_obj.file, save_as=False)
+    return path_info
+
+
+def serve_protected_file(request, path):
+    """
+    Serve protected files to authenticated users with read permissions, or to
+    anyone with a valid signed URL (see ``filer.utils.signing``).
+    """
+    cache_control = filer_settings.FILER_PRIVATEMEDIA_CACHE_CONTROL
+    storage = filer_settings.FILER_PRIVATEMEDIA_STORAGE
+    if check_signature(request, path):
+        return server.serve(request, StorageFile(path, storage),
+                            save_as=False, cache_control=cache_control)
+    path_info = get_readable_path_info(request, path)
+    file_id, folder_id, owner_id, sha1, size, modified_at = path_info[0]
+    etag = get_etag(sha1)
+    response = not_modified(request, etag, cache_control)
+    if response is not None:
+        return response
+    # the files sharing the stored file may have been changed since
+    modified_at = max([row[5] for row in path_info if row[5]] or [None])
+    file_obj = StorageFile(path, storage, sha1=sha1, file_size=size,
+                           modified_at=modified_at)
+    return server.serve(request, file_obj, save_as=False, etag=etag,
+                        cache_control=cache_control)
 
 
 def serve_protected_thumbnail(request, path):
@@ -32,20 +131,24 @@ def serve_protected_thumbnail(request, path):
     Serve protected thumbnails to authenticated users.
     If the user doesn't have read permissions, redirect to a static image.
     """
+    cache_control = filer_settings.FILER_PRIVATEMEDIA_THUMBNAIL_CACHE_CONTROL
+    thumbnail = StorageFile(path, filer_settings.FILER_PRIVATEMEDIA_THUMBNAIL_STORAGE)
+    if check_signature(request, path, thumbnail=True):
+        return thumbnail_server.serve(request, thumbnail, save_as=False,
+                                      cache_control=cache_control)
     source_path = thumbnail_to_original_filename(path)
     if not source_path:
         raise Http404('File not found')
+    path_info = get_readable_path_info(request, source_path)
+    sha1 = path_info[0][3]
+    etag = get_etag(sha1, thumbnail_name=path)
+    response = not_modified(request, etag, cache_control)
+    if response is not None:
+        return response
+    # the name and the checksum of the source identify the thumbnail content
+    thumbnail.sha1 = sha1
     try:
-        file_obj = File.objects.get(file=source_path, is_public=False)
-    except File.DoesNotExist:
-        raise Http404('File not found')
-    if not file_obj.has_read_permission(request):
-        if settings.DEBUG:
-            raise PermissionDenied
-        else:
-            raise Http404('File not found')
-    try:
-        thumbnail = ThumbnailFile(name=path, storage=file_obj.file.thumbnail_storage)
-        return thumbnail_server.serve(request, thumbnail, save_as=False)
+        return thumbnail_server.serve(request, thumbnail, save_as=False,
+                                      etag=etag, cache_control=cache_control)
     except Exception:
         raise Http404('File not found')
@@ -8,6 +8,10 @@ import os
 FILER_IMAGE_MODEL = getattr(settings, 'FILER_IMAGE_MODEL', False)
 FILER_DEBUG = getattr(settings, 'FILER_DEBUG', False) # When True makes
 FILER_SUBJECT_LOCATION_IMAGE_DEBUG = getattr(settings, 'FILER_SUBJECT_LOCATION_IMAGE_DEBUG', False)
+# Shrink large images with JPEG draft mode and box filtering before the final
+# resample, see filer.thumbnail_processors.reduce_image
+FILER_THUMBNAIL_FAST_SCALING = getattr(settings, 'FILER_THUMBNAIL_FAST_SCALING', False)
+FILER_THUMBNAIL_REDUCING_GAP = getattr(settings, 'FILER_THUMBNAIL_REDUCING_GAP', 2.0)
 FILER_WHITESPACE_COLOR = getattr(settings, 'FILER_WHITESPACE_COLOR', '#FFFFFF')
 
 FILER_0_8_COMPATIBILITY_MODE = getattr(settings, 'FILER_0_8_COMPATIBILITY_MODE', False)
@@ -23,6 +27,32 @@ FILER_ALLOW_REGULAR_USERS_TO_ADD_ROOT_FOLDERS = getattr(settings, 'FILER_ALLOW_R
 FILER_IS_PUBLIC_DEFAULT = getattr(settings, 'FILER_IS_PUBLIC_DEFAULT', True)
 
 FILER_PAGINATE_BY = getattr(settings, 'FILER_PAGINATE_BY', 20)
+
+# Load the following pages of the admin directory listing as the user scrolls
+FILER_DIRECTORY_LISTING_INFINITE_SCROLL = getattr(
+    settings, 'FILER_DIRECTORY_LISTING_INFINITE_SCROLL', False)
+
+# Dotted path of the full-text search backend of the admin, see filer.search
+# (None picks one for the database)
+FILER_SEARCH_BACKEND = getattr(settings, 'FILER_SEARCH_BACKEND', None)
+
+# Size of the buffer used to compute file checksums, see filer.utils.hashing
+FILER_HASH_BUFFER_SIZE = getattr(settings, 'FILER_HASH_BUFFER_SIZE', 64 * 1024)
+FILER_HASH_USE_MMAP = getattr(settings, 'FILER_HASH_USE_MMAP', True)
+
+# Dotted path to a function(src_storage, src_name, dst_storage, dst_name) that
+# copies a file without downloading it and returns the new name, or None if
+# it can not copy between these storages. See filer.utils.transfer
+FILER_SERVER_SIDE_COPY = getattr(settings, 'FILER_SERVER_SIDE_COPY', None)
+
+# Generate thumbnails of uploaded files with ``manage.py filer_worker`` instead
+# of while handling the upload request
+FILER_ASYNC_PROCESSING = getattr(settings, 'FILER_ASYNC_PROCESSING', False)
+# Background jobs, see filer.models.jobmodels
+FILER_JOB_MAX_ATTEMPTS = getattr(settings, 'FILER_JOB_MAX_ATTEMPTS', 5)
+FILER_JOB_RETRY_DELAY = getattr(settings, 'FILER_JOB_RETRY_DELAY', 10)  # seconds
+FILER_JOB_MAX_RETRY_DELAY = getattr(settings, 'FILER_JOB_MAX_RETRY_DELAY', 3600)  # seconds
+FILER_JOB_TIMEOUT = getattr(settings, 'FILER_JOB_TIMEOUT', 3600)  # seconds
 FILER_STATICMEDIA_PREFIX = getattr(settings, 'FILER_STATICMEDIA_PREFIX', None)
 if not FILER_STATICMEDIA_PREFIX:
     FILER_STATICMEDIA_PREFIX = (getattr(settings, 'STATIC_URL', None) or settings.MEDIA_URL) + 'filer/'
@@ -217,5 +247,27 @@ FILER_PRIVATEMEDIA_THUMBNAIL_STORAGE = get_storage_class(FILER_STORAGES['private
 FILER_PRIVATEMEDIA_THUMBNAIL_OPTIONS = FILER_STORAGES['private']['thumbnails']['THUMBNAIL_OPTIONS']
 FILER_PRIVATEMEDIA_SERVER = load_object(FILER_SERVERS['private']['main']['ENGINE'])(**FILER_SERVERS['private']['main']['OPTIONS'])
 FILER_PRIVATEMEDIA_THUMBNAIL_SERVER = load_object(FILER_SERVERS['private']['thumbnails']['ENGINE'])(**FILER_SERVERS['private']['thumbnails']['OPTIONS'])
+# Cache-Control headers of permission-checked files and thumbnails. With
+# max-age=0 browsers revalidate them with their ETag on every use.
+FILER_PRIVATEMEDIA_CACHE_CONTROL = getattr(settings, 'FILER_PRIVATEMEDIA_CACHE_CONTROL', 'private, max-age=0')
+FILER_PRIVATEMEDIA_THUMBNAIL_CACHE_CONTROL = getattr(
+    settings, 'FILER_PRIVATEMEDIA_THUMBNAIL_CACHE_CONTROL', 'private, max-age=0')
+# Minimum lifetime (in seconds) of signed private file urls, see filer.utils.signing
+FILER_SIGNED_URL_EXPIRES = getattr(settings, 'FILER_SIGNED_URL_EXPIRES', 3600)
+# Seconds the files stored at a path are cached for the protected serve views
+FILER_PATH_CACHE_TIMEOUT = getattr(settings, 'FILER_PATH_CACHE_TIMEOUT', 3600)
+# Seconds the compiled folder permissions of a user are cached for (0 to
+# disable), and the number of them also kept in each process. Only cached by
+# default if the default cache is shared by the processes, the invalidation
+# does not reach the local memory caches of the other processes.
+FILER_PERMISSION_CACHE_TIMEOUT = getattr(
+    settings, 'FILER_PERMISSION_CACHE_TIMEOUT',
+    0 if settings.CACHES.get('default', {}).get('BACKEND', '').endswith(
+        ('.LocMemCache', '.DummyCache')) else 3600)
+FILER_PERMISSION_LOCAL_CACHE_SIZE = getattr(settings, 'FILER_PERMISSION_LOCAL_CACHE_SIZE', 1000)
+# The number of seconds a process keeps using the permission version it read
+# from the cache, i.e. how long the other processes may still use the old
+# permissions after a change.
+FILER_PERMISSION_VERSION_TTL = getattr(settings, 'FILER_PERMISSION_VERSION_TTL', 1)
 
 FILER_DUMP_PAYLOAD = getattr(settings, 'FILER_DUMP_PAYLOAD', False)  # Whether the filer shall dump the files payload
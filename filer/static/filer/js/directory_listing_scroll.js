@@ -0,0 +1,87 @@
+(function($) {
+	// Loads the following items of the directory listing from the json
+	// listing as the user scrolls down, instead of showing the paginator.
+	$(document).ready(function() {
+		var table = $('#toolbartable[data-listing-url]');
+		if (!table.length) {
+			return;
+		}
+		var url = table.data('listing-url');
+		var cursor = table.data('next-cursor');
+		var loading = false;
+		var body = table.find('tbody');
+		// the loaded items can be selected for the actions too
+		var actionToggle = table.find('#action-toggle');
+		table.find('p.paginator').hide();
+
+		// the same cells as the rows of directory_table.html
+		var row = function(item) {
+			var isFolder = item.type == 'folder';
+			var tr = $('<tr><td></td><td></td><td></td><td></td></tr>');
+			var cells = tr.children();
+			var href = isFolder ? item.url : (item.can_change ? item.change_url : null);
+			var link = function(content) {
+				return href ? $('<a></a>').attr('href', href).append(content) : content;
+			};
+			tr.addClass(body.find('tr').length % 2 ? 'row2' : 'row1');
+			if (actionToggle.length) {
+				cells.eq(0).append($('<input type="checkbox" class="action-select" name="_selected_action" />')
+					.val((isFolder ? 'folder-' : 'file-') + item.id)
+					.attr('checked', actionToggle.attr('checked')));
+			}
+			cells.eq(1).append(link($('<img />').attr('src', item.thumbnail).attr('alt', '')));
+			if (item.can_change) {
+				if (!isFolder) {
+					cells.eq(2).append($('<a class="deletelink"></a>').attr('href', item.delete_url)
+						.css({'display': 'block', 'float': 'right', 'margin-left': '10px'}).text(gettext('Delete')));
+				}
+				cells.eq(2).append($('<a class="changelink"></a>').attr('href', item.change_url)
+					.css({'display': 'block', 'float': 'right'}).text(gettext('Change')));
+			}
+			cells.eq(2).append($('<div></div>').append($('<b></b>').append(link(document.createTextNode(item.label)))));
+			cells.eq(2).append($('<div></div>').text(gettext('Owner') + ': ' + (item.owner || 'n/a')));
+			if (!isFolder) {
+				var clipboard = $('<input type="submit" value="\u2192" />')
+					.attr('name', 'move-to-clipboard-' + item.id).attr('title', gettext('Move to clipboard'));
+				if (!item.can_change) {
+					clipboard.attr('disabled', 'disabled').css('color', 'gray');
+				}
+				cells.eq(3).css('text-align', 'right').append(clipboard);
+			}
+			return tr;
+		};
+
+		var load = function() {
+			if (loading || !cursor) {
+				return;
+			}
+			loading = true;
+			$.ajax({
+				url: url,
+				data: {'cursor': cursor},
+				dataType: 'json',
+				success: function(data) {
+					$.each(data.items, function(i, item) {
+						body.append(row(item));
+					});
+					cursor = data.next;
+					loading = false;
+				},
+				error: function() {
+					// tried again on the next scroll
+					loading = false;
+				}
+			});
+		};
+
+		actionToggle.click(function() {
+			body.find('input.action-select').attr('checked', this.checked);
+		});
+
+		$(window).scroll(function() {
+			if ($(window).scrollTop() + $(window).height() > table.offset().top + table.height() - 200) {
+				load();
+			}
+		});
+	});
+})(django.jQuery);
@@ -0,0 +1,33 @@
+#-*- coding: utf-8 -*-
+"""
+Functions that are run in the background by ``manage.py filer_worker``, see
+``filer.models.jobmodels.Job``.
+"""
+from filer.models.abstract import BaseImage
+from filer.models.filemodels import File
+
+
+def process_upload(file_id):
+    """
+    Does the expensive processing of an uploaded file: its checksum and size
+    (if they have not been computed while it was uploaded) and the
+    thumbnails.
+    """
+    try:
+        file_obj = File.objects.get(pk=file_id)
+    except File.DoesNotExist:
+        # deleted in the meantime
+        return None
+    is_image = isinstance(file_obj, BaseImage)
+    if (not file_obj.sha1 or file_obj._file_size is None or
+            (is_image and not file_obj._width)):
+        file_obj._file_data_changed_hint = True
+        file_obj.save()
+    if is_image:
+        # all at once, so that the image is decoded only once
+        required_thumbnails = dict(BaseImage.DEFAULT_THUMBNAILS)
+        required_thumbnails.update(file_obj.get_icon_thumbnail_options())
+        icons = file_obj._generate_thumbnails(required_thumbnails)
+    else:
+        icons = file_obj.icons
+    return {'thumbnail': icons.get('32')}
@@ -1,6 +1,9 @@
 #-*- coding: utf-8 -*-
 from django.template import Library
 from django.utils import six
+from easy_thumbnails.files import ThumbnailFile
+from filer import settings as filer_settings
+from filer.utils.signing import sign_url
 import math
 
 register = Library()
@@ -102,3 +105,23 @@ def filesize(bytes, format='auto1024'):
         bytes = bytes >> (10 * (base - 1))
         return bytes / 1024.0
 register.filter(filesize)
+
+
+def filer_signed_url(obj, user=None, expires_in=None):
+    """
+    Returns a signed URL (see ``filer.utils.signing``) of a private filer file
+    or of a thumbnail of one, e.g.::
+
+        {% filer_signed_url image %}
+        {% thumbnail image 64x64 crop as thumb %}{% filer_signed_url thumb user=request.user %}
+
+    Public files and thumbnails keep their normal URL.
+    """
+    if isinstance(obj, ThumbnailFile):
+        base_url = filer_settings.FILER_PRIVATEMEDIA_THUMBNAIL_STORAGE.base_url
+        if not obj.url.startswith(base_url):
+            return obj.url
+        return sign_url(obj.url, obj.name, expires_in=expires_in, user=user,
+                        thumbnail=True)
+    return obj.get_signed_url(expires_in=expires_in, user=user)
+register.simple_tag(filer_signed_url)
@@ -1,8 +1,15 @@
 #-*- coding: utf-8 -*-
 from filer.tests.admin import *
 from filer.tests.dump import *
+from filer.tests.hashing import *
+from filer.tests.ingest import *
+from filer.tests.jobs import *
 from filer.tests.models import *
 from filer.tests.permissions import *
+from filer.tests.search import *
 from filer.tests.server_backends import *
+from filer.tests.signing import *
+from filer.tests.thumbnails import *
 from filer.tests.tools import *
+from filer.tests.transfer import *
 from filer.tests.utils import *
@@ -1,4 +1,6 @@
 #-*- coding: utf-8 -*-
+import hashlib
+import json
 import os
 from django.test import TestCase
 from django.core.urlresolvers import reverse
@@ -14,10 +16,15 @@ from filer.models.imagemodels import Image
 from filer.models.clipboardmodels import Clipboard
 from filer.models.virtualitems import FolderRoot
 from filer.models import tools
+from filer.admin import folderadmin as folderadmin_module
 from filer.admin.folderadmin import FolderAdmin
+from filer.admin.listing import order_files, LISTING_FIELDS
+from filer.admin.tools import ListingItems
 from filer.tests.helpers import (create_superuser, create_folder_structure,
                                  create_image, SettingsOverride)
 from filer import settings as filer_settings
+from filer.utils.generate_filename import content_addressed
+from filer.utils.hashing import sha1_file
 
 
 class FilerFolderAdminUrlsTests(TestCase):
@@ -174,6 +181,20 @@ class FilerClipboardAdminUrlsTests(TestCase):
         self.assertEqual(Image.objects.count(), 1)
         self.assertEqual(Image.objects.all()[0].original_filename, self.image_name)
 
+    def test_filer_ajax_upload_file_is_ingested(self):
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        self.client.post(
+            reverse('admin:filer-ajax_upload')+'?filename=%s' % self.image_name,
+            data=data,
+            content_type='application/octet-stream',
+            **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        )
+        image = Image.objects.get()
+        self.assertEqual(image.sha1, hashlib.sha1(data).hexdigest())
+        self.assertEqual(image.size, len(data))
+        self.assertEqual((image.width, image.height), self.img.size)
+
 
 class BulkOperationsMixin(object):
     def setUp(self):
@@ -419,6 +440,29 @@ class FilerResizeOperationTests(BulkOperationsMixin, TestCase):
         self.assertEqual(self.image_obj.width, 42)
         self.assertEqual(self.image_obj.height, 42)
 
+    def test_resize_content_addressed_image(self):
+        upload_to = {
+            'FILER_PUBLICMEDIA_UPLOAD_TO': content_addressed,
+            'FILER_PRIVATEMEDIA_UPLOAD_TO': content_addressed,
+        }
+        with SettingsOverride(filer_settings, **upload_to):
+            image = self.create_image(self.src_folder)
+            copy = self.create_image(self.folder)
+            name = image.file.name
+            self.assertEqual(copy.file.name, name)
+            folder_admin = FolderAdmin(Folder, admin.site)
+            folder_admin._resize_image(image, {
+                'width': 42, 'height': 42, 'crop': True, 'upscale': False})
+        image = Image.objects.get(pk=image.pk)
+        self.assertEqual((image.width, image.height), (42, 42))
+        self.assertEqual(image.file.name, '%s/%s/%s.jpg' % (
+            image.sha1[0:2], image.sha1[2:4], image.sha1))
+        # the other file still has the original content
+        copy = Image.objects.get(pk=copy.pk)
+        self.assertEqual(copy.file.name, name)
+        self.assertEqual((copy.width, copy.height), (800, 600))
+        self.assertEqual(sha1_file(copy.file), copy.sha1)
+
 
 class PermissionAdminTest(TestCase):
     def setUp(self):
@@ -546,3 +590,196 @@ class FolderListingTest(TestCase):
 
         folder_qs = folderadmin.filter_folder(Folder.objects.all(), ['joe@mata.com'])
         self.assertEqual(len(folder_qs), 0)
+
+
+class DirectoryListingPaginationTest(TestCase):
+
+    def setUp(self):
+        self.superuser = create_superuser()
+        self.client.login(username='admin', password='secret')
+        self.folder = Folder.objects.create(name='folder')
+        self.subfolder = Folder.objects.create(name='sub', parent=self.folder)
+        for name, original_filename in (('b', 'z'), ('', 'A'), ('C', 'a'), ('', 'd')):
+            File.objects.create(folder=self.folder, name=name,
+                                original_filename=original_filename)
+        self.url = reverse('admin:filer-directory_listing',
+                           kwargs={'folder_id': self.folder.id})
+
+    def get_labels(self, page, **params):
+        # directory_listing imported the setting
+        with SettingsOverride(folderadmin_module, FILER_PAGINATE_BY=2):
+            params['page'] = page
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.context['paginator'].count, 5)
+        return [getattr(item, 'label', item.name)
+                for item, item_perms in response.context['paginated_items'].object_list]
+
+    def test_ordered_by_label(self):
+        # the folders come first, then the files by label
+        self.assertEqual(self.get_labels(1), ['sub', 'A'])
+        self.assertEqual(self.get_labels(2), ['b', 'C'])
+        self.assertEqual(self.get_labels(3), ['d'])
+
+    def test_order_by(self):
+        self.assertEqual(self.get_labels(1, order_by='-original_filename'), ['sub', 'b'])
+        self.assertEqual(self.get_labels(2, order_by='-original_filename'), ['d', 'C'])
+
+    def test_page_size_queries(self):
+        items = ListingItems(self.superuser, [], Folder.objects.filter(parent=self.folder),
+                             order_files(self.folder.files))
+        self.assertEqual(len(items), 5)
+        with self.assertNumQueries(1):
+            # the files of the page only
+            self.assertEqual([item.label for item, perms in items[2:4]], ['b', 'C'])
+
+
+class DirectoryListingJsonTest(TestCase):
+
+    def setUp(self):
+        self.superuser = create_superuser()
+        self.client.login(username='admin', password='secret')
+        self.folder = Folder.objects.create(name='folder')
+        self.subfolder = Folder.objects.create(name='sub', parent=self.folder)
+        for name, original_filename in (('b', 'z'), ('', 'A'), ('C', 'a'), ('', 'd')):
+            File.objects.create(folder=self.folder, name=name,
+                                original_filename=original_filename)
+        self.url = reverse('admin:filer-directory_listing-json',
+                           kwargs={'folder_id': self.folder.id})
+
+    def get_pages(self, **params):
+        pages, cursor = [], None
+        while True:
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content.decode('utf-8'))
+            pages.append([item['label'] for item in data['items']])
+            cursor = data['next']
+            if cursor is None:
+                return pages
+
+    def test_pages(self):
+        self.assertEqual(self.get_pages(limit=2),
+                         [['sub', 'A'], ['b', 'C'], ['d']])
+        self.assertEqual(self.get_pages(limit=5), [['sub', 'A', 'b', 'C', 'd']])
+
+    def test_order_by(self):
+        self.assertEqual(self.get_pages(limit=2, order_by='-original_filename'),
+                         [['sub', 'b'], ['d', 'C'], ['A']])
+        self.assertEqual(self.get_pages(limit=3, order_by='uploaded_at'),
+                         [['sub', 'b', 'A'], ['C', 'd']])
+
+    def test_same_keys(self):
+        for i in range(3):
+            File.objects.create(folder=self.folder, name='same')
+        pages = self.get_pages(limit=2, order_by='name')
+        self.assertEqual(sum(len(page) for page in pages), 8)
+
+    def test_page_queries(self):
+        response = self.client.get(self.url, {'limit': 3, 'fields': 'id,label'})
+        cursor = json.loads(response.content.decode('utf-8'))['next']
+        self.client.get(self.url, {'cursor': cursor, 'fields': 'id,label'})
+        # user, folder, files (the folders are done)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'cursor': cursor, 'fields': 'id,label'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['items'], [
+            {'id': item.pk, 'label': item.label}
+            for item in sorted(self.folder.files, key=lambda f: f.label.lower())[2:]])
+
+    def test_fields(self):
+        response = self.client.get(self.url, {'limit': 1})
+        item = json.loads(response.content.decode('utf-8'))['items'][0]
+        self.assertEqual(sorted(item), sorted(LISTING_FIELDS))
+        self.assertEqual(item['type'], 'folder')
+        self.assertEqual(item['url'], self.subfolder.get_admin_directory_listing_url_path())
+        self.assertEqual(item['delete_url'], None)
+        self.assertTrue(item['can_change'])
+        response = self.client.get(self.url, {'limit': 1, 'cursor': json.loads(
+            response.content.decode('utf-8'))['next']})
+        item = json.loads(response.content.decode('utf-8'))['items'][0]
+        self.assertEqual(item['delete_url'],
+                         reverse('admin:filer_file_delete', args=(item['id'],)))
+
+    def test_image_thumbnail(self):
+        filename = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, 'listing.jpg')
+        create_image().save(filename, 'JPEG')
+        with open(filename, 'rb') as f:
+            image = Image.objects.create(
+                folder=self.folder, original_filename='listing.jpg',
+                file=django.core.files.File(f, name='listing.jpg'))
+        os.remove(filename)
+        response = self.client.get(self.url, {'fields': 'id,thumbnail',
+                                              'thumbnail_size': '32'})
+        items = json.loads(response.content.decode('utf-8'))['items']
+        self.assertEqual([item['thumbnail'] for item in items if item['id'] == image.pk],
+                         [image.icons['32']])
+        image.delete()
+
+    def test_invalid_parameters(self):
+        for params in ({'cursor': 'nonsense'}, {'order_by': 'sha1'},
+                       {'fields': 'id,password'}, {'limit': 'x'},
+                       {'thumbnail_size': '1000'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_permission_denied(self):
+        user = User.objects.create_user('joe', 'joe@example.com', 'x')
+        user.is_staff = True
+        user.save()
+        self.client.login(username='joe', password='x')
+        with SettingsOverride(filer_settings, FILER_ENABLE_PERMISSIONS=True):
+            self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_infinite_scroll(self):
+        url = reverse('admin:filer-directory_listing', kwargs={'folder_id': self.folder.id})
+        response = self.client.get(url)
+        self.assertEqual(response.context['listing_json_url'], None)
+        with SettingsOverride(filer_settings, FILER_DIRECTORY_LISTING_INFINITE_SCROLL=True):
+            with SettingsOverride(folderadmin_module, FILER_PAGINATE_BY=2):
+                response = self.client.get(url)
+        self.assertEqual(response.context['listing_json_url'], self.url)
+        data = json.loads(self.client.get(
+            self.url, {'cursor': response.context['next_cursor']}).content.decode('utf-8'))
+        self.assertEqual([item['label'] for item in data['items']], ['b', 'C', 'd'])
+
+
+class UsageReportTest(TestCase):
+
+    def setUp(self):
+        self.superuser = create_superuser()
+        self.client.login(username='admin', password='secret')
+        self.folder = Folder.objects.create(name='folder')
+        self.subfolder = Folder.objects.create(name='sub', parent=self.folder)
+        File.objects.create(folder=self.subfolder, owner=self.superuser,
+                            _file_size=10, original_filename='a.txt')
+        self.url = reverse('admin:filer-usage_report')
+
+    def test_report(self):
+        response = self.client.get(self.url, {'folder': self.folder.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['usage'], {'count': 1, 'total_size': 10})
+        self.assertEqual([row['folder'] for row in response.context['folders']],
+                         [self.subfolder])
+        self.assertEqual(self.client.get(self.url, {'folder': 'x'}).status_code, 404)
+
+    def test_refresh(self):
+        response = self.client.post(self.url, {'refresh': '1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotEqual(self.client.get(self.url).context['computed_at'], None)
+
+    def test_csv(self):
+        response = self.client.get(self.url, {'format': 'csv', 'by': 'owner'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response.content.decode('utf-8').splitlines(), [
+            'owner,name,count,total_size', '%d,admin,1,10' % self.superuser.pk])
+        response = self.client.get(self.url, {'format': 'csv', 'by': 'folder'})
+        self.assertEqual(response.content.decode('utf-8').splitlines(), [
+            'folder,name,count,total_size', '%d,folder,1,10' % self.folder.pk])
+
+    def test_superusers_only(self):
+        user = User.objects.create_user('joe', 'joe@example.com', 'x')
+        user.is_staff = True
+        user.save()
+        self.client.login(username='joe', password='x')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
@@ -0,0 +1,59 @@
+#-*- coding: utf-8 -*-
+import hashlib
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.test import TestCase
+
+from filer.utils import hashing
+from filer.utils.hashing import hash_file, sha1_file
+
+
+class HashFileTestCase(TestCase):
+
+    def setUp(self):
+        self.data = os.urandom(100000)
+        self.filename = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, 'hashing.bin')
+        with open(self.filename, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_multiple_digests_mmap(self):
+        with open(self.filename, 'rb') as f:
+            digests = hash_file(DjangoFile(f), algorithms=('sha1', 'sha256'),
+                                buffer_size=4096, use_mmap=True)
+            self.assertEqual(f.tell(), 0)
+        self.assertEqual(digests['sha1'], hashlib.sha1(self.data).hexdigest())
+        self.assertEqual(digests['sha256'], hashlib.sha256(self.data).hexdigest())
+
+    def test_multiple_digests_stream(self):
+        with open(self.filename, 'rb') as f:
+            digests = hash_file(DjangoFile(f), algorithms=('sha1', 'md5'),
+                                buffer_size=4096, use_mmap=False)
+        self.assertEqual(digests['sha1'], hashlib.sha1(self.data).hexdigest())
+        self.assertEqual(digests['md5'], hashlib.md5(self.data).hexdigest())
+
+    def test_in_memory_file(self):
+        self.assertEqual(sha1_file(BytesIO(self.data), buffer_size=1000),
+                         hashlib.sha1(self.data).hexdigest())
+
+    def test_empty_file(self):
+        with open(self.filename, 'wb'):
+            pass
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(sha1_file(f), hashlib.sha1(b'').hexdigest())
+
+    def test_without_memoryview(self):
+        # python 2.6
+        original = hashing.memoryview
+        hashing.memoryview = None
+        try:
+            with open(self.filename, 'rb') as f:
+                self.assertEqual(sha1_file(f, buffer_size=4096, use_mmap=True),
+                                 hashlib.sha1(self.data).hexdigest())
+        finally:
+            hashing.memoryview = original
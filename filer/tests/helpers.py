@@ -65,12 +65,13 @@ class SettingsOverride(object):
     def __enter__(self):
         self.old = {}
         for key, value in list(self.overrides.items()):
-            self.old[key] = getattr(self.settings_module, key, None)
+            if hasattr(self.settings_module, key):
+                self.old[key] = getattr(self.settings_module, key)
             setattr(self.settings_module, key, value)
 
     def __exit__(self, _type, value, traceback):
-        for key, value in list(self.old.items()):
-            if value is not None:
-                setattr(self.settings_module, key, value)
+        for key in self.overrides:
+            if key in self.old:
+                setattr(self.settings_module, key, self.old[key])
             else:
                 delattr(self.settings_module, key)
@@ -0,0 +1,47 @@
+#-*- coding: utf-8 -*-
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.test import TestCase
+
+from filer.tests.helpers import create_image
+from filer.utils.ingest import FileIngest, ingest_file
+
+
+class FileIngestTestCase(TestCase):
+
+    def setUp(self):
+        self.img = create_image()
+        self.image_name = 'test_file.jpg'
+        self.filename = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, self.image_name)
+        self.img.save(self.filename, 'JPEG')
+        with open(self.filename, 'rb') as f:
+            self.data = f.read()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_ingest_chunks(self):
+        ingest = FileIngest()
+        for i in range(0, len(self.data), 1000):
+            ingest.feed(self.data[i:i + 1000])
+        ingest.finish()
+        self.assertEqual(ingest.sha1, hashlib.sha1(self.data).hexdigest())
+        self.assertEqual(ingest.size, len(self.data))
+        self.assertEqual((ingest.width, ingest.height), self.img.size)
+        self.assertTrue(ingest.is_image)
+
+    def test_ingest_non_image(self):
+        ingest = FileIngest()
+        ingest.feed(b'just some text')
+        ingest.finish()
+        self.assertEqual(ingest.size, 14)
+        self.assertFalse(ingest.is_image)
+
+    def test_ingest_file(self):
+        with open(self.filename, 'rb') as f:
+            ingest = ingest_file(DjangoFile(f, name=self.image_name))
+        self.assertEqual(ingest.sha1, hashlib.sha1(self.data).hexdigest())
+        self.assertEqual((ingest.width, ingest.height), self.img.size)
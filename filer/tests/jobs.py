@@ -0,0 +1,128 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.timezone import now
+
+from filer import settings as filer_settings
+from filer.models.imagemodels import Image
+from filer.models.jobmodels import Job
+from filer.tests.helpers import create_superuser, create_image, SettingsOverride
+
+
+def succeeding_task(value):
+    return {'value': value}
+
+
+def failing_task():
+    raise ValueError('failure')
+
+
+class JobTestCase(TestCase):
+
+    def test_run_job(self):
+        job = Job.objects.enqueue('filer.tests.jobs.succeeding_task', value=1)
+        self.assertEqual(Job.objects.claim(limit=10), [job])
+        # a claimed job is not claimed again
+        self.assertEqual(Job.objects.claim(limit=10), [])
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 1))
+        job.run()
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.get_result(), {'value': 1})
+
+    def test_retry_with_backoff(self):
+        job = Job.objects.enqueue('filer.tests.jobs.failing_task')
+        with SettingsOverride(filer_settings, FILER_JOB_MAX_ATTEMPTS=2,
+                              FILER_JOB_RETRY_DELAY=10):
+            job, = Job.objects.claim()
+            job.run()
+            job = Job.objects.get(pk=job.pk)
+            self.assertEqual(job.status, Job.QUEUED)
+            self.assertIn('failure', job.last_error)
+            self.assertTrue(job.run_after > now() + timedelta(seconds=5))
+            # not due yet
+            self.assertEqual(Job.objects.claim(), [])
+            self.assertEqual(job.get_retry_delay(), 10)
+            job.attempts = 3
+            self.assertEqual(job.get_retry_delay(), 40)
+
+            Job.objects.filter(pk=job.pk).update(run_after=now())
+            job, = Job.objects.claim()
+            job.run()
+            self.assertEqual(Job.objects.get(pk=job.pk).status, Job.FAILED)
+
+    def test_requeue_stale(self):
+        job = Job.objects.enqueue('filer.tests.jobs.succeeding_task', value=1)
+        Job.objects.claim()
+        self.assertEqual(Job.objects.requeue_stale(), 0)
+        Job.objects.filter(pk=job.pk).update(
+            modified_at=now() - timedelta(seconds=filer_settings.FILER_JOB_TIMEOUT + 1))
+        self.assertEqual(Job.objects.requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.QUEUED)
+
+
+class AsyncUploadTestCase(TestCase):
+
+    def setUp(self):
+        self.superuser = create_superuser()
+        self.client.login(username='admin', password='secret')
+        self.img = create_image()
+        self.image_name = 'test_file.jpg'
+        self.filename = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, self.image_name)
+        self.img.save(self.filename, 'JPEG')
+
+    def tearDown(self):
+        self.client.logout()
+        os.remove(self.filename)
+        for img in Image.objects.all():
+            img.delete()
+
+    def test_upload_is_processed_by_worker(self):
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        with SettingsOverride(filer_settings, FILER_ASYNC_PROCESSING=True):
+            response = self.client.post(
+                reverse('admin:filer-ajax_upload') + '?filename=%s' % self.image_name,
+                data=data,
+                content_type='application/octet-stream',
+                **{'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+            )
+        upload = json.loads(response.content.decode('utf-8'))
+        image = Image.objects.get()
+        self.assertEqual(upload['thumbnail'], image.static_icons['32'])
+        status = json.loads(self.client.get(
+            upload['job_status_url']).content.decode('utf-8'))
+        self.assertEqual(status['status'], Job.QUEUED)
+
+        call_command('filer_worker', burst=True)
+
+        status = json.loads(self.client.get(
+            upload['job_status_url']).content.decode('utf-8'))
+        self.assertEqual(status['status'], Job.DONE)
+        self.assertEqual(status['result']['thumbnail'], image.icons['32'])
+
+    def test_job_status_of_other_users(self):
+        try:
+            from django.contrib.auth import get_user_model
+            User = get_user_model()
+        except ImportError:
+            from django.contrib.auth.models import User  # NOQA
+        staff = User.objects.create_user('staff', 'staff@free.fr', 'secret')
+        staff.is_staff = True
+        staff.save()
+        job = Job.objects.enqueue('filer.tests.jobs.succeeding_task',
+                                  owner=self.superuser, value=1)
+        url = reverse('admin:filer-job_status', args=(job.pk,))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.logout()
+        self.client.login(username='staff', password='secret')
+        self.assertEqual(self.client.get(url).status_code, 404)
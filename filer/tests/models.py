@@ -1,20 +1,31 @@
 #-*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import json
 import os
+from io import BytesIO
+
 from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.files import File as DjangoFile
 from django.forms.models import modelform_factory
 from django.test import TestCase
+from django.utils.six import StringIO
 from django.utils.unittest import skipIf, skipUnless
 
-from filer.models.foldermodels import Folder
+from filer.models import foldermodels
+from filer.models.foldermodels import Folder, check_folder_counters
 from filer.models.imagemodels import Image
 from filer.models.filemodels import File
 from filer.models.clipboardmodels import Clipboard
+from filer.models.usagemodels import OwnerUsage
 from filer.test_utils import ET_2
 from filer.tests.helpers import (create_superuser, create_folder_structure,
-                                 create_image, create_clipboard_item)
+                                 create_image, create_clipboard_item,
+                                 SettingsOverride)
+from filer.utils.generate_filename import content_addressed, prefixed_factory
 from filer import settings as filer_settings
 
 
@@ -191,6 +202,135 @@ class FilerApiTests(TestCase):
         # file should still be here
         self.assertTrue(storage.exists(name))
 
+    def test_metadata_change_does_not_touch_file_data(self):
+        image = self.create_filer_image()
+        image = Image.objects.get(pk=image.pk)
+        self.assertFalse(image.file_data_changed())
+        image.sha1 = 'untouched'
+        image._width = 1
+        image.name = 'renamed'
+        image.description = 'a new description'
+        image.save()
+        image = Image.objects.get(pk=image.pk)
+        self.assertEqual(image.sha1, 'untouched')
+        self.assertEqual(image.width, 1)
+
+    def test_file_change_updates_file_data(self):
+        image = self.create_filer_image()
+        sha1 = image.sha1
+        image = Image.objects.get(pk=image.pk)
+        image.sha1 = 'outdated'
+        image._width = 1
+        image.file = DjangoFile(open(self.filename, 'rb'), name='other.jpg')
+        self.assertTrue(image.file_data_changed())
+        image.save()
+        self.assertEqual(image.sha1, sha1)
+        self.assertEqual(image.width, 800)
+        self.assertFalse(image.file_data_changed())
+
+    def test_file_data_changed_hint(self):
+        image = self.create_filer_image()
+        sha1 = image.sha1
+        image.sha1 = 'outdated'
+        image._file_data_changed_hint = True
+        image.save()
+        self.assertEqual(image.sha1, sha1)
+        self.assertEqual(image._file_data_changed_hint, None)
+
+    def test_find_duplicates(self):
+        image_1 = self.create_filer_image()
+        image_2 = self.create_filer_image()
+        other = File.objects.create(
+            owner=self.superuser, original_filename='other.txt',
+            file=DjangoFile(BytesIO(b'other content'), name='other.txt'))
+        self.assertEqual(image_1.duplicates, [image_2])
+        self.assertEqual(other.duplicates, [])
+        duplicates = File.objects.find_all_duplicates()
+        self.assertEqual(list(duplicates), [image_1.sha1])
+        self.assertEqual(set(duplicates[image_1.sha1]), set([image_1, image_2]))
+
+        groups = list(File.objects.iter_duplicate_groups(batch_size=1))
+        self.assertEqual(len(groups), 1)
+        group = groups[0]
+        self.assertEqual(group['count'], 2)
+        self.assertEqual(group['total_size'], 2 * image_1.size)
+        self.assertEqual(group['wasted_size'], image_1.size)
+        self.assertEqual(group['owners'], [self.superuser.username])
+        self.assertEqual([f['pk'] for f in group['files']],
+                         [image_1.pk, image_2.pk])
+
+    def test_duplicates_command(self):
+        image_1 = self.create_filer_image()
+        self.create_filer_image()
+        out = StringIO()
+        call_command('filer_duplicates', format='json', stdout=out)
+        groups = json.loads(out.getvalue())
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0]['sha1'], image_1.sha1)
+        self.assertEqual(groups[0]['wasted_size'], image_1.size)
+        out = StringIO()
+        call_command('filer_duplicates', format='csv', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+    def test_content_addressed_storage(self):
+        upload_to = {
+            'FILER_PUBLICMEDIA_UPLOAD_TO': prefixed_factory(
+                content_addressed, 'filer_public'),
+            'FILER_PRIVATEMEDIA_UPLOAD_TO': content_addressed,
+        }
+        with SettingsOverride(filer_settings, **upload_to):
+            image_1 = self.create_filer_image()
+            image_2 = self.create_filer_image()
+            storage, name = image_1.file.storage, image_1.file.name
+            self.assertEqual(name, image_2.file.name)
+            self.assertEqual(
+                name, 'filer_public/%s/%s/%s.jpg' % (
+                    image_1.sha1[0:2], image_1.sha1[2:4], image_1.sha1))
+            self.assertEqual(image_1._copy_file('copy.jpg'), name)
+
+            # moving one of the files must not remove the shared file
+            image_2.is_public = False
+            image_2.save()
+            self.assertTrue(storage.exists(name))
+            self.assertTrue(image_2.file.storage.exists(image_2.file.name))
+            image_2.delete()
+
+            image_1.delete()
+            self.assertFalse(storage.exists(name))
+
+    def test_content_addressed_storage_reference_counting(self):
+        with SettingsOverride(filer_settings,
+                              FILER_PUBLICMEDIA_UPLOAD_TO=content_addressed):
+            image_1 = self.create_filer_image()
+            image_2 = self.create_filer_image()
+            storage, name = image_1.file.storage, image_1.file.name
+            self.assertEqual(name, image_2.file.name)
+            image_1.delete()
+            self.assertTrue(storage.exists(name))
+            image_2.delete()
+            self.assertFalse(storage.exists(name))
+
+    def test_generate_thumbnails_command(self):
+        image = self.create_filer_image()
+        checkpoint = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, 'thumbnails.checkpoint')
+        options = {'aliases': ['icon_32'], 'processes': 1, 'stdout': StringIO()}
+        call_command('filer_generate_thumbnails', **options)
+        self.assertIn('1 images', options['stdout'].getvalue())
+        self.assertIn('1 thumbnails generated', options['stdout'].getvalue())
+        self.assertTrue(image.file.get_existing_thumbnail(
+            dict(Image.get_icon_thumbnail_options()['32'],
+                 subject_location=image.subject_location)))
+
+        options['stdout'] = StringIO()
+        call_command('filer_generate_thumbnails', checkpoint=checkpoint, **options)
+        self.assertIn('1 already existed', options['stdout'].getvalue())
+        self.assertEqual(open(checkpoint).read(), '%d' % image.pk)
+        # resumes after the last processed image
+        options['stdout'] = StringIO()
+        call_command('filer_generate_thumbnails', checkpoint=checkpoint, **options)
+        self.assertIn('Done: 0 images', options['stdout'].getvalue())
+        os.remove(checkpoint)
+
     def test_folder_quoted_logical_path(self):
         root_folder = Folder.objects.create(name="Foo's Bar", parent=None)
         child = Folder.objects.create(name='Bar"s Foo', parent=root_folder)
@@ -223,3 +363,197 @@ class FilerApiTests(TestCase):
 
             reloaded = Image.objects.get(pk=image.pk)
             self.assertEqual(reloaded.author, image.author)
+
+
+class FolderCountersTestCase(TestCase):
+
+    def setUp(self):
+        self.root = Folder.objects.create(name='root')
+        self.a = Folder.objects.create(name='a', parent=self.root)
+        self.b = Folder.objects.create(name='b', parent=self.a)
+        self.c = Folder.objects.create(name='c', parent=self.root)
+
+    def create_file(self, folder, size):
+        return File.objects.create(folder=folder, _file_size=size,
+                                   original_filename='file.txt')
+
+    def assertCounters(self, folder, file_count, children_count,
+                       total_file_count, total_size):
+        folder = Folder.objects.get(pk=folder.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual((folder.file_count, folder.children_count,
+                              folder.total_file_count, folder.total_size),
+                             (file_count, children_count, total_file_count, total_size))
+
+    def assertConsistent(self):
+        self.assertEqual(check_folder_counters(Folder, File), [])
+
+    def test_files(self):
+        f = self.create_file(self.b, 10)
+        self.create_file(self.b, None)
+        self.create_file(self.a, 5)
+        self.assertCounters(self.b, 2, 0, 2, 10)
+        self.assertCounters(self.a, 1, 1, 3, 15)
+        self.assertCounters(self.root, 0, 2, 3, 15)
+        # resized
+        f._file_size = 20
+        f.save()
+        self.assertCounters(self.root, 0, 2, 3, 25)
+        # moved
+        f.folder = self.c
+        f.save()
+        self.assertCounters(self.b, 1, 0, 1, 0)
+        self.assertCounters(self.c, 1, 0, 1, 20)
+        self.assertCounters(self.root, 0, 2, 3, 25)
+        # unfiled
+        f.folder = None
+        f.save()
+        self.assertCounters(self.root, 0, 2, 2, 5)
+        f.delete()
+        File.objects.filter(folder=self.b).delete()
+        self.assertCounters(self.root, 0, 2, 1, 5)
+        self.assertConsistent()
+
+    def test_stale_folder(self):
+        stale = Folder.objects.get(pk=self.b.pk)
+        self.create_file(self.b, 10)
+        stale.name = 'renamed'
+        stale.save()
+        self.assertCounters(self.b, 1, 0, 1, 10)
+        # without update_fields (Django 1.4)
+        stale.name = 'b'
+        with SettingsOverride(foldermodels, DJANGO_1_4=True):
+            self.create_file(self.b, 5)
+            stale.save()
+        self.assertCounters(self.b, 2, 0, 2, 15)
+        self.assertConsistent()
+
+    def test_image(self):
+        filename = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, 'counted.jpg')
+        create_image().save(filename, 'JPEG')
+        with open(filename, 'rb') as f:
+            image = Image.objects.create(folder=self.b, original_filename='counted.jpg',
+                                         file=DjangoFile(f, name='counted.jpg'))
+        size = os.path.getsize(filename)
+        os.remove(filename)
+        self.assertCounters(self.root, 0, 2, 1, size)
+        # deleted through the polymorphic base class
+        File.objects.get(pk=image.pk).delete()
+        self.assertCounters(self.root, 0, 2, 0, 0)
+        self.assertConsistent()
+
+    def test_folders(self):
+        self.create_file(self.b, 10)
+        self.create_file(self.a, 5)
+        self.b.parent = self.c
+        self.b.save()
+        self.assertCounters(self.a, 1, 0, 1, 5)
+        self.assertCounters(self.c, 0, 1, 1, 10)
+        self.assertCounters(self.root, 0, 2, 2, 15)
+        # to the root and back
+        self.c.parent = None
+        self.c.save()
+        self.assertCounters(self.root, 0, 1, 1, 5)
+        self.c = Folder.objects.get(pk=self.c.pk)
+        self.c.parent = self.a
+        self.c.save()
+        self.assertCounters(self.root, 0, 1, 2, 15)
+        self.assertConsistent()
+        # deleted with their subfolders and files
+        Folder.objects.get(pk=self.c.pk).delete()
+        self.assertCounters(self.a, 1, 0, 1, 5)
+        self.assertCounters(self.root, 0, 1, 1, 5)
+        self.assertConsistent()
+        Folder.objects.filter(pk=self.a.pk).delete()
+        self.assertCounters(self.root, 0, 0, 0, 0)
+        self.assertConsistent()
+
+    def test_copy(self):
+        f = self.create_file(self.b, 10)
+        f.pk = f.id = None
+        f.save()
+        f.folder = self.c
+        f.save()
+        self.assertCounters(self.b, 1, 0, 1, 10)
+        self.assertCounters(self.c, 1, 0, 1, 10)
+        self.assertConsistent()
+
+    def test_rebuild_counters(self):
+        self.create_file(self.b, 10)
+        Folder.objects.filter(pk=self.a.pk).update(_total_size=0, _children_count=7)
+        self.assertEqual(check_folder_counters(Folder, File), [self.a.pk])
+        self.assertRaises(CommandError, call_command, 'filer_rebuild_counters',
+                          check=True, verbosity=0)
+        call_command('filer_rebuild_counters', verbosity=0)
+        call_command('filer_rebuild_counters', check=True, verbosity=0)
+        self.assertCounters(self.a, 0, 1, 1, 10)
+
+
+class StorageUsageTestCase(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'x')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'x')
+        self.clients = Folder.objects.create(name='clients')
+        self.acme = Folder.objects.create(name='acme', parent=self.clients)
+        self.invoices = Folder.objects.create(name='invoices', parent=self.acme)
+        self.other = Folder.objects.create(name='other', parent=self.clients)
+        for folder, owner, size in ((self.acme, self.alice, 10),
+                                    (self.invoices, self.alice, 20),
+                                    (self.invoices, self.bob, 5),
+                                    (self.other, self.bob, 100),
+                                    (None, None, 1)):
+            File.objects.create(folder=folder, owner=owner, _file_size=size,
+                                original_filename='file.txt')
+
+    def test_usage(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(File.objects.usage(self.acme),
+                             {'count': 3, 'total_size': 35})
+        self.assertEqual(File.objects.usage(), {'count': 5, 'total_size': 136})
+
+    def test_owner_usage(self):
+        with self.assertNumQueries(1):
+            rows = list(File.objects.owner_usage(self.acme))
+        self.assertEqual([(row['owner_name'], row['count'], row['total_size'])
+                          for row in rows], [('alice', 2, 30), ('bob', 1, 5)])
+
+    def test_subfolder_usage(self):
+        for live in (False, True):
+            with self.assertNumQueries(2 if live else 1):
+                rows = Folder.objects.subfolder_usage(self.clients, live=live)
+            self.assertEqual([(row['folder'].name, row['count'], row['total_size'])
+                              for row in rows], [('other', 1, 100), ('acme', 3, 35)])
+            rows = Folder.objects.subfolder_usage(live=live)
+            self.assertEqual([(row['folder'].name, row['count'], row['total_size'])
+                              for row in rows], [('clients', 4, 135)])
+
+    def test_rollup(self):
+        rows, computed_at = OwnerUsage.objects.report()
+        self.assertEqual(computed_at, None)
+        self.assertEqual(OwnerUsage.objects.refresh(), 3)
+        File.objects.create(folder=self.acme, owner=self.alice, _file_size=1000)
+        with self.assertNumQueries(1):
+            rows, computed_at = OwnerUsage.objects.report()
+        self.assertNotEqual(computed_at, None)
+        self.assertEqual([(row['owner_name'], row['total_size']) for row in rows],
+                         [('bob', 105), ('alice', 30), (None, 1)])
+        rows, computed_at = OwnerUsage.objects.report(live=True)
+        self.assertEqual([(row['owner_name'], row['total_size']) for row in rows],
+                         [('alice', 1030), ('bob', 105), (None, 1)])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('filer_usage', folder=self.clients.pk, by='folder',
+                     format='csv', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'folder,name,count,total_size',
+            '%d,/clients/other,1,100' % self.other.pk,
+            '%d,/clients/acme,3,35' % self.acme.pk,
+        ])
+        out = StringIO()
+        call_command('filer_usage', stdout=out)
+        self.assertTrue(out.getvalue().splitlines()[-1].startswith('Total: 5 files, 136'))
+        call_command('filer_usage', refresh=True, verbosity=0)
+        self.assertEqual(OwnerUsage.objects.count(), 3)
+        self.assertRaises(CommandError, call_command, 'filer_usage', by='size')
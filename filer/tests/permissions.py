@@ -1,14 +1,22 @@
 #-*- coding: utf-8 -*-
 from django.contrib.auth.models import Group
+from django.core.exceptions import PermissionDenied
 from django.core.files import File as DjangoFile
 from django.conf import settings
+from django.core.cache import cache
 from django.test.testcases import TestCase
 from filer import settings as filer_settings
+from filer.admin.tools import (check_folder_edit_permissions,
+                               check_folder_read_permissions,
+                               get_permission_offenders)
 from filer.models.clipboardmodels import Clipboard
-from filer.models.foldermodels import Folder, FolderPermission
+from filer.models.filemodels import File
+from filer.models.foldermodels import (Folder, FolderPermission,
+                                       merge_ranges, subtract_ranges)
 from filer.models.imagemodels import Image
 from filer.tests.utils import Mock
-from filer.tests.helpers import create_image, create_superuser
+from filer.tests.helpers import create_image, create_superuser, SettingsOverride
+from filer.utils import permission_cache
 import os
 
 class FolderPermissionsTestCase(TestCase):
@@ -313,3 +321,309 @@ class FolderPermissionsTestCase(TestCase):
 
         finally:
             filer_settings.FILER_ENABLE_PERMISSIONS = old_setting
+
+
+class FolderIdListTestCase(TestCase):
+
+    def setUp(self):
+        try:
+            from django.contrib.auth import get_user_model
+            User = get_user_model()
+        except ImportError:
+            from django.contrib.auth.models import User  # NOQA
+        self.user = User.objects.create(username='test1', password='secret')
+        self.group = Group.objects.create(name='name1')
+        self.user.groups.add(self.group)
+        self.root = Folder.objects.create(name='root')
+        self.child = Folder.objects.create(name='child', parent=self.root)
+        self.other = Folder.objects.create(name='other')
+        self.old_setting = filer_settings.FILER_ENABLE_PERMISSIONS
+        filer_settings.FILER_ENABLE_PERMISSIONS = True
+
+    def tearDown(self):
+        filer_settings.FILER_ENABLE_PERMISSIONS = self.old_setting
+
+    def test_children_rule(self):
+        rule = FolderPermission.objects.create(
+            folder=self.root, type=FolderPermission.CHILDREN, group=self.group,
+            can_read=FolderPermission.ALLOW)
+        self.assertEqual(set(FolderPermission.objects.get_read_id_list(self.user)),
+                         set([self.root.pk, self.child.pk]))
+        # new subfolders inherit the rule
+        grandchild = Folder.objects.create(name='grandchild', parent=self.child)
+        self.assertTrue(grandchild.pk in FolderPermission.objects.get_read_id_list(self.user))
+        # folders moved out of the subtree lose it
+        self.child.parent = self.other
+        self.child.save()
+        self.assertEqual(set(FolderPermission.objects.get_read_id_list(self.user)),
+                         set([self.root.pk]))
+        rule.delete()
+        self.assertEqual(FolderPermission.objects.get_read_id_list(self.user), set())
+
+    def test_deny(self):
+        FolderPermission.objects.create(
+            type=FolderPermission.ALL, everybody=True, can_read=FolderPermission.ALLOW)
+        FolderPermission.objects.create(
+            folder=self.root, type=FolderPermission.THIS, user=self.user,
+            can_read=FolderPermission.DENY)
+        read_ids = FolderPermission.objects.get_read_id_list(self.user)
+        self.assertFalse(self.root.pk in read_ids)
+        self.assertTrue(self.child.pk in read_ids)
+        self.assertTrue(self.other.pk in read_ids)
+
+    def test_delete_folder(self):
+        FolderPermission.objects.create(
+            folder=self.child, type=FolderPermission.CHILDREN, user=self.user,
+            can_edit=FolderPermission.ALLOW)
+        self.root.delete()
+        self.assertEqual(FolderPermission.objects.count(), 0)
+        self.assertEqual(FolderPermission.objects.get_edit_id_list(self.user), set())
+
+
+class FolderRangesTestCase(TestCase):
+
+    def setUp(self):
+        try:
+            from django.contrib.auth import get_user_model
+            User = get_user_model()
+        except ImportError:
+            from django.contrib.auth.models import User  # NOQA
+        self.user = User.objects.create(username='test1', password='secret')
+        self.group = Group.objects.create(name='name1')
+        self.user.groups.add(self.group)
+        self.root = Folder.objects.create(name='root')
+        self.child1 = Folder.objects.create(name='child1', parent=self.root)
+        self.child2 = Folder.objects.create(name='child2', parent=self.root)
+        self.grandchild = Folder.objects.create(name='grandchild', parent=self.child1)
+        self.other = Folder.objects.create(name='other')
+        self.folders = [self.root, self.child1, self.child2, self.grandchild, self.other]
+        self.old_setting = filer_settings.FILER_ENABLE_PERMISSIONS
+        filer_settings.FILER_ENABLE_PERMISSIONS = True
+
+    def tearDown(self):
+        filer_settings.FILER_ENABLE_PERMISSIONS = self.old_setting
+
+    def assertReadable(self, folders):
+        expected = set(folder.pk for folder in folders)
+        ranges = FolderPermission.objects.get_read_ranges(self.user)
+        self.assertEqual(set(folder.pk for folder in Folder.objects.all()
+                             if folder in ranges), expected)
+        self.assertEqual(set(Folder.objects.readable_by(self.user).values_list(
+            'pk', flat=True)), expected)
+        self.assertEqual(set(FolderPermission.objects.get_read_id_list(self.user)),
+                         expected)
+
+    def test_merge_and_subtract(self):
+        self.assertEqual(merge_ranges([(1, 5, 6), (1, 1, 4), (2, 1, 2), (1, 3, 8)]),
+                         [(1, 1, 8), (2, 1, 2)])
+        self.assertEqual(subtract_ranges([(1, 1, 10), (2, 1, 4)], [(1, 3, 4), (1, 8, 12)]),
+                         [(1, 1, 2), (1, 5, 7), (2, 1, 4)])
+        self.assertEqual(subtract_ranges([(1, 2, 3)], [(1, 1, 10)]), [])
+
+    def test_children_with_deny(self):
+        self.assertReadable([])
+        FolderPermission.objects.create(
+            folder=self.root, type=FolderPermission.CHILDREN, group=self.group,
+            can_read=FolderPermission.ALLOW)
+        self.assertReadable([self.root, self.child1, self.child2, self.grandchild])
+        # a single range, however many subfolders there are
+        self.assertEqual(len(FolderPermission.objects.get_read_ranges(self.user).ranges), 1)
+        FolderPermission.objects.create(
+            folder=self.child1, type=FolderPermission.THIS, user=self.user,
+            can_read=FolderPermission.DENY)
+        self.assertReadable([self.root, self.child2, self.grandchild])
+        FolderPermission.objects.create(
+            folder=self.child1, type=FolderPermission.CHILDREN, user=self.user,
+            can_read=FolderPermission.DENY)
+        self.assertReadable([self.root, self.child2])
+
+    def test_all_with_deny(self):
+        FolderPermission.objects.create(
+            type=FolderPermission.ALL, everybody=True, can_read=FolderPermission.ALLOW)
+        self.assertReadable(self.folders)
+        FolderPermission.objects.create(
+            folder=self.child1, type=FolderPermission.CHILDREN, group=self.group,
+            can_read=FolderPermission.DENY)
+        self.assertReadable([self.root, self.child2, self.other])
+        FolderPermission.objects.create(
+            type=FolderPermission.ALL, user=self.user, can_read=FolderPermission.DENY)
+        self.assertReadable([])
+
+    def test_files(self):
+        FolderPermission.objects.create(
+            folder=self.child1, type=FolderPermission.CHILDREN, user=self.user,
+            can_read=FolderPermission.ALLOW)
+        readable = File.objects.create(folder=self.grandchild)
+        owned = File.objects.create(folder=self.other, owner=self.user)
+        File.objects.create(folder=self.child2)
+        File.objects.create()
+        self.assertEqual(set(File.objects.readable_by(self.user).values_list('pk', flat=True)),
+                         set([readable.pk, owned.pk]))
+
+
+class PermissionCacheTestCase(TestCase):
+
+    def setUp(self):
+        try:
+            from django.contrib.auth import get_user_model
+            User = get_user_model()
+        except ImportError:
+            from django.contrib.auth.models import User  # NOQA
+        self.user = User.objects.create(username='test1', password='secret')
+        self.group = Group.objects.create(name='name1')
+        self.folder = Folder.objects.create(name='folder')
+        self.old_setting = filer_settings.FILER_ENABLE_PERMISSIONS
+        filer_settings.FILER_ENABLE_PERMISSIONS = True
+        # not cached by default with the local memory cache of the tests
+        self.old_timeout = filer_settings.FILER_PERMISSION_CACHE_TIMEOUT
+        filer_settings.FILER_PERMISSION_CACHE_TIMEOUT = 3600
+        permission_cache.reset_stats()
+
+    def tearDown(self):
+        filer_settings.FILER_ENABLE_PERMISSIONS = self.old_setting
+        filer_settings.FILER_PERMISSION_CACHE_TIMEOUT = self.old_timeout
+
+    def test_default_timeout(self):
+        self.assertEqual(self.old_timeout, 0)
+
+    def can_read(self):
+        return self.folder in FolderPermission.objects.get_read_ranges(self.user)
+
+    def test_cached(self):
+        FolderPermission.objects.create(
+            folder=self.folder, type=FolderPermission.THIS, user=self.user,
+            can_read=FolderPermission.ALLOW)
+        self.assertTrue(self.can_read())
+        with self.assertNumQueries(0):
+            self.assertTrue(self.can_read())
+        # other processes use the django cache
+        permission_cache.local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertTrue(self.can_read())
+        self.assertEqual(permission_cache.get_stats(),
+                         {'local_hits': 1, 'hits': 1, 'misses': 1})
+
+    def test_version_read_once(self):
+        self.assertFalse(self.can_read())
+        # another process changes the permissions
+        cache.set(permission_cache.VERSION_KEY, 'other')
+        self.assertFalse(self.can_read())
+        self.assertEqual(permission_cache.get_stats()['local_hits'], 1)
+        with SettingsOverride(permission_cache, _local_version=(None, 0)):
+            self.assertFalse(self.can_read())
+        self.assertEqual(permission_cache.get_stats()['misses'], 2)
+
+    def test_invalidation(self):
+        self.assertFalse(self.can_read())
+        rule = FolderPermission.objects.create(
+            folder=self.folder, type=FolderPermission.THIS, group=self.group,
+            can_read=FolderPermission.ALLOW)
+        self.assertFalse(self.can_read())
+        self.user.groups.add(self.group)
+        self.assertTrue(self.can_read())
+        self.group.user_set.remove(self.user)
+        self.assertFalse(self.can_read())
+        self.user.groups.add(self.group)
+        self.assertTrue(self.can_read())
+        # the folder moves to another position of the tree
+        Folder.objects.create(name='before')
+        self.folder = Folder.objects.get(pk=self.folder.pk)
+        self.assertTrue(self.can_read())
+        rule.delete()
+        self.assertFalse(self.can_read())
+        self.assertEqual(permission_cache.get_stats()['misses'], 7)
+
+    def test_disabled(self):
+        with SettingsOverride(filer_settings, FILER_PERMISSION_CACHE_TIMEOUT=0):
+            self.can_read()
+            self.can_read()
+        self.assertEqual(permission_cache.get_stats(),
+                         {'local_hits': 0, 'hits': 0, 'misses': 2})
+
+    def test_lru(self):
+        lru = permission_cache.LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(lru.get('a'), 1)
+        lru.set('c', 3)
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(len(lru), 2)
+
+
+class ItemPermissionsTestCase(TestCase):
+
+    def setUp(self):
+        try:
+            from django.contrib.auth import get_user_model
+            User = get_user_model()
+        except ImportError:
+            from django.contrib.auth.models import User  # NOQA
+        self.user = User.objects.create(username='test1', password='secret')
+        self.root = Folder.objects.create(name='root')
+        self.child = Folder.objects.create(name='child', parent=self.root)
+        self.owned = Folder.objects.create(name='owned', owner=self.user)
+        self.other = Folder.objects.create(name='other')
+        FolderPermission.objects.create(
+            folder=self.root, type=FolderPermission.CHILDREN, user=self.user,
+            can_read=FolderPermission.ALLOW, can_edit=FolderPermission.ALLOW)
+        FolderPermission.objects.create(
+            folder=self.child, type=FolderPermission.THIS, user=self.user,
+            can_edit=FolderPermission.DENY)
+        self.items = [
+            self.root, self.child, self.owned, self.other,
+            File.objects.create(folder=self.child),
+            File.objects.create(folder=self.owned),
+            File.objects.create(folder=self.other),
+            File.objects.create(folder=self.other, owner=self.user),
+            File.objects.create(),
+        ]
+        self.request = Mock()
+        setattr(self.request, 'user', self.user)
+        self.old_setting = filer_settings.FILER_ENABLE_PERMISSIONS
+        filer_settings.FILER_ENABLE_PERMISSIONS = True
+        self.old_timeout = filer_settings.FILER_PERMISSION_CACHE_TIMEOUT
+        filer_settings.FILER_PERMISSION_CACHE_TIMEOUT = 3600
+
+    def tearDown(self):
+        filer_settings.FILER_ENABLE_PERMISSIONS = self.old_setting
+        filer_settings.FILER_PERMISSION_CACHE_TIMEOUT = self.old_timeout
+
+    def test_item_permissions(self):
+        expected = [dict((t, getattr(item, 'has_%s_permission' % t)(self.request))
+                         for t in ('read', 'edit', 'add_children'))
+                    for item in self.items]
+        with self.assertNumQueries(1):
+            # the rules are cached, the folders of the files are not loaded
+            permissions = FolderPermission.objects.get_item_permissions(
+                self.user, self.items)
+        self.assertEqual(permissions, expected)
+        self.assertEqual([p['edit'] for p in permissions],
+                         [True, False, True, False, False, True, False, True, False])
+
+    def test_check_folder_permissions(self):
+        check_folder_read_permissions(self.request, [self.root])
+        self.assertRaises(PermissionDenied, check_folder_edit_permissions,
+                          self.request, [self.root])
+        File.objects.create(folder=Folder.objects.create(name='sub', parent=self.owned))
+        self.assertRaises(PermissionDenied, check_folder_read_permissions,
+                          self.request, [self.owned])
+
+    def test_permission_offenders(self):
+        child_file = self.items[4]
+        self.assertEqual(get_permission_offenders(
+            self.request, [], [self.root], ('read',)), [])
+        self.assertEqual(get_permission_offenders(
+            self.request, [], [self.root], ('read', 'edit')), [self.child, child_file])
+        self.assertEqual(get_permission_offenders(
+            self.request, File.objects.filter(pk__in=[f.pk for f in self.items[5:]]),
+            [], ('read',)), [self.items[6], self.items[8]])
+        # a deep tree is checked with a constant number of queries
+        parent = self.child
+        for i in range(5):
+            parent = Folder.objects.create(name='level%d' % i, parent=parent)
+            File.objects.create(folder=parent)
+        FolderPermission.objects.get_edit_ranges(self.user)
+        with self.assertNumQueries(2):
+            offenders = get_permission_offenders(self.request, [], [self.root], ('edit',))
+        self.assertEqual(len(offenders), 2)
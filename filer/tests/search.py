@@ -0,0 +1,223 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from filer import settings as filer_settings
+from filer import models as filer_models
+from filer.models import File, Folder
+from filer.models.filemodels import install_search_index
+from filer.search import get_search_backend, tokenize
+from filer.search.backends.memory import (CHANGE_KEY, SEQUENCE_KEY,
+                                          MemorySearchBackend)
+from filer.tests.helpers import SettingsOverride, create_superuser
+
+
+class SearchBackendTestMixin(object):
+
+    def setUp(self):
+        self.superuser = create_superuser()
+        self.joe = self.superuser.__class__.objects.create_user(
+            'joe', 'joe@mata.com', 'x')
+        self.photos = Folder.objects.create(name='Holiday photos', owner=self.joe)
+        self.beach = Folder.objects.create(name='Beach', parent=self.photos)
+        self.other = Folder.objects.create(name='Other')
+        self.sunset = File.objects.create(
+            folder=self.beach, name='Sunset', original_filename='img_0001.jpg',
+            description='The beach at night', owner=self.superuser)
+        self.report = File.objects.create(
+            folder=self.other, original_filename='beach_report.pdf',
+            owner=self.joe)
+        self.notes = File.objects.create(
+            folder=self.photos, original_filename='notes.txt',
+            description='Café prices')
+
+    def search(self, model, query, **kwargs):
+        return [pk for pk, rank in self.backend.search(model, query, **kwargs)]
+
+    def filter(self, queryset, query, **kwargs):
+        return set(self.backend.filter(queryset, query, **kwargs).values_list(
+            'pk', flat=True))
+
+    def test_prefix_match_on_all_the_words(self):
+        self.assertEqual(self.filter(File.objects.all(), 'beach'),
+                         set([self.sunset.pk, self.report.pk]))
+        self.assertEqual(self.filter(File.objects.all(), 'bea rep'),
+                         set([self.report.pk]))
+        self.assertEqual(self.filter(File.objects.all(), 'img_0001'),
+                         set([self.sunset.pk]))
+        self.assertEqual(self.filter(File.objects.all(), 'each'), set())
+        # without diacritics, and without any word
+        self.assertEqual(self.filter(File.objects.all(), 'cafe'), set([self.notes.pk]))
+        self.assertEqual(self.filter(File.objects.all(), ' - '),
+                         set(File.objects.values_list('pk', flat=True)))
+
+    def test_owner(self):
+        self.assertEqual(self.filter(Folder.objects.all(), 'joe@mata.com'),
+                         set([self.photos.pk]))
+        self.assertEqual(self.filter(File.objects.all(), 'joe'), set([self.report.pk]))
+        # the owners are only matched by the given fields
+        self.assertEqual(self.filter(Folder.objects.all(), 'joe@mata.com',
+                                     owner_fields=['username']), set())
+        self.assertEqual(self.filter(Folder.objects.all(), 'jo holi',
+                                     owner_fields=['username']), set([self.photos.pk]))
+
+    def test_ranking(self):
+        # a match of the name is better than a match of the description
+        self.assertEqual(self.search(File, 'beach'), [self.report.pk, self.sunset.pk])
+        self.assertEqual(self.search(File, 'beach', limit=1), [self.report.pk])
+
+    def test_folder_scope(self):
+        self.assertEqual(self.search(File, 'beach', folder=self.photos), [self.sunset.pk])
+        self.assertEqual(self.search(Folder, 'beach', folder=self.photos), [self.beach.pk])
+        self.assertEqual(self.search(Folder, 'beach', folder=self.beach), [])
+
+    def test_kept_up_to_date(self):
+        self.assertEqual(self.search(File, 'sunset'), [self.sunset.pk])
+        self.sunset.name = 'Sunrise'
+        self.sunset.save()
+        self.assertEqual(self.search(File, 'sunset'), [])
+        self.assertEqual(self.search(File, 'sunrise'), [self.sunset.pk])
+        self.joe.username = 'joseph'
+        self.joe.save()
+        self.assertEqual(self.search(Folder, 'joseph'), [self.photos.pk])
+        self.assertEqual(self.search(File, 'joseph'), [self.report.pk])
+        # along with the folder
+        self.photos.delete()
+        self.assertEqual(self.search(Folder, 'beach'), [])
+        self.assertEqual(self.search(File, 'sunrise'), [])
+        self.report.delete()
+        self.assertEqual(self.search(File, 'beach'), [])
+
+
+class DatabaseSearchBackendTestCase(SearchBackendTestMixin, TestCase):
+
+    def setUp(self):
+        self.backend = get_search_backend()
+        super(DatabaseSearchBackendTestCase, self).setUp()
+
+    def test_backend(self):
+        self.assertEqual(self.backend.ranks_in_database,
+                         connection.vendor in ('sqlite', 'postgresql'))
+
+    def test_owner_saved_without_changes(self):
+        # e.g. the last login, the files and folders of the owner are not
+        # indexed again
+        with self.assertNumQueries(2):
+            self.joe.save()
+        with self.assertNumQueries(1):
+            self.joe.save(update_fields=['last_login'])
+
+    def test_installed_after_migrate(self):
+        # e.g. syncdb without migrations
+        self.backend.uninstall(File, Folder)
+        self.assertEqual(self.backend.is_installed(File, Folder),
+                         not self.backend.ranks_in_database)
+        install_search_index(sender=filer_models)
+        self.assertTrue(self.backend.is_installed(File, Folder))
+        self.assertEqual(self.search(File, 'beach'), [self.report.pk, self.sunset.pk])
+
+    def test_rebuild(self):
+        out = StringIO()
+        call_command('filer_rebuild_search_index', stdout=out)
+        self.assertTrue(out.getvalue().startswith('Indexed 3 files and 3 folders'))
+        self.assertEqual(self.search(File, 'beach'), [self.report.pk, self.sunset.pk])
+
+
+class MemorySearchBackendTestCase(SearchBackendTestMixin, TestCase):
+
+    def setUp(self):
+        self.override = SettingsOverride(
+            filer_settings,
+            FILER_SEARCH_BACKEND='filer.search.backends.memory.MemorySearchBackend')
+        self.override.__enter__()
+        self.backend = get_search_backend()
+        # forget the documents of the previous tests
+        self.backend.rebuild(File, Folder)
+        super(MemorySearchBackendTestCase, self).setUp()
+
+    def tearDown(self):
+        self.override.__exit__(None, None, None)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Café_menu-2015.JPG'), ['cafe', 'menu', '2015', 'jpg'])
+
+    def test_changes_of_other_processes(self):
+        other = MemorySearchBackend()
+        self.assertEqual(other.search(File, 'sunset'), [(self.sunset.pk, 10.0)])
+        index = other.get_index(File)
+        self.sunset.name = 'Sunrise'
+        self.sunset.save()
+        self.assertEqual(other.search(File, 'sunrise'), [(self.sunset.pk, 10.0)])
+        self.assertEqual(other.search(File, 'sunset'), [])
+        # only the changed file was indexed again
+        self.assertTrue(other.get_index(File) is index)
+        # unless the journal was lost
+        cache.delete(CHANGE_KEY % cache.get(SEQUENCE_KEY))
+        self.sunset.save()
+        cache.delete(CHANGE_KEY % cache.get(SEQUENCE_KEY))
+        self.assertFalse(other.get_index(File) is index)
+
+    def test_many_matches(self):
+        # more matches than the database accepts query parameters
+        ctype = ContentType.objects.get_for_model(File)
+        File.objects.bulk_create([
+            File(original_filename='many_%d.txt' % i, polymorphic_ctype=ctype)
+            for i in range(1200)])
+        self.backend.rebuild(File, Folder)
+        self.assertEqual(len(self.filter(File.objects.all(), 'many')),
+                         self.backend.max_matches)
+        self.assertEqual(len(self.filter(File.objects.all(), 'many',
+                                         owner_fields=['username'])),
+                         self.backend.max_matches)
+        self.assertEqual(len(self.search(File, 'many')), 1200)
+
+
+class AdminSearchTest(TestCase):
+
+    def setUp(self):
+        self.superuser = create_superuser()
+        self.client.login(username='admin', password='secret')
+        self.folder = Folder.objects.create(name='folder')
+        self.described = File.objects.create(
+            folder=self.folder, original_filename='a.txt', description='lake')
+        self.named = File.objects.create(folder=self.folder, original_filename='lake.txt')
+        self.url = reverse('admin:filer-directory_listing',
+                           kwargs={'folder_id': self.folder.id})
+
+    def test_ranked(self):
+        response = self.client.get(self.url, {'q': 'lak'})
+        self.assertEqual(
+            [item.pk for item, perms in response.context['paginated_items'].object_list],
+            [self.named.pk, self.described.pk])
+        # unless ordered otherwise
+        response = self.client.get(self.url, {'q': 'lak', 'order_by': 'original_filename'})
+        self.assertEqual(
+            [item.pk for item, perms in response.context['paginated_items'].object_list],
+            [self.described.pk, self.named.pk])
+
+    def test_search_limit(self):
+        response = self.client.get(self.url, {'q': 'lake'})
+        self.assertEqual(response.context['search_limit'], None)
+        with SettingsOverride(
+                filer_settings,
+                FILER_SEARCH_BACKEND='filer.search.backends.memory.MemorySearchBackend'):
+            backend = get_search_backend()
+            backend.rebuild(File, Folder)
+            with SettingsOverride(backend, max_matches=1):
+                response = self.client.get(self.url, {'q': 'lake'})
+        self.assertEqual(response.context['search_limit'], 1)
+        self.assertEqual(len(response.context['paginated_items'].object_list), 1)
+
+    def test_limit_search_to_folder(self):
+        File.objects.create(original_filename='lake.txt')
+        response = self.client.get(self.url, {'q': 'lake', 'limit_search_to_folder': 'on'})
+        self.assertEqual(
+            set(item.pk for item, perms in response.context['paginated_items'].object_list),
+            set([self.named.pk, self.described.pk]))
@@ -1,19 +1,32 @@
 #-*- coding: utf-8 -*-
+import hashlib
 import time
 import shutil
 import os
+import tempfile
+from django.core.files.base import ContentFile, File as DjangoFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.http import HttpResponseNotModified, Http404
 from django.test import TestCase
+from django.utils.encoding import force_bytes
 from django.utils.http import http_date
 from filer import settings as filer_settings
-from filer.models import File
+from filer.models import File, Folder, Image
 from filer.server.backends.default import DefaultServer
 from filer.server.backends.nginx import NginxXAccelRedirectServer
+from filer.server.backends.proxy import StorageProxyServer
+from filer.server import views as server_views
 from filer.server.backends.xsendfile import ApacheXSendfileServer
-from filer.tests.helpers import create_image
+from filer.tests.helpers import create_image, create_superuser, SettingsOverride
+from filer.tests.transfer import MemoryStorage
 from filer.tests.utils import Mock
 
+try:
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+except ImportError:
+    from django.contrib.auth.models import User  # NOQA
+
 
 class BaseServerBackendTestCase(TestCase):
     def setUp(self):
@@ -66,6 +79,85 @@ class DefaultServerTestCase(BaseServerBackendTestCase):
         os.remove(self.filer_file.file.path)
         self.assertRaises(Http404, server.serve, *(request, self.filer_file.file))
 
+    def get_content(self):
+        with open(self.filer_file.file.path, 'rb') as f:
+            return f.read()
+
+    def serve(self, **meta):
+        request = Mock()
+        request.META = meta
+        response = DefaultServer().serve(request, self.filer_file.file)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, content
+
+    def test_streaming(self):
+        response, content = self.serve()
+        self.assertTrue(response.streaming)
+        self.assertEqual(content, self.get_content())
+        self.assertEqual(response['Content-Length'], str(len(content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_range(self):
+        expected = self.get_content()
+        size = len(expected)
+        response, content = self.serve(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, expected[10:20])
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/%d' % size)
+
+        # suffix and open ended ranges
+        response, content = self.serve(HTTP_RANGE='bytes=-5')
+        self.assertEqual(content, expected[-5:])
+        self.assertEqual(response['Content-Range'], 'bytes %d-%d/%d' % (size - 5, size - 1, size))
+        response, content = self.serve(HTTP_RANGE='bytes=%d-' % (size - 3))
+        self.assertEqual(content, expected[-3:])
+        # the end is clipped to the size of the file
+        response, content = self.serve(HTTP_RANGE='bytes=0-%d' % (size * 2))
+        self.assertEqual(content, expected)
+        self.assertEqual(response.status_code, 206)
+
+    def test_multiple_ranges(self):
+        expected = self.get_content()
+        response, content = self.serve(HTTP_RANGE='bytes=0-4,100-109')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        self.assertEqual(response['Content-Length'], str(len(content)))
+        boundary = response['Content-Type'].split('boundary=')[1].encode('ascii')
+        parts = content.split(b'--' + boundary)
+        # empty preamble, two parts and the closing --
+        self.assertEqual(len(parts), 4)
+        self.assertTrue(parts[1].endswith(b'\r\n\r\n' + expected[0:5] + b'\r\n'))
+        self.assertTrue(force_bytes('Content-Range: bytes 100-109/%d' % len(expected)) in parts[2])
+        self.assertTrue(parts[2].endswith(b'\r\n\r\n' + expected[100:110] + b'\r\n'))
+        self.assertEqual(parts[3], b'--\r\n')
+
+    def test_unsatisfiable_range(self):
+        size = len(self.get_content())
+        response, content = self.serve(HTTP_RANGE='bytes=%d-' % size)
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */%d' % size)
+
+    def test_invalid_range(self):
+        # invalid headers are ignored
+        for header in ('bytes=5-1', 'bytes=x-3', 'lines=1-2'):
+            response, content = self.serve(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(content, self.get_content())
+
+    def test_if_range(self):
+        response, content = self.serve()
+        last_modified = response['Last-Modified']
+        response, content = self.serve(HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE=last_modified)
+        self.assertEqual(response.status_code, 206)
+        # the file changed since, send all of it
+        response, content = self.serve(
+            HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE=http_date(time.time() - 3600))
+        self.assertEqual(response.status_code, 200)
+        response, content = self.serve(HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE='"etag"')
+        self.assertEqual(response.status_code, 200)
+
 
 class NginxServerTestCase(BaseServerBackendTestCase):
     def setUp(self):
@@ -132,3 +224,209 @@ class XSendfileServerTestCase(BaseServerBackendTestCase):
         # make sure the file object was never opened (otherwise the whole delegating to nginx would kinda
         # be useless)
         self.assertTrue(self.filer_file.file.closed)
+
+
+class StorageProxyServerTestCase(TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.content = b''.join(('%04d' % i).encode('ascii') for i in range(1000))
+        self.name = self.storage.save('private/file.pdf', ContentFile(self.content))
+        self.file_obj = DjangoFile(None, name=self.name)
+        self.file_obj.storage = self.storage
+        self.cache_location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_location)
+
+    def serve(self, server, **meta):
+        request = Mock()
+        request.META = meta
+        response = server.serve(request, self.file_obj, save_as=False)
+        content = b''.join(response.streaming_content)
+        response.close()
+        return response, content
+
+    def test_normal(self):
+        response, content = self.serve(StorageProxyServer(chunk_size=100))
+        self.assertEqual(content, self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_range(self):
+        response, content = self.serve(StorageProxyServer(chunk_size=100),
+                                       HTTP_RANGE='bytes=1000-1499')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(content, self.content[1000:1500])
+
+    def test_missing_file(self):
+        self.storage.delete(self.name)
+        self.assertRaises(Http404, self.serve, StorageProxyServer())
+
+    def test_cache(self):
+        server = StorageProxyServer(cache_location=self.cache_location)
+        response, content = self.serve(server)
+        self.assertEqual(content, self.content)
+        # served from the local copy from now on
+        self.storage.files[self.name] = b'changed'
+        response, content = self.serve(server, HTTP_RANGE='bytes=0-3')
+        self.assertEqual(content, self.content[:4])
+        # until it expires
+        server.cache_timeout = 0
+        response, content = self.serve(server)
+        self.assertEqual(content, b'changed')
+
+    def test_cache_max_size(self):
+        server = StorageProxyServer(cache_location=self.cache_location,
+                                    cache_max_size=len(self.content) + 10)
+        self.serve(server)
+        self.file_obj.name = self.storage.save('private/other.pdf', ContentFile(self.content))
+        self.serve(server)
+        cached = [f for d, dirs, files in os.walk(self.cache_location) for f in files]
+        self.assertEqual(len(cached), 1)
+
+    def test_filer_file(self):
+        original_filename = 'testimage.jpg'
+        filer_file = File.objects.create(
+            is_public=False,
+            file=SimpleUploadedFile(name=original_filename, content=b'content'),
+            original_filename=original_filename)
+        try:
+            server = StorageProxyServer(cache_location=self.cache_location)
+            request = Mock()
+            request.META = {}
+            response = server.serve(request, filer_file.file)
+            self.assertEqual(b''.join(response.streaming_content), b'content')
+            response.close()
+            self.assertTrue(response.has_header('Last-Modified'))
+            request.META = {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}
+            response = server.serve(request, filer_file.file)
+            self.assertTrue(isinstance(response, HttpResponseNotModified))
+        finally:
+            filer_file.delete()
+
+
+class ProtectedFileViewTestCase(TestCase):
+    def setUp(self):
+        self.superuser = create_superuser()
+        self.client.login(username='admin', password='secret')
+        original_filename = 'testimage.jpg'
+        image = create_image()
+        self.filename = os.path.join(tempfile.gettempdir(), original_filename)
+        image.save(self.filename, 'JPEG')
+        with open(self.filename, 'rb') as f:
+            self.image = Image.objects.create(
+                is_public=False, owner=self.superuser,
+                file=DjangoFile(f, name=original_filename),
+                original_filename=original_filename)
+
+    def tearDown(self):
+        os.remove(self.filename)
+        self.image.delete()
+
+    def test_path_cache(self):
+        name = self.image.file.name
+        expected = [(self.image.pk, None, self.superuser.pk, self.image.sha1,
+                     self.image.size, self.image.modified_at)]
+        self.assertEqual(File.objects.get_path_info(name), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(File.objects.get_path_info(name), expected)
+        # invalidated on save
+        self.image.owner = None
+        self.image.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(File.objects.get_path_info(name),
+                             [(self.image.pk, None, None, self.image.sha1,
+                               self.image.size, self.image.modified_at)])
+        self.assertEqual(File.objects.get_path_info(name, is_public=True), [])
+        # and on move to the public storage
+        self.image.is_public = True
+        self.image.save()
+        self.assertEqual(File.objects.get_path_info(name), [])
+
+    def test_permissions(self):
+        user = User.objects.create_user('joe', 'joe@example.com', 'secret')
+        self.client.logout()
+        self.client.login(username='joe', password='secret')
+        self.assertEqual(self.client.get(self.image.url).status_code, 404)
+        # the owner may read the file
+        self.image.owner = user
+        self.image.save()
+        self.assertEqual(self.client.get(self.image.url).status_code, 200)
+        # and so may the owner of its folder
+        self.image.owner = self.superuser
+        self.image.folder = Folder.objects.create(name='folder', owner=user)
+        self.image.save()
+        with SettingsOverride(filer_settings, FILER_ENABLE_PERMISSIONS=True):
+            self.assertEqual(self.client.get(self.image.url).status_code, 200)
+            self.image.folder.owner = self.superuser
+            self.image.folder.save()
+            self.assertEqual(self.client.get(self.image.url).status_code, 404)
+
+    def test_etag(self):
+        response = self.client.get(self.image.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"%s"' % self.image.sha1)
+        self.assertEqual(response['Cache-Control'],
+                         filer_settings.FILER_PRIVATEMEDIA_CACHE_CONTROL)
+        # answered without accessing the storage
+        os.remove(self.image.file.path)
+        response = self.client.get(self.image.url, HTTP_IF_NONE_MATCH='"x", %s' % response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"%s"' % self.image.sha1)
+        self.assertEqual(response['Cache-Control'],
+                         filer_settings.FILER_PRIVATEMEDIA_CACHE_CONTROL)
+
+    def test_storage_proxy_server(self):
+        cache_location = tempfile.mkdtemp()
+        proxy = StorageProxyServer(cache_location=cache_location)
+        try:
+            with SettingsOverride(server_views, server=proxy):
+                response = self.client.get(self.image.url)
+                with open(self.image.file.path, 'rb') as f:
+                    self.assertEqual(b''.join(response.streaming_content), f.read())
+                response.close()
+                self.assertEqual(response['ETag'], '"%s"' % self.image.sha1)
+                self.assertTrue(response.has_header('Last-Modified'))
+                response = self.client.get(
+                    self.image.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+                # replaced under the same name, the cached copy is not used
+                with open(self.image.file.path, 'wb') as f:
+                    f.write(b'changed')
+                self.image.sha1 = hashlib.sha1(b'changed').hexdigest()
+                self.image._file_size = 7
+                self.image.save()
+                response = self.client.get(self.image.url)
+                self.assertEqual(b''.join(response.streaming_content), b'changed')
+                response.close()
+                self.assertEqual(response['ETag'], '"%s"' % self.image.sha1)
+                self.assertEqual(response['Content-Length'], '7')
+        finally:
+            shutil.rmtree(cache_location)
+
+    def test_etag_mismatch(self):
+        response = self.client.get(self.image.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        # If-None-Match takes precedence over If-Modified-Since
+        request = Mock()
+        request.META = {'HTTP_IF_NONE_MATCH': '"other"',
+                        'HTTP_IF_MODIFIED_SINCE': http_date(time.time() + 3600)}
+        response = DefaultServer().serve(request, self.image.file, etag='"%s"' % self.image.sha1)
+        response.close()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"%s"' % self.image.sha1)
+
+    def test_thumbnail_etag(self):
+        url = self.image.icons['32']
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertNotEqual(etag, '"%s"' % self.image.sha1)
+        self.assertNotEqual(etag, self.client.get(self.image.icons['48'])['ETag'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # a new version of the image has other thumbnails
+        self.image.sha1 = 'changed'
+        self.image.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,84 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import tempfile
+import time
+
+from django.core.files import File as DjangoFile
+from django.template import Context, Template
+from django.test import TestCase
+
+from filer.models import Image
+from filer.tests.helpers import create_image, create_superuser
+from filer.utils.signing import get_expires, get_signature, sign_url
+
+
+class SignedUrlTestCase(TestCase):
+    def setUp(self):
+        self.superuser = create_superuser()
+        original_filename = 'testimage.jpg'
+        self.filename = os.path.join(tempfile.gettempdir(), original_filename)
+        create_image().save(self.filename, 'JPEG')
+        with open(self.filename, 'rb') as f:
+            self.image = Image.objects.create(
+                is_public=False, owner=self.superuser,
+                file=DjangoFile(f, name=original_filename),
+                original_filename=original_filename)
+
+    def tearDown(self):
+        os.remove(self.filename)
+        self.image.delete()
+
+    def test_unsigned(self):
+        self.assertEqual(self.client.get(self.image.url).status_code, 404)
+
+    def test_signed_url(self):
+        url = self.image.get_signed_url()
+        self.assertTrue(url.startswith(self.image.url + '?'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(b''.join(response.streaming_content), f.read())
+        # URLs created in the meantime are the same
+        self.assertEqual(url, self.image.get_signed_url())
+
+    def test_public_file(self):
+        self.image.is_public = True
+        self.assertEqual(self.image.get_signed_url(), self.image.url)
+
+    def test_expired(self):
+        expires = int(time.time()) - 1
+        url = '%s?expires=%d&signature=%s' % (
+            self.image.url, expires, get_signature(self.image.file.name, expires))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_tampered(self):
+        url = self.image.get_signed_url()
+        self.assertEqual(self.client.get(url.replace(
+            'expires=%d' % get_expires(), 'expires=%d' % (get_expires() + 1))).status_code, 404)
+        # a signature is only valid for its path
+        other = sign_url(self.image.url, 'other.jpg')
+        self.assertEqual(self.client.get(other).status_code, 404)
+
+    def test_user_binding(self):
+        url = self.image.get_signed_url(user=self.superuser)
+        self.assertTrue('user=%s' % self.superuser.pk in url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.login(username='admin', password='secret')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_thumbnail(self):
+        template = Template(
+            '{% load thumbnail filer_tags %}'
+            '{% thumbnail image 32x32 crop as thumb %}{% filer_signed_url thumb %}')
+        url = template.render(Context({'image': self.image}))
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        # not valid as the signature of the original file
+        self.assertEqual(self.client.get(url.replace(
+            self.image.file.thumbnail_storage.base_url,
+            self.image.file.storage.base_url)).status_code, 404)
@@ -0,0 +1,132 @@
+#-*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.test import TestCase
+
+try:
+    from PIL import Image as PILImage
+    from PIL import ImageChops, ImageStat
+except ImportError:
+    import Image as PILImage
+    import ImageChops
+    import ImageStat
+
+from filer.management.commands.filer_benchmark_thumbnails import psnr
+from filer.models.imagemodels import Image
+from filer.tests.helpers import create_superuser, create_image
+from filer.thumbnail_processors import scale_and_crop_with_subject_location
+
+
+class MultipleThumbnailsTestCase(TestCase):
+
+    def setUp(self):
+        self.superuser = create_superuser()
+        self.img = create_image(size=(1600, 1200))
+        self.image_name = 'test_file.jpg'
+        self.filename = os.path.join(settings.FILE_UPLOAD_TEMP_DIR, self.image_name)
+        self.img.save(self.filename, 'JPEG')
+        with open(self.filename, 'rb') as f:
+            self.image = Image.objects.create(
+                owner=self.superuser, original_filename=self.image_name,
+                file=DjangoFile(f, name=self.image_name))
+
+    def tearDown(self):
+        os.remove(self.filename)
+        for img in Image.objects.all():
+            img.delete()
+
+    def test_get_many_thumbnails(self):
+        options = {
+            'large': {'size': (800, 0)},
+            'medium': {'size': (200, 200), 'crop': True},
+            'small': {'size': (32, 32), 'crop': True},
+        }
+        thumbnails = self.image.file.get_many_thumbnails(options)
+        self.assertEqual(sorted(thumbnails), ['large', 'medium', 'small'])
+        self.assertEqual(thumbnails['large'].image.size, (800, 600))
+        self.assertEqual(thumbnails['medium'].image.size, (200, 200))
+        self.assertEqual(thumbnails['small'].image.size, (32, 32))
+        for alias, thumbnail in thumbnails.items():
+            self.assertEqual(thumbnail.name, self.image.file.get_thumbnail(
+                options[alias], generate=False).name)
+        # all of them exist now
+        existing = self.image.file.get_many_thumbnails(options)
+        self.assertFalse(any(t._committed is False for t in existing.values()))
+
+    def test_errors_of_one_thumbnail(self):
+        options = {
+            'good': {'size': (32, 32), 'crop': True},
+            'bad': {'size': (32, 32), 'quality': 'best'},
+        }
+        errors = {}
+        thumbnails = self.image.file.get_many_thumbnails(options, errors=errors)
+        self.assertEqual(list(thumbnails), ['good'])
+        self.assertEqual(list(errors), ['bad'])
+        self.assertRaises(Exception, self.image.file.get_many_thumbnails,
+                          {'bad': options['bad']})
+
+    def test_jpeg_draft(self):
+        options = self.image.file.get_options({'size': (32, 32), 'crop': True})
+        image, source_size = self.image.file._get_source_image([('small', options)])
+        self.assertEqual(source_size, (1600, 1200))
+        # decoded at 1/8 scale, still larger than the thumbnail
+        self.assertEqual(image.size, (200, 150))
+
+    def test_subject_location(self):
+        self.image.subject_location = '360,1000'
+        options = self.image.file.get_options({
+            'size': (100, 60), 'crop': True,
+            'subject_location': self.image.subject_location})
+        thumbnail, = [t for a, t in self.image.file.generate_many_thumbnails(
+            [('thumbnail', options)])]
+        # the same as rendered from the full size image
+        expected = self.image.file.generate_thumbnail(options)
+        self.assertEqual(thumbnail.image.size, expected.image.size)
+        difference = ImageStat.Stat(ImageChops.difference(
+            thumbnail.image.convert('RGB'), expected.image.convert('RGB')))
+        self.assertTrue(max(difference.mean) < 5, difference.mean)
+
+    def test_icons(self):
+        icons = self.image.icons
+        self.assertEqual(sorted(icons), sorted(self.image.get_icon_thumbnail_options()))
+
+
+class FastScalingTestCase(TestCase):
+
+    def setUp(self):
+        data = BytesIO()
+        create_image(size=(1600, 1200)).save(data, 'JPEG')
+        self.data = data.getvalue()
+
+    def scale(self, **kwargs):
+        return scale_and_crop_with_subject_location(
+            PILImage.open(BytesIO(self.data)), **kwargs)
+
+    def test_fast_scaling(self):
+        for options in ({'size': (48, 48), 'crop': True},
+                        {'size': (200, 0)},
+                        {'size': (300, 300)}):
+            standard = self.scale(fast=False, **options)
+            fast = self.scale(fast=True, **options)
+            self.assertEqual(fast.size, standard.size)
+            value = psnr(standard, fast)
+            self.assertTrue(value is None or value > 30, (options, value))
+
+    def test_fast_scaling_subject_location(self):
+        options = {'size': (100, 60), 'crop': True, 'subject_location': '360,1000'}
+        standard = self.scale(fast=False, **options)
+        fast = self.scale(fast=True, **options)
+        self.assertEqual(fast.size, standard.size)
+        value = psnr(standard, fast)
+        self.assertTrue(value is None or value > 30, value)
+
+    def test_no_reduction_when_upscaling(self):
+        small = PILImage.open(BytesIO(self.data)).resize((40, 30))
+        thumbnail = scale_and_crop_with_subject_location(
+            small, (80, 60), upscale=True, fast=True)
+        self.assertEqual(thumbnail.size, (80, 60))
@@ -0,0 +1,89 @@
+#-*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
+from django.test import TestCase
+
+from filer import settings as filer_settings
+from filer.tests.helpers import SettingsOverride
+from filer.utils.transfer import transfer_file
+
+
+class MemoryStorage(Storage):
+    """
+    A storage that is not backed by the local filesystem.
+    """
+    def __init__(self):
+        self.files = {}
+
+    def _open(self, name, mode='rb'):
+        if name not in self.files:
+            raise IOError('%s does not exist' % name)
+        return ContentFile(self.files[name], name=name)
+
+    def _save(self, name, content):
+        self.files[name] = b''.join(content.chunks())
+        return name
+
+    def exists(self, name):
+        return name in self.files
+
+    def delete(self, name):
+        self.files.pop(name, None)
+
+    def size(self, name):
+        return len(self.files[name])
+
+
+def copy_within_memory(src_storage, src_name, dst_storage, dst_name):
+    if not (isinstance(src_storage, MemoryStorage) and
+            isinstance(dst_storage, MemoryStorage)):
+        return None
+    dst_storage.files[dst_name] = src_storage.files[src_name]
+    return dst_name
+
+
+class TransferFileTestCase(TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = FileSystemStorage(location=self.location)
+        self.name = self.storage.save('src/file.txt', ContentFile(b'content'))
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_copy_links_local_files(self):
+        dst_storage = FileSystemStorage(location=os.path.join(self.location, 'dst'))
+        name = transfer_file(self.storage, self.name, dst_storage, 'copy.txt')
+        self.assertEqual(name, 'copy.txt')
+        self.assertEqual(os.stat(self.storage.path(self.name)).st_ino,
+                         os.stat(dst_storage.path(name)).st_ino)
+        # an existing file is never overwritten
+        name = transfer_file(self.storage, self.name, dst_storage, 'copy.txt')
+        self.assertNotEqual(name, 'copy.txt')
+        self.assertTrue(dst_storage.exists(name))
+
+    def test_move_local_files(self):
+        name = transfer_file(self.storage, self.name, self.storage,
+                             'dst/file.txt', move=True)
+        self.assertFalse(self.storage.exists(self.name))
+        self.assertEqual(self.storage.open(name).read(), b'content')
+
+    def test_stream_to_remote_storage(self):
+        dst_storage = MemoryStorage()
+        name = transfer_file(self.storage, self.name, dst_storage,
+                             'file.txt', move=True)
+        self.assertEqual(dst_storage.files[name], b'content')
+        self.assertFalse(self.storage.exists(self.name))
+
+    def test_server_side_copy(self):
+        src_storage, dst_storage = MemoryStorage(), MemoryStorage()
+        src_storage.files['file.txt'] = b'content'
+        with SettingsOverride(filer_settings, FILER_SERVER_SIDE_COPY=
+                              'filer.tests.transfer.copy_within_memory'):
+            name = transfer_file(src_storage, 'file.txt', dst_storage, 'copy.txt')
+        self.assertEqual(dst_storage.files[name], b'content')
@@ -11,6 +11,7 @@ except ImportError:
         raise ImportError("The Python Imaging Library was not found.")
 from django.utils import six
 from easy_thumbnails import processors
+from filer import settings as filer_settings
 from filer.settings import FILER_SUBJECT_LOCATION_IMAGE_DEBUG, FILER_WHITESPACE_COLOR
 
 RE_SUBJECT_LOCATION = re.compile(r'^(\d+),(\d+)$')
@@ -30,8 +31,69 @@ def normalize_subject_location(subject_location):
     return False
 
 
+def get_scaled_size(source_size, size, crop=False, upscale=False, zoom=None,
+                    **kwargs):
+    """
+    Returns the size ``scale_and_crop`` (and
+    ``scale_and_crop_with_subject_location``) resize an image of
+    ``source_size`` to, before cropping it.
+    """
+    source_x, source_y = [float(v) for v in source_size]
+    target_x, target_y = [float(v) for v in size]
+    if crop or not target_x or not target_y:
+        scale = max(target_x / source_x, target_y / source_y)
+    else:
+        scale = min(target_x / source_x, target_y / source_y)
+    if zoom:
+        scale *= (100 + int(zoom)) / 100.0
+    if scale < 1.0 or (scale > 1.0 and upscale):
+        return (int(round(source_x * scale)), int(round(source_y * scale)))
+    return (int(source_x), int(source_y))
+
+
+def draft_image(im, size):
+    """
+    Lets PIL decode a JPEG that has not been loaded yet at a reduced scale
+    (1/2, 1/4 or 1/8), as long as the result stays at least
+    ``FILER_THUMBNAIL_REDUCING_GAP`` times larger than ``size``. Returns
+    the image.
+    """
+    if getattr(im, 'format', None) != 'JPEG' or getattr(im, 'im', None) is not None:
+        # not a JPEG, or already decoded
+        return im
+    gap = filer_settings.FILER_THUMBNAIL_REDUCING_GAP
+    draft_size = [int(v * gap) for v in size]
+    if min(draft_size) > 0:
+        im.draft(im.mode, tuple(draft_size))
+    return im
+
+
+def reduce_image(im, size):
+    """
+    Shrinks the image by an integer factor with a fast box filter, as long as
+    the result stays at least ``FILER_THUMBNAIL_REDUCING_GAP`` times larger
+    than ``size``. The final (high quality) resample to ``size`` then works on
+    far fewer pixels. Returns the image.
+    """
+    im = draft_image(im, size)
+    gap = filer_settings.FILER_THUMBNAIL_REDUCING_GAP
+    factor = int(min(float(im.size[0]) / max(size[0], 1),
+                     float(im.size[1]) / max(size[1], 1)) / gap)
+    if factor < 2:
+        return im
+    if hasattr(im, 'reduce'):
+        # Pillow >= 7
+        return im.reduce(factor)
+    box = getattr(Image, 'BOX', None)
+    if box is None:
+        # Pillow < 3.4 has no box filter
+        return im
+    return im.resize((im.size[0] // factor, im.size[1] // factor), resample=box)
+
+
 def scale_and_crop_with_subject_location(im, size, subject_location=False, zoom=None,
-                                         crop=False, upscale=False, **kwargs):
+                                         crop=False, upscale=False, fast=None,
+                                         **kwargs):
     """
     Like ``easy_thumbnails.processors.scale_and_crop``, but will use the
     coordinates in ``subject_location`` to make sure that that part of the
@@ -41,8 +103,22 @@ def scale_and_crop_with_subject_location(im, size, subject_location=False, zoom=
 
     ``crop`` needs to be set for this to work, but any special cropping
     parameters will be ignored.
+
+    If ``fast`` (defaults to ``FILER_THUMBNAIL_FAST_SCALING``) is set, large
+    images are first shrunk with ``reduce_image``.
     """
     subject_location = normalize_subject_location(subject_location)
+    if fast is None:
+        fast = filer_settings.FILER_THUMBNAIL_FAST_SCALING
+    if fast:
+        source_size = im.size
+        im = reduce_image(im, get_scaled_size(source_size, size, crop=crop,
+                                              upscale=upscale, zoom=zoom))
+        if subject_location and im.size != source_size:
+            # the subject location refers to the image before the reduction
+            subject_location = (
+                subject_location[0] * im.size[0] / float(source_size[0]),
+                subject_location[1] * im.size[1] / float(source_size[1]))
     if not (subject_location and crop):
         # use the normal scale_and_crop
         return processors.scale_and_crop(im, size, zoom=zoom, crop=crop,
@@ -3,6 +3,7 @@ from distutils.version import LooseVersion
 import sys
 
 import django
+from django.db import transaction
 from django.utils import six
 
 try:
@@ -64,3 +65,36 @@ def get_delete_permission(opts):
     except ImportError:
         return '%s.%s' % (opts.app_label,
                           opts.get_delete_permission())
+
+
+def atomic(using=None):
+    """
+    Returns ``transaction.atomic`` (Django >= 1.6) or else
+    ``transaction.commit_on_success``, as a context manager.
+    """
+    if hasattr(transaction, 'atomic'):
+        return transaction.atomic(using=using)
+    return transaction.commit_on_success(using=using)
+
+
+def on_commit(func, using=None):
+    """
+    Calls ``func`` once the current transaction is committed (right away
+    outside of transactions) with ``transaction.on_commit`` (Django >= 1.9).
+    Earlier versions have no commit hook, ``func`` is called right away.
+    """
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(func, using=using)
+    else:
+        func()
+
+
+def csv_row(row):
+    """
+    Returns the cells of a ``csv.writer`` row, encoded to utf-8 on python 2
+    (its csv module only writes byte strings).
+    """
+    if six.PY3:
+        return row
+    return [cell.encode('utf-8') if isinstance(cell, six.text_type) else cell
+            for cell in row]
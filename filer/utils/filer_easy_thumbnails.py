@@ -1,10 +1,26 @@
 #-*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from easy_thumbnails.files import Thumbnailer
+from io import BytesIO
 import os
 import re
+
+from django.core.files.base import ContentFile
+from easy_thumbnails import engine, utils
+from easy_thumbnails.conf import settings as easy_thumbnails_settings
+from easy_thumbnails.files import Thumbnailer, ThumbnailFile
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    try:
+        import Image as PILImage
+    except ImportError:
+        raise ImportError("The Python Imaging Library was not found.")
+
 from filer import settings as filer_settings
+from filer.thumbnail_processors import (get_scaled_size,
+                                        normalize_subject_location)
 
 # match the source filename using `__` as the seperator. ``opts_and_ext`` is non
 # greedy so it should match the last occurence of `__`.
@@ -71,6 +87,189 @@ class ThumbnailerNameMixin(object):
         return os.path.join(basedir, path, subdir, filename)
 
 
+class MultipleThumbnailsMixin(object):
+    """
+    Generates several thumbnails of the same source image while decoding it
+    only once.
+    """
+    def get_many_thumbnails(self, thumbnail_options, save=True, errors=None):
+        """
+        Like ``get_thumbnail``, but for a dictionary of thumbnail options
+        keyed by alias. Returns a dictionary of the (existing or newly
+        generated) ``ThumbnailFile`` objects keyed by alias.
+
+        ``errors`` is passed on to ``generate_many_thumbnails``.
+        """
+        thumbnails = {}
+        missing = []
+        for alias, options in thumbnail_options.items():
+            options = self.get_options(options)
+            if options.get('HIGH_RESOLUTION', self.thumbnail_high_resolution):
+                # high resolution variants are not handled by the pipeline
+                try:
+                    thumbnails[alias] = self.get_thumbnail(options, save=save)
+                except Exception as e:
+                    if errors is None:
+                        raise
+                    errors[alias] = e
+                continue
+            thumbnail = self.get_existing_thumbnail(options)
+            if thumbnail:
+                thumbnails[alias] = thumbnail
+            else:
+                missing.append((alias, options))
+        if missing:
+            for alias, thumbnail in self.generate_many_thumbnails(missing, errors):
+                if save:
+                    self.save_thumbnail(thumbnail)
+                thumbnails[alias] = thumbnail
+        return thumbnails
+
+    def generate_many_thumbnails(self, thumbnail_options, errors=None):
+        """
+        Generates an unsaved ``ThumbnailFile`` for every ``(alias, options)``
+        pair of ``thumbnail_options`` and yields them as ``(alias,
+        thumbnail)`` pairs.
+
+        If ``errors`` is a dictionary, the exception raised while generating a
+        thumbnail is stored in it by alias and the other thumbnails are still
+        generated; otherwise it is raised. Errors of the source image itself
+        are always raised.
+
+        The source image is decoded once, at the smallest JPEG draft scale
+        that is still large enough for all thumbnails. The thumbnails are
+        then rendered from the largest to the smallest, each one from an
+        intermediate image downscaled to twice its size (instead of from the
+        full image) whenever that is possible.
+        """
+        if not thumbnail_options:
+            return
+        image, source_size = self._get_source_image(thumbnail_options)
+        scaled_sizes = {}
+        for alias, options in thumbnail_options:
+            if options.get('autocrop'):
+                # the image is cropped before it is scaled, any resolution
+                # might be needed
+                scaled_sizes[alias] = source_size
+                continue
+            try:
+                scaled_sizes[alias] = get_scaled_size(source_size, **options)
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[alias] = e
+        thumbnail_options = sorted(
+            [item for item in thumbnail_options if item[0] in scaled_sizes],
+            key=lambda item: scaled_sizes[item[0]][0] * scaled_sizes[item[0]][1],
+            reverse=True)
+
+        for alias, options in thumbnail_options:
+            scaled_x, scaled_y = scaled_sizes[alias]
+            image_x, image_y = image.size
+            if image_x >= scaled_x * 4 and image_y >= scaled_y * 4:
+                # downscale the intermediate image, for this and all the
+                # (smaller) following thumbnails
+                factor = max(2.0 * scaled_x / image_x, 2.0 * scaled_y / image_y)
+                image = image.resize((int(round(image_x * factor)),
+                                      int(round(image_y * factor))),
+                                     resample=PILImage.ANTIALIAS)
+            try:
+                thumbnail = self._render_thumbnail(image, source_size, options)
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[alias] = e
+                continue
+            yield alias, thumbnail
+
+    def _get_source_image(self, thumbnail_options):
+        """
+        Returns the decoded source image and the size it has before any draft
+        mode reduction.
+        """
+        if (self.source_generators is not None or
+                tuple(easy_thumbnails_settings.THUMBNAIL_SOURCE_GENERATORS) !=
+                ('easy_thumbnails.source_generators.pil_image',)):
+            # custom source generators, let them decode the image
+            image = engine.generate_source_image(
+                self, {}, self.source_generators, fail_silently=False)
+            if image is None:
+                raise ValueError("The source file does not appear to be an image")
+            return image, image.size
+
+        # Like ``easy_thumbnails.source_generators.pil_image``, but draft
+        # JPEGs to the required size before decoding them.
+        was_closed = getattr(self, 'closed', False)
+        self.open()
+        self.seek(0)
+        try:
+            image = PILImage.open(BytesIO(self.read()))
+        finally:
+            if was_closed:
+                self.close()
+        transposed = exif_orientation_transposes(image)
+        source_size = image.size
+        if transposed:
+            source_size = (source_size[1], source_size[0])
+        if image.format == 'JPEG':
+            draft_x, draft_y = 0, 0
+            for alias, options in thumbnail_options:
+                if options.get('autocrop'):
+                    draft_x, draft_y = source_size
+                    break
+                scaled_x, scaled_y = get_scaled_size(source_size, **options)
+                draft_x, draft_y = max(draft_x, scaled_x), max(draft_y, scaled_y)
+            if transposed:
+                draft_x, draft_y = draft_y, draft_x
+            image.draft(image.mode, (draft_x, draft_y))
+        try:
+            # An "Image file truncated" exception can occur for some images
+            # that are still mostly valid
+            image.load()
+        except IOError:
+            pass
+        image.load()
+        return utils.exif_orientation(image), source_size
+
+    def _render_thumbnail(self, image, source_size, options):
+        processor_options = dict(options)
+        subject_location = normalize_subject_location(
+            options.get('subject_location'))
+        if subject_location and image.size != tuple(source_size):
+            # the subject location refers to the full size source image
+            processor_options['subject_location'] = '%d,%d' % (
+                subject_location[0] * image.size[0] / source_size[0],
+                subject_location[1] * image.size[1] / source_size[1])
+        if filer_settings.FILER_SUBJECT_LOCATION_IMAGE_DEBUG:
+            # the debug marker is drawn onto the image
+            image = image.copy()
+        thumbnail_image = engine.process_image(image, processor_options,
+                                               self.thumbnail_processors)
+        filename = self.get_thumbnail_name(
+            options, transparent=utils.is_transparent(thumbnail_image))
+        data = engine.save_image(
+            thumbnail_image, filename=filename, quality=options['quality'],
+            subsampling=options['subsampling']).read()
+        thumbnail = ThumbnailFile(
+            filename, file=ContentFile(data), storage=self.thumbnail_storage,
+            thumbnail_options=options)
+        thumbnail.image = thumbnail_image
+        thumbnail._committed = False
+        return thumbnail
+
+
+def exif_orientation_transposes(image):
+    """
+    Returns True if ``easy_thumbnails.utils.exif_orientation`` swaps the width
+    and the height of the image.
+    """
+    try:
+        exif = image._getexif()
+    except Exception:
+        exif = None
+    return bool(exif) and exif.get(0x0112) in (5, 6, 7, 8)
+
+
 class ActionThumbnailerMixin(object):
     thumbnail_basedir = ''
     thumbnail_subdir = ''
@@ -93,7 +292,7 @@ class ActionThumbnailerMixin(object):
         return False
 
 
-class FilerThumbnailer(ThumbnailerNameMixin, Thumbnailer):
+class FilerThumbnailer(MultipleThumbnailsMixin, ThumbnailerNameMixin, Thumbnailer):
     def __init__(self, *args, **kwargs):
         self.thumbnail_basedir = kwargs.pop('thumbnail_basedir', '')
         super(FilerThumbnailer, self).__init__(*args, **kwargs)
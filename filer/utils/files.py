@@ -7,12 +7,18 @@ from django.template.defaultfilters import slugify as slugify_django
 from django.http.multipartparser import ChunkIter, exhaust, \
     StopFutureHandlers, SkipFile, StopUpload
 from unidecode import unidecode
+from filer.utils.ingest import FileIngest, ingest_file
 
 class UploadException(Exception):
     pass
 
 
 def handle_upload(request):
+    """
+    Returns a ``(upload, filename, is_raw)`` tuple. The sha1, size and image
+    data of the upload are computed while it is received and made available as
+    ``upload.filer_ingest`` (see ``filer.utils.ingest``).
+    """
     if not request.method == "POST":
         raise UploadException("AJAX request not valid: must be POST")
     if request.is_ajax():
@@ -45,6 +51,7 @@ def handle_upload(request):
 
         stream = ChunkIter(request, chunk_size)
         counters = [0] * len(upload_handlers)
+        ingest = FileIngest()
 
         try:
             for handler in upload_handlers:
@@ -55,6 +62,7 @@ def handle_upload(request):
                     break
 
             for chunk in stream:
+                ingest.feed(chunk)
                 for i, handler in enumerate(upload_handlers):
                     chunk_length = len(chunk)
                     chunk = handler.receive_data_chunk(chunk,
@@ -85,6 +93,7 @@ def handle_upload(request):
             if file_obj:
                 upload = file_obj
                 break
+        upload.filer_ingest = ingest.finish()
     else:
         if len(request.FILES) == 1:
             # FILES is a dictionary in Django but Ajax Upload gives the uploaded file an
@@ -93,8 +102,15 @@ def handle_upload(request):
             # each upload is a separate request so FILES should only have one entry.
             # Thus, we can just grab the first (and only) value in the dict.
             is_raw = False
-            upload = list(request.FILES.values())[0]
+            field_name, upload = list(request.FILES.items())[0]
             filename = upload.name
+            ingests = getattr(request, 'filer_ingests', {})
+            if field_name in ingests:
+                upload.filer_ingest = ingests[field_name]
+            else:
+                # the upload is already stored locally by django, reading it
+                # once more is cheap compared to reading it from the storage
+                upload.filer_ingest = ingest_file(upload)
         else:
             raise UploadException("AJAX request not valid: Bad Upload")
     return upload, filename, is_raw
@@ -21,11 +21,30 @@ def randomized(instance, filename):
             get_valid_filename(filename))
 
 
+def content_addressed(instance, filename):
+    """
+    Generates a path derived from the sha1 of the file content like
+    ``1d/a5/1da50fee5003a4a1a191b547125053a8c3f2b9e1.jpg``, so that files with
+    the same content are stored only once and share the same path.
+    Falls back to ``randomized`` if the checksum is not known.
+    """
+    sha1 = getattr(instance, 'sha1', None)
+    if not sha1:
+        return randomized(instance, filename)
+    ext = os.path.splitext(get_valid_filename(filename))[1]
+    return os.path.join(sha1[0:2], sha1[2:4], sha1 + ext)
+content_addressed.content_addressed = True
+
+
 class prefixed_factory(object):
     def __init__(self, upload_to, prefix):
         self.upload_to = upload_to
         self.prefix = prefix
 
+    @property
+    def content_addressed(self):
+        return getattr(self.upload_to, 'content_addressed', False)
+
     def __call__(self, instance, filename):
         if callable(self.upload_to):
             upload_to_str = self.upload_to(instance, filename)
@@ -0,0 +1,123 @@
+#-*- coding: utf-8 -*-
+"""
+Checksum computation for stored files.
+
+``hash_file`` computes one or more digests of a file in a single pass without
+ever holding more than ``FILER_HASH_BUFFER_SIZE`` bytes of it in memory.
+Files that are backed by a real file descriptor (e.g. files of a
+``FileSystemStorage`` or temporary uploads) are memory mapped and hashed
+without copying their content at all.
+"""
+import hashlib
+import mmap
+import os
+
+from filer import settings as filer_settings
+
+try:
+    memoryview = memoryview
+except NameError:
+    # python 2.6
+    memoryview = None
+
+
+class MultiHash(object):
+    """
+    Feeds the same data to several hashlib algorithms.
+    """
+    def __init__(self, algorithms=('sha1',)):
+        self.algorithms = tuple(algorithms)
+        self.hashes = [hashlib.new(algorithm) for algorithm in self.algorithms]
+
+    def update(self, data):
+        for h in self.hashes:
+            h.update(data)
+
+    def hexdigests(self):
+        return dict((algorithm, h.hexdigest())
+                    for algorithm, h in zip(self.algorithms, self.hashes))
+
+
+def _hash_mmap(file_obj, multi_hash, buffer_size):
+    """
+    Hashes the file through a read only memory map of its file descriptor.
+    Returns False if the file can not be mapped.
+    """
+    if memoryview is None:
+        return False
+    try:
+        fileno = file_obj.fileno()
+        size = os.fstat(fileno).st_size
+    except Exception:
+        return False
+    if not size:
+        # empty files can not be mapped (and there is nothing to hash)
+        return True
+    try:
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+        return False
+    try:
+        try:
+            view = memoryview(mapped)
+        except TypeError:
+            # python 2 mmaps do not support the buffer protocol
+            return False
+        try:
+            # Hash window by window, so that all the algorithms see the same
+            # pages while they are still in the cpu cache.
+            for offset in range(0, size, buffer_size):
+                multi_hash.update(view[offset:offset + buffer_size])
+        finally:
+            # python < 3.2 views can not be released
+            if hasattr(view, 'release'):
+                view.release()
+    finally:
+        mapped.close()
+    return True
+
+
+def _hash_stream(file_obj, multi_hash, buffer_size):
+    """
+    Hashes the file by reading it into one reused buffer.
+    """
+    # django's File proxies readinto, which raises an AttributeError if the
+    # wrapped file object does not support it
+    readinto = getattr(file_obj, 'readinto', None)
+    if readinto is not None and memoryview is not None:
+        buf = bytearray(buffer_size)
+        view = memoryview(buf)
+        while True:
+            length = readinto(buf)
+            if not length:
+                return
+            multi_hash.update(view[:length])
+    while True:
+        data = file_obj.read(buffer_size)
+        if not data:
+            return
+        multi_hash.update(data)
+
+
+def hash_file(file_obj, algorithms=('sha1',), buffer_size=None,
+              use_mmap=None):
+    """
+    Returns a dictionary mapping each of the hashlib ``algorithms`` to the
+    hex digest of the whole content of ``file_obj``. The file is rewound
+    before and after hashing.
+    """
+    if buffer_size is None:
+        buffer_size = filer_settings.FILER_HASH_BUFFER_SIZE
+    if use_mmap is None:
+        use_mmap = filer_settings.FILER_HASH_USE_MMAP
+    multi_hash = MultiHash(algorithms)
+    file_obj.seek(0)
+    if not (use_mmap and _hash_mmap(file_obj, multi_hash, buffer_size)):
+        _hash_stream(file_obj, multi_hash, buffer_size)
+    # to make sure later operations can read the whole file
+    file_obj.seek(0)
+    return multi_hash.hexdigests()
+
+
+def sha1_file(file_obj, **kwargs):
+    return hash_file(file_obj, algorithms=('sha1',), **kwargs)['sha1']
@@ -0,0 +1,144 @@
+#-*- coding: utf-8 -*-
+"""
+Single pass probing of uploaded files.
+
+``FileIngest`` is fed with the chunks of an upload while they stream in and
+collects everything ``File.save()`` and friends would otherwise read back from
+the storage: the sha1 checksum, the byte size and, for images, the dimensions
+and the exif data. The collected values are handed over to the model instance
+with ``FileIngest.apply()``.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.files.uploadhandler import FileUploadHandler
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    try:
+        import Image as PILImage
+    except ImportError:
+        raise ImportError("The Python Imaging Library was not found.")
+
+from filer.utils.pil_exif import get_exif
+
+
+# Image headers (including the exif block of jpegs) are expected to be found
+# within the first bytes of a file. Stop trying to identify an image once
+# that much data has been buffered.
+IMAGE_PROBE_LIMIT = 256 * 1024
+
+
+class FileIngest(object):
+    """
+    Consumes the chunks of a file and computes its checksum, size and (if the
+    file looks like an image) dimensions and exif data in the same pass.
+    """
+    def __init__(self, probe_image=True):
+        self._sha1 = hashlib.sha1()
+        self._header = BytesIO() if probe_image else None
+        self.size = 0
+        self.sha1 = None
+        self.width = None
+        self.height = None
+        self.exif = None
+        self.finished = False
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+        self._sha1.update(chunk)
+        self.size += len(chunk)
+        if self._header is not None:
+            self._probe_image(chunk)
+
+    def _probe_image(self, chunk):
+        self._header.write(chunk[:IMAGE_PROBE_LIMIT - self._header.tell()])
+        self._header.seek(0)
+        try:
+            image = PILImage.open(self._header)
+            self.width, self.height = image.size
+            self.exif = get_exif(image)
+        except Exception:
+            # not enough data (yet) or not an image at all
+            self._header.seek(0, 2)
+            if self._header.tell() >= IMAGE_PROBE_LIMIT:
+                self._header = None
+            return
+        # we got what we came for, the rest of the data is not needed
+        self._header = None
+
+    def finish(self):
+        self.sha1 = self._sha1.hexdigest()
+        self._header = None
+        self.finished = True
+        return self
+
+    @property
+    def is_image(self):
+        return self.width is not None
+
+    def apply(self, file_obj):
+        """
+        Hand the precomputed values over to a ``File`` instance, so that its
+        ``save()`` does not need to read the file again.
+        """
+        if not self.finished:
+            self.finish()
+        file_obj._file_size = self.size
+        file_obj.sha1 = self.sha1
+        if self.is_image and hasattr(file_obj, '_width'):
+            file_obj._width, file_obj._height = self.width, self.height
+            file_obj._exif_cache = self.exif or {}
+        file_obj._ingested = True
+        return file_obj
+
+
+def ingest_file(file_obj, probe_image=True):
+    """
+    Feeds a (local) django ``File`` like object, e.g. an ``UploadedFile``,
+    through a ``FileIngest``.
+    """
+    ingest = FileIngest(probe_image=probe_image)
+    file_obj.seek(0)
+    for chunk in file_obj.chunks():
+        ingest.feed(chunk)
+    file_obj.seek(0)
+    return ingest.finish()
+
+
+class IngestUploadHandler(FileUploadHandler):
+    """
+    Upload handler that runs multipart file uploads through a ``FileIngest``
+    while django parses the request. It never stores any data itself, so it
+    has to be combined with the default handlers::
+
+        FILE_UPLOAD_HANDLERS = (
+            'filer.utils.ingest.IngestUploadHandler',
+            'django.core.files.uploadhandler.MemoryFileUploadHandler',
+            'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+        )
+
+    The results end up in ``request.filer_ingests``, keyed by field name, where
+    ``filer.utils.files.handle_upload`` picks them up. Raw (ajax) uploads are
+    ingested by ``handle_upload`` itself.
+    """
+    def new_file(self, field_name, *args, **kwargs):
+        super(IngestUploadHandler, self).new_file(field_name, *args, **kwargs)
+        if field_name is None:
+            self.ingest = None
+        else:
+            self.ingest = FileIngest()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.ingest is not None:
+            self.ingest.feed(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.ingest is not None and self.request is not None:
+            if not hasattr(self.request, 'filer_ingests'):
+                self.request.filer_ingests = {}
+            self.request.filer_ingests[self.field_name] = self.ingest.finish()
+        return None
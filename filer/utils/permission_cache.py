@@ -0,0 +1,148 @@
+#-*- coding: utf-8 -*-
+"""
+A cache of the compiled folder permissions of the users, shared by all the
+processes through the configured django cache.
+
+The entries are keyed by the user and a permission version, which changes
+whenever the folder permissions, the folder tree or the group memberships
+change. Outdated entries are never used, they simply expire. A small LRU cache
+in each process saves the round trip to the cache backend for the most
+active users, and each process only checks the version again after
+``FILER_PERMISSION_VERSION_TTL`` seconds.
+"""
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from filer import settings as filer_settings
+from filer.utils.compatibility import on_commit
+
+try:
+    from collections import OrderedDict
+except ImportError:  # python 2.6
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+VERSION_KEY = 'filer:permissions:version'
+
+
+class LRUCache(object):
+    """
+    A thread safe dictionary keeping the ``max_size`` most recently used
+    entries.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return default
+            self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                del self.entries[next(iter(self.entries))]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+local_cache = LRUCache(filer_settings.FILER_PERMISSION_LOCAL_CACHE_SIZE)
+
+_stats = {'local_hits': 0, 'hits': 0, 'misses': 0}
+
+
+def get_stats():
+    """
+    Returns the number of lookups answered by the local cache
+    (``local_hits``), the django cache (``hits``) and by compiling the
+    permissions (``misses``) since the process started.
+    """
+    return dict(_stats)
+
+
+def reset_stats():
+    for key in _stats:
+        _stats[key] = 0
+
+
+# The version last read by this process, and until when it is used without
+# asking the cache backend again.
+_local_version = (None, 0)
+
+
+def remember_version(version):
+    global _local_version
+    _local_version = (version, time.time() + filer_settings.FILER_PERMISSION_VERSION_TTL)
+
+
+def get_version():
+    version, expires_at = _local_version
+    if version is not None and time.time() < expires_at:
+        return version
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A new random version rather than a counter starting over, so that
+        # the entries of an evicted version are not used again.
+        version = uuid.uuid4().hex
+        if not cache.add(VERSION_KEY, version):
+            version = cache.get(VERSION_KEY) or version
+    remember_version(version)
+    return version
+
+
+def set_new_version():
+    version = uuid.uuid4().hex
+    cache.set(VERSION_KEY, version)
+    remember_version(version)
+
+
+def bump_version():
+    """
+    Invalidates all the cached permissions, right away and again once the
+    current transaction is committed: until then other processes still read
+    the old data, and would cache it under the new version.
+    """
+    set_new_version()
+    on_commit(set_new_version)
+
+
+def get_permissions(user_id, name, compute):
+    """
+    Returns the cached permissions ``name`` of the user ``user_id``, calling
+    ``compute()`` to get them if they are not cached.
+    """
+    timeout = filer_settings.FILER_PERMISSION_CACHE_TIMEOUT
+    if not timeout:
+        _stats['misses'] += 1
+        return compute()
+    key = 'filer:permissions:%s:%s:%s' % (get_version(), user_id, name)
+    value = local_cache.get(key)
+    if value is not None:
+        _stats['local_hits'] += 1
+        return value
+    value = cache.get(key)
+    if value is None:
+        _stats['misses'] += 1
+        value = compute()
+        cache.set(key, value, timeout)
+    else:
+        _stats['hits'] += 1
+    local_cache.set(key, value)
+    return value
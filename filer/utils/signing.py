@@ -0,0 +1,83 @@
+#-*- coding: utf-8 -*-
+"""
+Signed, expiring URLs for files with permissions.
+
+Code that already checked that a user may see a private file (a view, a
+template, an API) can hand out a signed URL for it. The protected serve views
+check the signature and serve the file without any database query (and
+without checking the permissions again) until the URL expires::
+
+    url = sign_url(image.url, image.file.name)
+
+A signed URL can be bound to the user it was created for, it then only works
+in that user's session.
+"""
+import time
+
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import urlencode
+
+from filer import settings as filer_settings
+
+try:
+    from django.contrib.auth import SESSION_KEY
+except ImportError:
+    SESSION_KEY = '_auth_user_id'
+
+
+def get_expires(expires_in=None):
+    """
+    Returns the expiry timestamp of a URL valid for at least ``expires_in``
+    seconds (``FILER_SIGNED_URL_EXPIRES`` by default). It is rounded up, so
+    that URLs created for the same file in the meantime are identical and
+    browsers can cache them.
+    """
+    if expires_in is None:
+        expires_in = filer_settings.FILER_SIGNED_URL_EXPIRES
+    expires_in = max(int(expires_in), 1)
+    return (int(time.time()) // expires_in + 2) * expires_in
+
+
+def get_signature(path, expires, user_id=None, thumbnail=False):
+    key_salt = 'filer.thumbnail' if thumbnail else 'filer.file'
+    value = '%s:%s:%s' % (path, expires, user_id or '')
+    return salted_hmac(key_salt, value).hexdigest()
+
+
+def sign_url(url, path, expires_in=None, user=None, thumbnail=False):
+    """
+    Adds an expiry timestamp and a signature of the storage path ``path`` to
+    the private file (or ``thumbnail``) url ``url``. If ``user`` (a user or
+    its primary key) is given, the URL only works for that user.
+    """
+    params = [('expires', get_expires(expires_in))]
+    user_id = getattr(user, 'pk', user)
+    if user_id is not None:
+        params.append(('user', user_id))
+    params.append(('signature', get_signature(
+        path, params[0][1], user_id=user_id, thumbnail=thumbnail)))
+    return '%s%s%s' % (url, '&' if '?' in url else '?', urlencode(params))
+
+
+def check_signature(request, path, thumbnail=False):
+    """
+    Returns True if the request has a valid and current signature for
+    ``path``.
+    """
+    signature = request.GET.get('signature')
+    if not signature:
+        return False
+    try:
+        expires = int(request.GET.get('expires', ''))
+    except ValueError:
+        return False
+    if expires < time.time():
+        return False
+    user_id = request.GET.get('user') or None
+    if user_id is not None:
+        # compare with the session, loading the user would need a query
+        session = getattr(request, 'session', None)
+        if session is None or '%s' % session.get(SESSION_KEY) != user_id:
+            return False
+    return constant_time_compare(
+        signature, get_signature(path, expires, user_id=user_id, thumbnail=thumbnail))
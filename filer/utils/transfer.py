@@ -0,0 +1,96 @@
+#-*- coding: utf-8 -*-
+"""
+Copying and moving files between storages.
+
+``transfer_file`` tries, in that order:
+
+* to link (or rename) the file if both storages keep their files on the same
+  local filesystem, so that no data is copied at all,
+* the ``FILER_SERVER_SIDE_COPY`` hook, which lets backends like S3 copy the
+  file on the server side,
+* to stream the file from one storage to the other in small chunks.
+"""
+import errno
+import os
+
+from filer import settings as filer_settings
+from filer.utils.loader import load_object
+
+
+def _local_path(storage, name):
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        # not a local storage
+        return None
+
+
+def _link_file(src_storage, src_name, dst_storage, dst_name, move):
+    """
+    Hard links the file into the destination storage (and removes the source
+    file when moving). Returns the new name, or None if the file can not be
+    linked (remote storages, different filesystems, ...).
+    """
+    src_path = _local_path(src_storage, src_name)
+    if src_path is None or _local_path(dst_storage, dst_name) is None:
+        return None
+    try:
+        src_device = os.stat(src_path).st_dev
+        dst_directory = os.path.dirname(dst_storage.path(dst_name))
+        if not os.path.isdir(dst_directory):
+            os.makedirs(dst_directory)
+        if os.stat(dst_directory).st_dev != src_device:
+            return None
+    except OSError:
+        return None
+    while True:
+        name = dst_storage.get_available_name(dst_name)
+        try:
+            # Unlike os.rename, os.link never overwrites an existing file
+            os.link(src_path, dst_storage.path(name))
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                # the file was created in the meantime, find another name
+                continue
+            # e.g. the filesystem does not support hard links
+            return None
+        break
+    if move:
+        os.remove(src_path)
+    return name
+
+
+def _server_side_copy(src_storage, src_name, dst_storage, dst_name):
+    if not filer_settings.FILER_SERVER_SIDE_COPY:
+        return None
+    copy = load_object(filer_settings.FILER_SERVER_SIDE_COPY)
+    return copy(src_storage, src_name, dst_storage, dst_name)
+
+
+def _stream_file(src_storage, src_name, dst_storage, dst_name):
+    src_file = src_storage.open(src_name)
+    try:
+        # This is needed because most of the remote File Storage backend do
+        # not open the file.
+        src_file.open()
+        # Storages read the content chunk by chunk, it is never loaded into
+        # memory as a whole.
+        return dst_storage.save(dst_name, src_file)
+    finally:
+        src_file.close()
+
+
+def transfer_file(src_storage, src_name, dst_storage, dst_name, move=False):
+    """
+    Copies (or moves) the file ``src_name`` of ``src_storage`` to ``dst_name``
+    in ``dst_storage`` and returns the name it was actually saved as.
+    """
+    name = _link_file(src_storage, src_name, dst_storage, dst_name, move)
+    if name is not None:
+        return name
+    name = _server_side_copy(src_storage, src_name, dst_storage, dst_name)
+    if name is None:
+        name = _stream_file(src_storage, src_name, dst_storage, dst_name)
+    if move:
+        src_storage.delete(src_name)
+    return name